@@ -0,0 +1,298 @@
+"""End-to-end pipeline benchmark: ingest -> processor -> predictor -> /ws/trades.
+
+Trades (synthetic, or recorded ones from DuckDB/the Parquet lake) are driven through the
+real code of each stage, against the in-process ``MemoryBroker`` or a local redis-server:
+
+* ``ingest``: raw Binance frames through ``parse_message``/``normalize_trade`` and
+  ``write_redis_batch``, one call per micro-batch;
+* ``processor``: ``FeatureWorker.run_once`` over the trade stream, one call per batch;
+* ``predictor``: ``PriceDirectionPredictor.predict_batch`` over the published feature rows;
+* ``websocket``: trades XADDed at ``--ws-rate`` per second until each forecast reaches a
+  ``/ws/trades`` client (latency per trade, from XADD to receive).
+
+Each stage reports throughput (trades/s) and p50/p95/p99 latency in ms. Results can be
+saved as JSON (``--out``), compared with an earlier run (``--compare``), and checked
+against ``--budgets`` (default ``benchmarks/budgets.json``); the exit status is 1 when a
+budget is exceeded.
+
+    python3 -m benchmarks.bench_pipeline --trades 20000 --out bench.json [--redis-url redis://localhost:6379]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.bench_wire import make_trades
+from benchmarks.broker import MemoryBroker
+from ingest.wire import WIRE_FORMATS, decode_entry
+
+DEFAULT_BUDGETS = Path(__file__).with_name("budgets.json")
+STAGES = ("ingest", "processor", "predictor", "websocket")
+BENCH_SYMBOL = "benchusdt"  # streams trades:benchusdt / features:benchusdt, so live streams are never touched
+
+
+def stage_result(latencies_s: List[float], trades: int, seconds: float) -> Dict[str, float]:
+    """Throughput and latency percentiles of one stage (latencies are per call or per trade)."""
+    ms = np.asarray(latencies_s, dtype=float) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99]) if len(ms) else (0.0, 0.0, 0.0)
+    return {
+        "trades": trades,
+        "calls": len(ms),
+        "seconds": seconds,
+        "throughput": trades / seconds if seconds else 0.0,
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+    }
+
+
+def recorded_trades(n: int, symbol: str, db_path: Optional[Path] = None, lake_dir: Optional[Path] = None):
+    from processor.features import DEFAULT_DB_PATH, load_trades
+
+    frame = load_trades(symbol, db_path=db_path or DEFAULT_DB_PATH, lake_dir=lake_dir).head(n)
+    return [
+        {"trade_id": i, "ts": int(row.ts), "price": float(row.price), "qty": float(row.qty), "side": str(row.side)}
+        for i, row in enumerate(frame.itertuples(index=False))
+    ]
+
+
+def binance_frames(trades, symbol: str = BENCH_SYMBOL) -> List[str]:
+    """Trades as the combined-stream websocket delivers them."""
+    return [
+        json.dumps(
+            {
+                "stream": f"{symbol.lower()}@trade",
+                "data": {
+                    "e": "trade",
+                    "s": symbol.upper(),
+                    "t": trade["trade_id"],
+                    "T": trade["ts"],
+                    "p": str(trade["price"]),
+                    "q": str(trade["qty"]),
+                    "m": trade["side"] == "sell",
+                },
+            }
+        )
+        for trade in trades
+    ]
+
+
+def bench_ingest(client, frames: List[str], batch_size: int, wire: str) -> Dict[str, float]:
+    from ingest.ingest import parse_message, write_redis_batch
+
+    latencies = []
+    started = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        t0 = time.perf_counter()
+        write_redis_batch(client, [parse_message(frame) for frame in frames[i : i + batch_size]], wire)
+        latencies.append(time.perf_counter() - t0)
+    return stage_result(latencies, len(frames), time.perf_counter() - started)
+
+
+def bench_processor(client, trades: int, batch_size: int, wire: str, model_path: Path, symbol: str = BENCH_SYMBOL) -> Dict[str, float]:
+    from processor.processor import FeatureWorker
+
+    worker = FeatureWorker(
+        client,
+        [symbol],
+        group="bench",
+        consumer="bench",
+        model_path=model_path,
+        batch_size=batch_size,
+        block_ms=100,
+        claim_interval=float("inf"),
+        start_id="0",
+        wire=wire,
+    )
+    worker.ensure_groups()
+    latencies = []
+    started = time.perf_counter()
+    while worker.processed < trades:
+        t0 = time.perf_counter()
+        if not worker.run_once():
+            break
+        latencies.append(time.perf_counter() - t0)
+    return stage_result(latencies, worker.processed, time.perf_counter() - started)
+
+
+def bench_predictor(client, batch_size: int, model_path: Path, symbol: str = BENCH_SYMBOL) -> Dict[str, float]:
+    from processor.predictor import PriceDirectionPredictor
+
+    predictor = PriceDirectionPredictor(model_path)
+    rows = [row for _, entry in client.xrange(f"features:{symbol}") for row in decode_entry(entry)]
+    latencies = []
+    started = time.perf_counter()
+    for i in range(0, len(rows), batch_size):
+        t0 = time.perf_counter()
+        predictor.predict_batch(rows[i : i + batch_size])
+        latencies.append(time.perf_counter() - t0)
+    return stage_result(latencies, len(rows), time.perf_counter() - started)
+
+
+def bench_websocket(client, trades, rate: float, symbol: str = BENCH_SYMBOL, timeout: float = 10.0) -> Dict[str, float]:
+    """Forecast latency seen by a websocket client: XADD of a trade -> its payload received.
+
+    Probe trades (``ts`` 0) are sent until the first forecast arrives, so measurement starts
+    once the service's stream reader is live. Measured trades carry their sequence number
+    as ``ts``; payloads conflated away by the hub count as ``dropped``.
+    """
+    from fastapi.testclient import TestClient
+
+    import forecast.service as service
+
+    stream = service.TRADE_STREAM_PREFIX + symbol
+    client.delete(stream)
+    service.r = client
+    service.hubs.clear()
+    sent_at = [0.0] * len(trades)
+    live = threading.Event()
+
+    def produce():
+        deadline = time.monotonic() + timeout
+        while not live.wait(0.02):
+            if time.monotonic() > deadline:
+                return
+            client.xadd(stream, {"ts": 0, "price": trades[0]["price"], "qty": trades[0]["qty"], "side": "buy"})
+        interval = 1.0 / rate if rate else 0.0
+        start = time.perf_counter()
+        for i, trade in enumerate(trades):
+            delay = start + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            sent_at[i] = time.perf_counter()
+            client.xadd(stream, {"ts": i + 1, "price": trade["price"], "qty": trade["qty"], "side": trade["side"]})
+
+    latencies = []
+    producer = threading.Thread(target=produce, daemon=True)
+    with TestClient(service.app) as app_client:
+        with app_client.websocket_connect(f"/ws/trades?symbol={symbol}") as websocket:
+            producer.start()
+            websocket.receive_json()  # first probe: the reader is live
+            live.set()
+            started = time.perf_counter()
+            seq = 0
+            while seq < len(trades):
+                seq = websocket.receive_json()["ts"]
+                if seq:
+                    latencies.append(time.perf_counter() - sent_at[seq - 1])
+            seconds = time.perf_counter() - started
+    producer.join()
+    client.delete(stream)
+    result = stage_result(latencies, len(latencies), seconds)
+    result["dropped"] = len(trades) - len(latencies)
+    return result
+
+
+def check_budgets(results: Dict[str, Dict[str, float]], budgets: Dict[str, Dict[str, float]]) -> List[str]:
+    """Violations of ``{"stage": {"min_<metric>": x, "max_<metric>": y}}`` budgets."""
+    failures = []
+    for stage, limits in budgets.items():
+        if stage not in results:
+            continue
+        for limit, bound in limits.items():
+            kind, _, metric = limit.partition("_")
+            value = results[stage][metric]
+            if (kind == "min" and value < bound) or (kind == "max" and value > bound):
+                failures.append(f"{stage}.{metric} = {value:,.2f} breaks budget {limit} = {bound:,}")
+    return failures
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]]) -> List[str]:
+    lines = []
+    for stage, metrics in results.items():
+        old = baseline.get(stage)
+        if not old:
+            continue
+        changes = ", ".join(
+            f"{metric} {old[metric]:,.2f} -> {metrics[metric]:,.2f} ({(metrics[metric] / old[metric] - 1) * 100:+.1f}%)"
+            for metric in ("throughput", "p50_ms", "p95_ms", "p99_ms")
+            if old.get(metric)
+        )
+        lines.append(f"{stage:>10}: {changes}")
+    return lines
+
+
+def run(args) -> Dict[str, Dict[str, float]]:
+    if args.redis_url:
+        import redis
+
+        client = redis.Redis.from_url(args.redis_url, decode_responses=False)
+    else:
+        client = MemoryBroker()
+    if args.db or args.lake:
+        trades = recorded_trades(args.trades, args.symbol.upper(), args.db, args.lake)
+    else:
+        trades = make_trades(args.trades)
+    streams = (f"trades:{BENCH_SYMBOL}", f"features:{BENCH_SYMBOL}")
+    client.delete(*streams)
+
+    # the processor reads what ingest wrote and the predictor what the processor published
+    stages = set(args.stages or STAGES)
+    if "predictor" in stages:
+        stages.add("processor")
+    if "processor" in stages:
+        stages.add("ingest")
+    results = {}
+    try:
+        if "ingest" in stages:
+            results["ingest"] = bench_ingest(client, binance_frames(trades), args.batch_size, args.wire)
+        if "processor" in stages:
+            results["processor"] = bench_processor(client, len(trades), args.read_batch, args.wire, args.model)
+        if "predictor" in stages:
+            results["predictor"] = bench_predictor(client, args.read_batch, args.model)
+        if "websocket" in stages:
+            results["websocket"] = bench_websocket(client, trades[: args.ws_trades], args.ws_rate)
+    finally:
+        client.delete(*streams)
+    return results
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark ingest, processor, predictor and /ws/trades end to end")
+    parser.add_argument("--trades", type=int, default=20_000, help="Trades driven through ingest and the processor")
+    parser.add_argument("--symbol", default="btcusdt", help="Symbol of the recorded trades (--db/--lake)")
+    parser.add_argument("--db", type=Path, default=None, help="Replay recorded trades from this DuckDB store")
+    parser.add_argument("--lake", type=Path, default=None, help="Replay recorded trades from this Parquet lake")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=None, help="Stages to run (default all)")
+    parser.add_argument("--batch-size", type=int, default=500, help="Ingest micro-batch size")
+    parser.add_argument("--read-batch", type=int, default=100, help="Processor XREADGROUP count and predictor batch")
+    parser.add_argument("--wire", choices=WIRE_FORMATS, default="text", help="Stream entry format")
+    parser.add_argument("--model", type=Path, default=Path("storage/models/btcusdt_1min_h1.joblib"))
+    parser.add_argument("--ws-trades", type=int, default=2000, help="Trades sent through /ws/trades")
+    parser.add_argument("--ws-rate", type=float, default=1000.0, help="Trades/s XADDed during the websocket stage")
+    parser.add_argument("--redis-url", default=None, help="Use this redis-server instead of the in-process broker")
+    parser.add_argument("--out", type=Path, default=None, help="Save results as JSON")
+    parser.add_argument("--compare", type=Path, default=None, help="Earlier --out file to compare against")
+    parser.add_argument("--budgets", type=Path, default=DEFAULT_BUDGETS, help="JSON budgets; exit 1 when exceeded")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    results = run(args)
+    for stage, r in results.items():
+        print(
+            f"{stage:>10}: {r['trades']:>8,} trades | {r['throughput']:>12,.0f} trades/s"
+            f" | p50 {r['p50_ms']:7.3f} ms | p95 {r['p95_ms']:7.3f} ms | p99 {r['p99_ms']:7.3f} ms"
+        )
+    if args.compare:
+        for line in compare(results, json.loads(args.compare.read_text())["results"]):
+            print(line)
+    if args.out:
+        meta = {"trades": args.trades, "wire": args.wire, "broker": args.redis_url or "memory", "time": time.time()}
+        args.out.write_text(json.dumps({"meta": meta, "results": results}, indent=2))
+    failures = check_budgets(results, json.loads(args.budgets.read_text())) if args.budgets and args.budgets.exists() else []
+    for failure in failures:
+        print(f"❌ {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Compare the text and binary Redis stream payload formats (ingest/wire.py).
+
+Reports, per format, entries/sec and trades/sec for encoding and decoding and the
+payload bytes per trade (field names + values). With ``--redis-url`` the trades are also
+XADDed to a scratch stream, adding XADD throughput and Redis' ``MEMORY USAGE`` per trade.
+
+    python3 -m benchmarks.bench_wire --trades 200000 --pack 100 [--redis-url redis://localhost:6379]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import Dict, List
+
+from ingest.wire import BINARY_FIELD, decode_entry, pack_trades
+
+
+def make_trades(n: int, seed: int = 7) -> List[Dict[str, object]]:
+    rng = random.Random(seed)
+    price = 64000.0
+    trades = []
+    for i in range(n):
+        price = round(price + rng.gauss(0, 0.5), 2)
+        trades.append(
+            {
+                "trade_id": 3_200_000_000 + i,
+                "ts": 1_700_000_000_000 + i * 7,
+                "price": price,
+                "qty": round(rng.expovariate(20), 5),
+                "side": "buy" if rng.random() < 0.5 else "sell",
+            }
+        )
+    return trades
+
+
+def encode(trades, wire: str, pack: int) -> List[Dict[bytes, bytes]]:
+    """Entries as Redis stores them: byte strings, like a decode_responses=False read."""
+    if wire == "binary":
+        return [{BINARY_FIELD.encode(): pack_trades(trades[i : i + pack])} for i in range(0, len(trades), pack)]
+    return [{k.encode(): str(v).encode() for k, v in trade.items()} for trade in trades]
+
+
+def payload_bytes(entries) -> int:
+    return sum(len(k) + len(v) for entry in entries for k, v in entry.items())
+
+
+def bench_format(trades, wire: str, pack: int, client=None) -> Dict[str, float]:
+    started = time.perf_counter()
+    entries = encode(trades, wire, pack)
+    encode_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    decoded = sum(len(decode_entry(entry)) for entry in entries)
+    decode_s = time.perf_counter() - started
+    assert decoded == len(trades)
+
+    result = {
+        "entries": len(entries),
+        "encode_entries_s": len(entries) / encode_s,
+        "decode_entries_s": len(entries) / decode_s,
+        "decode_trades_s": len(trades) / decode_s,
+        "bytes_per_trade": payload_bytes(entries) / len(trades),
+    }
+    if client is not None:
+        stream = f"bench:wire:{wire}"
+        client.delete(stream)
+        started = time.perf_counter()
+        for i in range(0, len(entries), 500):
+            pipe = client.pipeline(transaction=False)
+            for entry in entries[i : i + 500]:
+                pipe.xadd(stream, entry)
+            pipe.execute()
+        xadd_s = time.perf_counter() - started
+        result["xadd_entries_s"] = len(entries) / xadd_s
+        result["xadd_trades_s"] = len(trades) / xadd_s
+        result["redis_bytes_per_trade"] = client.memory_usage(stream, samples=0) / len(trades)
+        client.delete(stream)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark text vs binary Redis stream payloads")
+    parser.add_argument("--trades", type=int, default=200_000, help="Number of synthetic trades")
+    parser.add_argument("--pack", type=int, default=100, help="Trades per binary entry")
+    parser.add_argument("--redis-url", default=None, help="Also measure XADD rate and memory on this Redis")
+    args = parser.parse_args()
+
+    client = None
+    if args.redis_url:
+        import redis
+
+        client = redis.Redis.from_url(args.redis_url, decode_responses=False)
+
+    trades = make_trades(args.trades)
+    print(f"{args.trades:,} trades, {args.pack} trades per binary entry")
+    for wire in ("text", "binary"):
+        result = bench_format(trades, wire, args.pack, client)
+        line = (
+            f"{wire:>6}: {result['entries']:>9,} entries | encode {result['encode_entries_s']:>12,.0f} entries/s"
+            f" | decode {result['decode_entries_s']:>12,.0f} entries/s ({result['decode_trades_s']:>11,.0f} trades/s)"
+            f" | {result['bytes_per_trade']:6.1f} payload B/trade"
+        )
+        if client is not None:
+            line += (
+                f" | XADD {result['xadd_trades_s']:>10,.0f} trades/s"
+                f" | {result['redis_bytes_per_trade']:6.1f} Redis B/trade"
+            )
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
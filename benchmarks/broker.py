@@ -0,0 +1,203 @@
+"""In-process stand-in for the Redis stream commands the pipeline uses.
+
+``MemoryBroker`` behaves like ``redis.Redis(decode_responses=False)`` for XADD, XREAD,
+XRANGE/XREVRANGE, XINFO, consumer groups (XGROUP CREATE, XREADGROUP, XACK, XAUTOCLAIM) and
+non-transactional pipelines: ids, stream names and field values come back as bytes and
+blocking reads wait on a condition variable, so the real ingest, processor and service
+code can run against it in one process without a redis-server.
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import redis
+
+Entry = Tuple[bytes, Dict[bytes, bytes]]
+
+
+def _bytes(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
+
+
+def _key(message_id) -> Tuple[int, int]:
+    ms, _, seq = _bytes(message_id).decode().lstrip("(").partition("-")
+    return int(ms), int(seq or 0)
+
+
+class BrokerPipeline:
+    def __init__(self, broker: "MemoryBroker"):
+        self.broker = broker
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    def execute(self):
+        calls, self.calls = self.calls, []
+        with self.broker.changed:
+            return [getattr(self.broker, name)(*args, **kwargs) for name, args, kwargs in calls]
+
+
+class MemoryBroker:
+    def __init__(self):
+        self.streams: Dict[str, List[Entry]] = {}
+        self.groups: Dict[Tuple[str, str], dict] = {}
+        self.changed = threading.Condition(threading.RLock())
+        self._last = (0, 0)
+
+    def _name(self, name) -> str:
+        return name.decode() if isinstance(name, bytes) else name
+
+    def _next_id(self) -> bytes:
+        ms = int(time.time() * 1000)
+        self._last = (ms, 0) if ms > self._last[0] else (self._last[0], self._last[1] + 1)
+        return f"{self._last[0]}-{self._last[1]}".encode()
+
+    def _after(self, name: str, message_id, count: Optional[int]) -> List[Entry]:
+        entries = self.streams.get(name, [])
+        start = bisect.bisect_right(entries, _key(message_id), key=lambda entry: _key(entry[0]))
+        return entries[start : start + count if count else None]
+
+    def _wait(self, read, block: Optional[int]):
+        deadline = None if block is None else time.monotonic() + block / 1000
+        with self.changed:
+            while True:
+                result = read()
+                if result or block is None:
+                    return result
+                remaining = None if block == 0 else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return result
+                self.changed.wait(remaining)
+
+    def pipeline(self, transaction: bool = True) -> BrokerPipeline:
+        return BrokerPipeline(self)
+
+    def xadd(self, name, fields, id="*", maxlen=None, approximate=True) -> bytes:
+        with self.changed:
+            message_id = self._next_id()
+            entries = self.streams.setdefault(self._name(name), [])
+            entries.append((message_id, {_bytes(k): _bytes(v) for k, v in fields.items()}))
+            if maxlen is not None and len(entries) > maxlen:
+                del entries[: len(entries) - maxlen]
+            self.changed.notify_all()
+            return message_id
+
+    def xlen(self, name) -> int:
+        return len(self.streams.get(self._name(name), []))
+
+    def delete(self, *names) -> int:
+        with self.changed:
+            return sum(self.streams.pop(self._name(name), None) is not None for name in names)
+
+    def xrange(self, name, min="-", max="+", count=None) -> List[Entry]:
+        with self.changed:
+            entries = self.streams.get(self._name(name), [])
+            first = 0 if min == "-" else bisect.bisect_left(entries, _key(min), key=lambda entry: _key(entry[0]))
+            if max == "+":
+                end = len(entries)
+            elif _bytes(max).startswith(b"("):
+                end = bisect.bisect_left(entries, _key(max), key=lambda entry: _key(entry[0]))
+            else:
+                end = bisect.bisect_right(entries, _key(max), key=lambda entry: _key(entry[0]))
+            if count and first + count < end:
+                end = first + count
+            return entries[first:end]
+
+    def xrevrange(self, name, max="+", min="-", count=None) -> List[Entry]:
+        entries = self.xrange(name, min, max)[::-1]
+        return entries[:count] if count else entries
+
+    def _tail(self, name: str) -> bytes:
+        entries = self.streams.get(name)
+        return entries[-1][0] if entries else b"0-0"
+
+    def xread(self, streams, count=None, block=None):
+        with self.changed:
+            # "$" means "after the newest entry at call time", fixed before blocking
+            positions = {
+                self._name(name): self._tail(self._name(name)) if _bytes(last) == b"$" else last
+                for name, last in streams.items()
+            }
+
+        def read():
+            batches = [(name.encode(), self._after(name, last, count)) for name, last in positions.items()]
+            return [[name, batch] for name, batch in batches if batch]
+
+        return self._wait(read, block)
+
+    def xinfo_stream(self, name) -> dict:
+        with self.changed:
+            name = self._name(name)
+            if name not in self.streams:
+                raise redis.ResponseError("ERR no such key")
+            return {"length": len(self.streams[name]), "last-generated-id": self._tail(name)}
+
+    def xinfo_groups(self, name) -> List[dict]:
+        with self.changed:
+            name = self._name(name)
+            return [
+                {"name": group.encode(), "last-delivered-id": state["last"], "pending": len(state["pending"]), "lag": None}
+                for (stream, group), state in self.groups.items()
+                if stream == name
+            ]
+
+    def xgroup_create(self, name, groupname, id="$", mkstream=False):
+        with self.changed:
+            name = self._name(name)
+            if (name, groupname) in self.groups:
+                raise redis.ResponseError("BUSYGROUP Consumer Group name already exists")
+            entries = self.streams.setdefault(name, [])
+            last = self._tail(name) if id == "$" else _bytes(id)
+            self.groups[(name, groupname)] = {"last": last, "pending": {}}
+            return True
+
+    def xreadgroup(self, groupname, consumername, streams, count=None, block=None, noack=False):
+        def read():
+            result = []
+            for name, start in streams.items():
+                name = self._name(name)
+                state = self.groups[(name, groupname)]
+                if _bytes(start) == b">":
+                    batch = self._after(name, state["last"], count)
+                    if batch:
+                        state["last"] = batch[-1][0]
+                    for message_id, _ in batch:
+                        state["pending"][message_id] = (consumername, time.monotonic())
+                else:  # this consumer's pending entries after ``start``
+                    batch = [
+                        entry for entry in self._after(name, start, None)
+                        if state["pending"].get(entry[0], ("",))[0] == consumername
+                    ][:count]
+                if batch:
+                    result.append([name.encode(), batch])
+            return result
+
+        return self._wait(read, block)
+
+    def xack(self, name, groupname, *ids) -> int:
+        with self.changed:
+            pending = self.groups[(self._name(name), groupname)]["pending"]
+            return sum(pending.pop(_bytes(message_id), None) is not None for message_id in ids)
+
+    def xautoclaim(self, name, groupname, consumername, min_idle_time, start_id="0-0", count=100):
+        with self.changed:
+            name = self._name(name)
+            pending = self.groups[(name, groupname)]["pending"]
+            now = time.monotonic()
+            claimed = []
+            for message_id, fields in self.streams.get(name, []):
+                owner = pending.get(message_id)
+                if owner and owner[0] != consumername and (now - owner[1]) * 1000 >= min_idle_time:
+                    pending[message_id] = (consumername, now)
+                    claimed.append((message_id, fields))
+            return [b"0-0", claimed[:count], []]
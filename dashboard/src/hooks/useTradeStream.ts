@@ -10,6 +10,28 @@ export interface TradeEvent {
 
 type ConnectionState = 'connecting' | 'open' | 'closed' | 'error';
 
+// first frame when the socket is opened with ?snapshot=N: the service's recent history as columns
+interface SnapshotFrame {
+  type: 'snapshot';
+  id: string[];
+  ts: number[];
+  price: number[];
+  qty: number[];
+  side: string[];
+}
+
+const fromSnapshot = (frame: SnapshotFrame): TradeEvent[] =>
+  frame.id.map((id, i) => ({
+    id,
+    ts: frame.ts[i],
+    price: frame.price[i],
+    qty: frame.qty[i],
+    side: frame.side[i] === 'buy' ? 'buy' : 'sell',
+  }));
+
+const withSnapshot = (endpoint: string, size: number) =>
+  `${endpoint}${endpoint.includes('?') ? '&' : '?'}snapshot=${size}`;
+
 interface UseTradeStreamOptions {
   bufferSize?: number;
   endpoint?: string;
@@ -46,7 +68,8 @@ export const useTradeStream = ({ bufferSize = DEFAULT_BUFFER, endpoint }: UseTra
 
   useEffect(() => {
     let isMounted = true;
-    const ws = new WebSocket(resolvedEndpoint);
+    // the recent history arrives as one snapshot frame instead of a stream replay
+    const ws = new WebSocket(withSnapshot(resolvedEndpoint, bufferSize));
     wsRef.current = ws;
 
     ws.onopen = () => {
@@ -59,6 +82,10 @@ export const useTradeStream = ({ bufferSize = DEFAULT_BUFFER, endpoint }: UseTra
       if (!isMounted) return;
       try {
         const payload = JSON.parse(event.data);
+        if (payload.type === 'snapshot') {
+          setTrades(fromSnapshot(payload as SnapshotFrame).slice(-bufferSize));
+          return;
+        }
         const idValue: string = payload.id ?? `${payload.ts}-${payload.qty}-${payload.price}-${Date.now()}`;
         const tsValue = Number(payload.ts ?? payload.T);
         const priceValue = Number(payload.price ?? payload.p);
@@ -0,0 +1,140 @@
+"""Websocket frames for one hub read, serialized once and shared by every subscriber.
+
+A ``Batch`` holds the payloads built from one XREAD and caches each encoding the first
+time a subscriber asks for it:
+
+* ``texts()``: one JSON object per payload (``event`` delivery, the backfill buffer);
+* ``frame("json")``: the whole batch as one JSON array (``batch`` delivery);
+* ``frame("binary")``: the whole batch as one packed columnar frame;
+* ``latest(fmt)``: only the newest payload, as a one-element array or frame (``conflate``).
+
+Binary frame layout (little endian), every numeric column 8-byte aligned so it can be
+viewed as a typed array in place::
+
+    u8 version, 3 pad bytes, u32 count
+    i64 ts[count]
+    f64 price[count], qty[count], ofi[count], prob_up[count], prob_down[count]
+    u8  side[count]                      0 buy, 1 sell
+    u32 byte length, then UTF-8 "predictor\\x1fid0\\x1fid1..."
+
+Trace stamps are not carried in binary frames; they are still observed server side.
+"""
+from __future__ import annotations
+
+import json
+import struct
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Union
+
+import numpy as np
+
+from forecast.history import Key, id_key
+
+FORMATS = ("json", "binary")
+FRAME_VERSION = 1
+
+_HEADER = struct.Struct("<B3xI")  # version, record count
+_STRINGS = struct.Struct("<I")  # byte length of the predictor + ids blob
+_SEP = "\x1f"
+_FLOATS = ("price", "qty", "ofi", "prob_up", "prob_down")
+
+Frame = Union[str, bytes]
+
+
+def pack_payloads(payloads: Sequence[Mapping[str, Any]]) -> bytes:
+    n = len(payloads)
+    floats = np.empty((len(_FLOATS), n), dtype="<f8")
+    for row, name in enumerate(_FLOATS):
+        floats[row] = [float(payload.get(name, 0.0)) for payload in payloads]
+    ts = np.fromiter((int(payload["ts"]) for payload in payloads), dtype="<i8", count=n)
+    side = np.fromiter((payload.get("side") != "buy" for payload in payloads), dtype=np.uint8, count=n)
+    predictor = str(payloads[-1].get("predictor", "")) if n else ""
+    strings = _SEP.join([predictor, *(str(payload["id"]) for payload in payloads)]).encode()
+    return b"".join(
+        [
+            _HEADER.pack(FRAME_VERSION, n),
+            ts.tobytes(),
+            floats.tobytes(),
+            side.tobytes(),
+            _STRINGS.pack(len(strings)),
+            strings,
+        ]
+    )
+
+
+def unpack_payloads(data: bytes) -> List[Dict[str, Any]]:
+    """Inverse of ``pack_payloads``, for Python clients and tests."""
+    version, n = _HEADER.unpack_from(data)
+    if version != FRAME_VERSION:
+        raise ValueError(f"Unsupported frame version {version}")
+    offset = _HEADER.size
+    ts = np.frombuffer(data, dtype="<i8", count=n, offset=offset)
+    offset += 8 * n
+    floats = np.frombuffer(data, dtype="<f8", count=len(_FLOATS) * n, offset=offset).reshape(len(_FLOATS), n)
+    offset += 8 * len(_FLOATS) * n
+    side = np.frombuffer(data, dtype=np.uint8, count=n, offset=offset)
+    offset += n
+    (length,) = _STRINGS.unpack_from(data, offset)
+    offset += _STRINGS.size
+    predictor, *ids = data[offset : offset + length].decode().split(_SEP)
+    columns = {name: floats[row].tolist() for row, name in enumerate(_FLOATS)}
+    return [
+        {
+            "id": ids[i],
+            "ts": int(ts[i]),
+            **{name: values[i] for name, values in columns.items()},
+            "side": "sell" if side[i] else "buy",
+            "predictor": predictor,
+        }
+        for i in range(n)
+    ]
+
+
+class Batch:
+    """Payloads from one read with their encodings, each computed at most once."""
+
+    def __init__(self, payloads: List[Dict[str, Any]], texts: Optional[List[str]] = None):
+        self.payloads = payloads
+        self._texts = texts
+        self._frames: Dict[str, Frame] = {}
+        self._latest: Dict[str, Frame] = {}
+
+    @classmethod
+    def from_texts(cls, texts: Sequence[str]) -> "Batch":
+        """A batch of already serialized payloads (the backfill buffer)."""
+        return cls([json.loads(text) for text in texts], list(texts))
+
+    def __len__(self) -> int:
+        return len(self.payloads)
+
+    def texts(self) -> List[str]:
+        if self._texts is None:
+            self._texts = [json.dumps(payload) for payload in self.payloads]
+        return self._texts
+
+    def frame(self, fmt: str) -> Frame:
+        encoded = self._frames.get(fmt)
+        if encoded is None:
+            if fmt == "binary":
+                encoded = pack_payloads(self.payloads)
+            else:
+                encoded = "[" + ",".join(self.texts()) + "]"
+            self._frames[fmt] = encoded
+        return encoded
+
+    def latest(self, fmt: str) -> Frame:
+        encoded = self._latest.get(fmt)
+        if encoded is None:
+            if fmt == "binary":
+                encoded = pack_payloads(self.payloads[-1:])
+            else:
+                encoded = "[" + self.texts()[-1] + "]" if self.payloads else "[]"
+            self._latest[fmt] = encoded
+        return encoded
+
+    def after(self, seen: Key) -> "Batch":
+        """The payloads with ids newer than ``seen`` (``self`` if all of them are)."""
+        keep = [i for i, payload in enumerate(self.payloads) if id_key(str(payload["id"])) > seen]
+        if len(keep) == len(self.payloads):
+            return self
+        texts = self._texts
+        return Batch([self.payloads[i] for i in keep], [texts[i] for i in keep] if texts is not None else None)
@@ -0,0 +1,107 @@
+"""Fixed-size, column-oriented history of recent forecast payloads for snapshots."""
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple, Union
+
+import numpy as np
+
+Key = Tuple[int, int, int]  # entry id ms, entry id seq, record index (-1 for single-record entries)
+
+
+def id_key(payload_id: Union[str, bytes]) -> Key:
+    """Ordering key of a payload or entry id: ``ms-seq`` or ``ms-seq.index`` (``ingest.wire.record_id``)."""
+    if isinstance(payload_id, bytes):
+        payload_id = payload_id.decode()
+    entry, _, index = payload_id.partition(".")
+    ms, _, seq = entry.partition("-")
+    return int(ms), int(seq or 0), int(index) if index else -1
+
+
+def format_id(key: Key) -> str:
+    ms, seq, index = key
+    return f"{ms}-{seq}" if index < 0 else f"{ms}-{seq}.{index}"
+
+
+class TradeHistory:
+    """Ring buffer of the last ``capacity`` payloads of one stream, one NumPy array per field.
+
+    Payloads must arrive in stream order; any that are not newer than the last one kept
+    (a hub re-reading its backlog after a restart) are skipped. ``snapshot`` copies the
+    requested window out in one slice per column. ``extend`` runs in worker threads, so
+    both take a lock.
+    """
+
+    def __init__(self, capacity: int = 10_000):
+        self.capacity = capacity
+        self.id = np.zeros((capacity, 3), dtype=np.int64)
+        self.ts = np.zeros(capacity, dtype=np.int64)
+        self.price = np.zeros(capacity, dtype=np.float64)
+        self.qty = np.zeros(capacity, dtype=np.float64)
+        self.buy = np.zeros(capacity, dtype=bool)
+        self.prob_up = np.zeros(capacity, dtype=np.float64)
+        self.size = 0
+        self.next = 0  # slot the next payload is written to
+        self.last: Optional[Key] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def read_after(self) -> str:
+        """XRANGE/XREVRANGE lower bound of the entries not kept yet ("(" makes it exclusive)."""
+        last = self.last
+        return "-" if last is None else f"({last[0]}-{last[1]}"
+
+    def extend(self, payloads: Iterable[Mapping[str, Any]]) -> int:
+        """Append payloads newer than the last one kept; returns how many were added."""
+        with self._lock:
+            return self._extend(payloads)
+
+    def _extend(self, payloads: Iterable[Mapping[str, Any]]) -> int:
+        added = 0
+        for payload in payloads:
+            key = id_key(str(payload["id"]))
+            if self.last is not None and key <= self.last:
+                continue
+            slot = self.next
+            self.id[slot] = key
+            self.ts[slot] = payload["ts"]
+            self.price[slot] = payload["price"]
+            self.qty[slot] = payload["qty"]
+            self.buy[slot] = payload.get("side") == "buy"
+            self.prob_up[slot] = payload.get("prob_up", 0.5)
+            self.next = (slot + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+            self.last = key
+            added += 1
+        return added
+
+    def _order(self) -> np.ndarray:
+        """Slots from oldest to newest."""
+        start = (self.next - self.size) % self.capacity
+        return (start + np.arange(self.size)) % self.capacity
+
+    def snapshot(self, last: Optional[int] = None, since_ts: Optional[int] = None) -> Dict[str, Any]:
+        """Columns of the newest ``last`` payloads and/or those with ``ts >= since_ts``, oldest first."""
+        with self._lock:
+            return self._snapshot(last, since_ts)
+
+    def _snapshot(self, last: Optional[int], since_ts: Optional[int]) -> Dict[str, Any]:
+        slots = self._order()
+        if since_ts is not None:
+            # ts can tie or step back slightly between records; the scan runs from the newest end
+            newer = self.ts[slots] >= since_ts
+            first = len(slots) - int(np.argmin(newer[::-1])) if not newer.all() else 0
+            slots = slots[first:]
+        if last is not None:
+            slots = slots[max(len(slots) - max(last, 0), 0) :]
+        return {
+            "count": int(len(slots)),
+            "id": [format_id(key) for key in map(tuple, self.id[slots].tolist())],
+            "ts": self.ts[slots].tolist(),
+            "price": self.price[slots].tolist(),
+            "qty": self.qty[slots].tolist(),
+            "side": np.where(self.buy[slots], "buy", "sell").tolist(),
+            "prob_up": self.prob_up[slots].tolist(),
+        }
@@ -0,0 +1,247 @@
+"""Single-reader fan-out of a Redis stream to many websocket subscribers."""
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from forecast.frames import Batch
+
+DELIVERY_MODES = ("event", "batch", "conflate")
+
+_CLOSED = object()  # queued to a subscriber to tell its sender loop to stop
+
+
+class Subscriber:
+    """Bounded per-client queue of serialized payloads (``event`` delivery) or of whole
+    ``Batch``es (``batch`` and ``conflate`` delivery).
+
+    When the client can't keep up the queue is conflated: the oldest pending item
+    is dropped to make room for the newest. With ``max_dropped`` set, a client that
+    has lost that many items is closed instead.
+    """
+
+    def __init__(self, maxsize: int, max_dropped: Optional[int] = None, mode: str = "event"):
+        if mode not in DELIVERY_MODES:
+            raise ValueError(f"mode must be one of {DELIVERY_MODES}, got {mode!r}")
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.max_dropped = max_dropped
+        self.mode = mode
+        self.dropped = 0
+        self.closed = False
+        self.pending_backfill = 0
+
+    def offer(self, item: Any) -> None:
+        if self.closed:
+            return
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except asyncio.QueueFull:
+                self.queue.get_nowait()
+                self.dropped += 1
+                if self.max_dropped is not None and self.dropped > self.max_dropped:
+                    self.close()
+                    return
+
+    def offer_batch(self, batch: Batch) -> None:
+        if self.mode == "event":
+            for text in batch.texts():
+                self.offer(text)
+        elif len(batch):
+            self.offer(batch)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        while True:
+            try:
+                self.queue.put_nowait(_CLOSED)
+                return
+            except asyncio.QueueFull:
+                self.queue.get_nowait()
+
+    async def get(self) -> Optional[Any]:
+        """Return the next payload, or ``None`` once the subscriber is closed."""
+        item = await self.queue.get()
+        return None if item is _CLOSED else item
+
+
+class StreamHub:
+    """Reads one Redis stream with a single background task and broadcasts each event.
+
+    ``build_payloads(messages)`` turns each XREAD batch of ``(message_id, fields)`` entries
+    into payloads in one call (this is where the predictor runs, vectorized over the batch)
+    and publishes them as one ``Batch``, whose encodings are shared by every subscriber.
+    A ``conflate`` subscriber's queue holds a single batch, replaced by each newer one. The reader
+    starts with the first subscriber, at the live tail of the stream, and stops when the
+    last one leaves. The most recent ``backlog`` payloads are kept for backfill.
+
+    ``on_publish(batch)``, when given, is called once per published batch after it has
+    been handed to every subscriber queue, however many subscribers there are.
+
+    ``seed_after()``, when given, returns the exclusive XREVRANGE lower bound of entries
+    already consumed downstream (e.g. ``TradeHistory.read_after``). On (re)start the hub
+    then also builds the entries between that bound and the backfill tail, at most
+    ``seed_limit`` in all, so a restart leaves no hole in what ``build_payloads`` has seen.
+    Reads and ``build_payloads`` run in a worker thread, off the event loop.
+
+    A failed read (Redis down, a payload that can't be built) is logged and retried from
+    ``last_id`` with exponential backoff. After ``max_retries`` failures in a row every
+    subscriber is closed, so their websockets close and clients can reconnect.
+    """
+
+    def __init__(
+        self,
+        client,
+        stream: str,
+        build_payloads: Callable[[List[Tuple[str, Dict[str, str]]]], List[Dict[str, Any]]],
+        block_ms: int = 1000,
+        count: int = 100,
+        backlog: int = 500,
+        queue_size: int = 256,
+        max_dropped: Optional[int] = None,
+        retry_delay: float = 0.5,
+        max_retries: int = 5,
+        on_publish: Optional[Callable[[Batch], None]] = None,
+        seed_after: Optional[Callable[[], str]] = None,
+        seed_limit: Optional[int] = None,
+    ):
+        self.client = client
+        self.stream = stream
+        self.build_payloads = build_payloads
+        self.block_ms = block_ms
+        self.count = count
+        self.queue_size = queue_size
+        self.max_dropped = max_dropped
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self.on_publish = on_publish
+        self.seed_after = seed_after
+        self.seed_limit = seed_limit
+        self.recent: Deque[str] = deque(maxlen=backlog)
+        self.subscribers: Set[Subscriber] = set()
+        self.last_id: Optional[str] = None  # id of the last entry read, for lag reporting
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, backfill: int = 0, mode: str = "event") -> Subscriber:
+        if mode == "conflate":
+            subscriber = Subscriber(1, None, mode)  # only the newest batch matters, nothing is lost
+        else:
+            subscriber = Subscriber(self.queue_size, self.max_dropped, mode)
+        subscriber.pending_backfill = min(max(backfill, 0), self.queue_size)
+        self.subscribers.add(subscriber)
+        if self._task is None or self._task.done():
+            # the backfill buffer is refreshed from Redis before the reader starts
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        else:
+            self._backfill(subscriber)
+        return subscriber
+
+    def _backfill(self, subscriber: Subscriber) -> None:
+        if subscriber.pending_backfill and self.recent:
+            texts = list(self.recent)[-subscriber.pending_backfill:]
+            if subscriber.mode == "event":
+                for text in texts:
+                    subscriber.offer(text)
+            else:
+                subscriber.offer(Batch.from_texts(texts))
+        subscriber.pending_backfill = 0
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscriber.close()
+        self.subscribers.discard(subscriber)
+        if not self.subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def publish(self, text: str) -> None:
+        self.recent.append(text)
+        for subscriber in list(self.subscribers):
+            subscriber.offer(text)
+            if subscriber.closed:
+                self.subscribers.discard(subscriber)
+
+    def publish_batch(self, batch: Batch) -> None:
+        self.recent.extend(batch.texts())
+        for subscriber in list(self.subscribers):
+            subscriber.offer_batch(batch)
+            if subscriber.closed:
+                self.subscribers.discard(subscriber)
+        if self.on_publish is not None:
+            self.on_publish(batch)
+
+    def _load_seed(self) -> Tuple[List[str], str]:
+        """Read and build the backfill tail plus any gap after ``seed_after()``; blocking."""
+        tail = self.client.xrevrange(self.stream, count=self.recent.maxlen) if self.recent.maxlen else []
+        tail = list(tail or [])
+        gap: List[Tuple[Any, Dict[Any, Any]]] = []
+        wanted = None if self.seed_limit is None else self.seed_limit - len(tail)
+        # a short tail already reaches the start of the stream
+        if self.seed_after is not None and (wanted is None or wanted > 0) and len(tail) == (self.recent.maxlen or 0):
+            oldest = tail[-1][0] if tail else None
+            if isinstance(oldest, bytes):
+                oldest = oldest.decode()
+            # "(" bounds are exclusive: neither the newest consumed entry nor the tail is read twice
+            upper = "+" if oldest is None else f"({oldest}"
+            gap = list(self.client.xrevrange(self.stream, upper, self.seed_after(), count=wanted) or [])
+        messages = list(reversed(tail + gap))
+        if not messages:
+            return [], "$"
+        return Batch(self.build_payloads(messages)).texts(), messages[-1][0]
+
+    async def _seed(self) -> str:
+        """Refill the backfill buffer from the stream tail; return the id to read after."""
+        self.recent.clear()
+        texts, last_id = await asyncio.to_thread(self._load_seed)
+        self.recent.extend(texts)
+        for subscriber in list(self.subscribers):
+            self._backfill(subscriber)
+        return last_id
+
+    async def _run(self) -> None:
+        seeded = False
+        failures = 0
+        while self.subscribers:
+            try:
+                if not seeded:
+                    self.last_id = await self._seed()
+                    seeded = True
+                await self._read_once()
+                failures = 0
+            except Exception as error:
+                failures += 1
+                if failures > self.max_retries:
+                    print(f"[forecast] {self.stream} reader failed {failures} times, closing subscribers: {error!r}")
+                    self._close_all()
+                    return
+                delay = self.retry_delay * 2 ** (failures - 1)
+                print(f"[forecast] {self.stream} read failed, retrying in {delay:.1f}s: {error!r}")
+                await asyncio.sleep(delay)
+
+    def _read_batches(self) -> List[Tuple[Any, Batch]]:
+        events = self.client.xread({self.stream: self.last_id}, block=self.block_ms, count=self.count)
+        batches = []
+        for _stream, messages in events or []:
+            batch = Batch(self.build_payloads(messages))
+            batch.texts()  # the backfill buffer always needs the JSON texts; encode them here too
+            batches.append((messages[-1][0], batch))
+        return batches
+
+    async def _read_once(self) -> None:
+        # redis-py is synchronous and build_payloads scores the batch: both run in a thread
+        # so the loop stays free for the websockets
+        batches = await asyncio.to_thread(self._read_batches)
+        if not batches:
+            await asyncio.sleep(0)
+            return
+        for last_id, batch in batches:
+            self.publish_batch(batch)
+            self.last_id = last_id
+
+    def _close_all(self) -> None:
+        for subscriber in list(self.subscribers):
+            subscriber.close()
+        self.subscribers.clear()
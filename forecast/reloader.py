@@ -0,0 +1,86 @@
+"""Hot reload of the forecast model without restarting the service."""
+from __future__ import annotations
+
+import asyncio
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from processor.predictor import ModelBundle, PriceDirectionPredictor, load_bundle
+from processor.streaming import engine_columns
+
+
+class ModelReloader:
+    """Loads a retrained bundle in a worker thread and swaps it into a live predictor.
+
+    ``watch`` polls the bundle file's mtime and size every ``interval`` seconds and
+    ``reload`` can be triggered directly (the service's admin endpoint). A new bundle is
+    rejected, and the current model kept serving, when it fails to load or when it needs
+    a feature column that nothing builds: neither the streaming feature engine (configured
+    from the bundle's own columns, as a restarted ``FeatureWorker`` would be) nor the
+    payloads the service scores (``served_columns``).
+    """
+
+    def __init__(
+        self,
+        predictor: PriceDirectionPredictor,
+        served_columns: Iterable[str] = (),
+        interval: float = 5.0,
+    ):
+        self.predictor = predictor
+        self.served_columns = frozenset(served_columns)
+        self.interval = interval
+        self.reloads = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self._stamp = self._file_stamp()  # the bundle loaded at startup counts as seen
+        self._lock = asyncio.Lock()
+
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.predictor.model_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def buildable_columns(self, feature_cols: Iterable[str]) -> Set[str]:
+        """Feature names available to a bundle trained on ``feature_cols``."""
+        return engine_columns(feature_cols) | self.served_columns
+
+    def load(self, path: Optional[Path] = None) -> ModelBundle:
+        """Load and validate a bundle (blocking)."""
+        bundle = load_bundle(path or self.predictor.model_path)
+        buildable = self.buildable_columns(bundle.feature_cols)
+        missing = [col for col in bundle.feature_cols if col not in buildable]
+        if missing:
+            raise ValueError(f"feature_cols built by neither the feature engine nor the served payloads: {', '.join(missing)}")
+        return bundle
+
+    async def reload(self) -> Dict[str, object]:
+        """Load the bundle off the event loop and swap it in; keep the old model on failure."""
+        async with self._lock:
+            self._stamp = self._file_stamp()
+            try:
+                bundle = await asyncio.to_thread(self.load)
+            except Exception as exc:  # a half-written or incompatible bundle must not take the service down
+                self.failures += 1
+                self.last_error = f"{type(exc).__name__}: {exc}"
+                print(f"[forecast] model reload failed, keeping {self.predictor.bundle.version}: {self.last_error}")
+            else:
+                self.predictor.swap(bundle)
+                self.reloads += 1
+                self.last_error = None
+                print(f"[forecast] model {bundle.version} loaded from {self.predictor.model_path}")
+            return self.status()
+
+    async def watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            stamp = await asyncio.to_thread(self._file_stamp)
+            if stamp is not None and stamp != self._stamp:
+                await self.reload()
+
+    def status(self) -> Dict[str, object]:
+        status = self.predictor.info()
+        status.update(reloads=self.reloads, failures=self.failures, last_error=self.last_error)
+        return status
@@ -1,58 +1,283 @@
-from fastapi import FastAPI, WebSocket
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response, WebSocket
 from starlette.websockets import WebSocketDisconnect
 import asyncio
-import redis
 import json
+import os
+import time
+import redis
 
+from forecast.frames import FORMATS
+from forecast.history import TradeHistory, id_key
+from forecast.hub import DELIVERY_MODES, StreamHub
+from forecast.reloader import ModelReloader
+from forecast.tracing import Tracer
+from ingest.trace import TRACE_FIELD, encode, id_us, now_us, parse
+from ingest.wire import decode_entry, record_id
+from observability import metrics
 from processor.predictor import PriceDirectionPredictor
 
-app = FastAPI()
-
-# connect to redis
-r = redis.Redis(host="localhost", port=6379, decode_responses=True)
+# connect to redis; raw bytes so packed binary trade entries can be read alongside text ones
+r = redis.Redis(host="localhost", port=6379, decode_responses=False)
 predictor = PriceDirectionPredictor()
+tracer = Tracer() # per-hop latency of trades sampled by ingest --trace-every
+
+TRADE_STREAM_PREFIX = "trades:" # one Redis stream per symbol, e.g. trades:btcusdt
+SERVED_COLUMNS = ("price", "qty", "ofi") # numeric fields of every scored payload; new models may use them
+DEFAULT_SYMBOL = "btcusdt"
+MODEL_WATCH_INTERVAL = float(os.environ.get("MODEL_WATCH_INTERVAL", "5")) # seconds; 0 = reload via the endpoint only
+HISTORY_SIZE = int(os.environ.get("HISTORY_SIZE", "10000")) # recent payloads kept per stream for snapshots
+hubs = {} # stream name -> StreamHub, created on the first subscriber
+histories = {} # stream name -> TradeHistory, filled by the stream's hub
+reloader = ModelReloader(predictor, SERVED_COLUMNS, interval=MODEL_WATCH_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app):
+  # picks up retrained bundles in storage/models/ while clients stay connected
+  watcher = asyncio.create_task(reloader.watch()) if MODEL_WATCH_INTERVAL > 0 else None
+  try:
+    yield
+  finally:
+    if watcher is not None:
+      watcher.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def build_payloads(messages):
+  """Turn one XREAD batch of trade entries into forecast payloads, scoring them in one call."""
+  trades = []
+  for message_id, entry in messages:
+    records = decode_entry(entry) # one record per text entry, many per packed binary entry
+    for index, fields in enumerate(records):
+      raw_qty = float(fields.get("qty", 0))
+      side = fields.get("side", "buy")
+      ofi = float(fields.get("ofi", 0))
+      if ofi == 0:
+        ofi = raw_qty if side == "buy" else -raw_qty
+      trade = {
+        "id": record_id(message_id, index, len(records)),
+        "ts": int(fields.get("ts", 0)),
+        "price": float(fields.get("price", 0)),
+        "qty": raw_qty,
+        "side": side,
+        "ofi": ofi,
+      }
+      if TRACE_FIELD in fields: # sampled trade: the entry id is its Redis append time
+        stages = parse(fields[TRACE_FIELD], trade["ts"])
+        stages.setdefault("redis", id_us(message_id))
+        trade[TRACE_FIELD] = encode(stages, trade["ts"])
+      trades.append(trade)
+
+  if not trades:
+    return []
+  started = time.perf_counter()
+  prob_up, prob_down, source = predictor.predict_batch(trades)
+  if metrics.ENABLED:
+    metrics.PREDICT_SECONDS.observe(time.perf_counter() - started)
+  for trade, up, down in zip(trades, prob_up.tolist(), prob_down.tolist()):
+    trade["prob_up"] = up
+    trade["prob_down"] = down
+    trade["predictor"] = source
+  return trades
+
+
+def get_history(stream):
+  history = histories.get(stream)
+  if history is None:
+    history = histories[stream] = TradeHistory(HISTORY_SIZE)
+  return history
+
+
+def trace_batch(batch):
+  # sampled trades: "send" is the hand-off to the subscriber queues, recorded once per trade
+  # however many clients receive it
+  sent_us = None
+  for payload in batch.payloads:
+    if TRACE_FIELD in payload:
+      sent_us = sent_us or now_us()
+      tracer.observe(payload, sent_us)
+
+
+def get_hub(stream):
+  # one reader per stream no matter how many clients are connected
+  hub = hubs.get(stream)
+  if hub is None:
+    history = get_history(stream)
+
+    def build_and_record(messages):
+      payloads = build_payloads(messages)
+      history.extend(payloads) # every payload the hub sees also lands in the snapshot buffer
+      return payloads
+
+    # a (re)started hub first catches the history up from its newest entry, as refresh_history does
+    hub = hubs[stream] = StreamHub(
+      r, stream, build_and_record, on_publish=trace_batch, seed_after=history.read_after, seed_limit=HISTORY_SIZE
+    )
+  return hub
+
+
+async def refresh_history(stream):
+  """Bring a stream's history up to date when no hub is reading it (no clients connected).
+
+  Only entries after the newest one already kept are read (at most HISTORY_SIZE of them),
+  and they are decoded and scored in a worker thread, so a page load with nothing new
+  costs one empty XREVRANGE and the copy out of the ring buffer.
+  """
+  history = get_history(stream)
+  hub = hubs.get(stream)
+  if hub is not None and hub.subscribers:
+    return history
+  # the lower bound is exclusive: the newest kept entry is not read again
+  entries = await asyncio.to_thread(r.xrevrange, stream, "+", history.read_after(), count=HISTORY_SIZE)
+  if entries:
+    history.extend(await asyncio.to_thread(build_payloads, list(reversed(entries))))
+  return history
+
+
+def snapshot_window(last, seconds):
+  since_ts = int(time.time() * 1000) - int(seconds * 1000) if seconds is not None else None
+  return last, since_ts
+
+
+def collect_metrics():
+  """Per-stream clients, send-queue depth, conflated payloads and reader lag, read at scrape time."""
+  clients, depth, dropped, lag = {}, {}, {}, {}
+  model = predictor.bundle
+  for stream, hub in list(hubs.items()):
+    subscribers = list(hub.subscribers)
+    clients[(stream,)] = len(subscribers)
+    depth[(stream,)] = sum(subscriber.queue.qsize() for subscriber in subscribers)
+    dropped[(stream,)] = sum(subscriber.dropped for subscriber in subscribers)
+    tail = metrics.stream_tail(r, stream)
+    if tail is not None and hub.last_id not in (None, "$"):
+      lag[(stream,)] = metrics.id_lag_seconds(tail[1], hub.last_id)
+  return [
+    metrics.gauge("forecast_clients", "Connected /ws/trades clients", clients, labels=["stream"]),
+    metrics.gauge("forecast_send_queue_depth", "Payloads queued for connected clients", depth, labels=["stream"]),
+    metrics.gauge("forecast_dropped_payloads", "Payloads conflated away for connected clients", dropped, labels=["stream"]),
+    metrics.gauge("forecast_stream_lag_seconds", "Stream tail minus the last entry the hub read", lag, labels=["stream"]),
+    metrics.gauge(
+      "forecast_model_loaded_timestamp_seconds",
+      "Load time of the active model bundle",
+      {(model.version,): model.loaded_at} if model.version else {},
+      labels=["version"],
+    ),
+    metrics.gauge("forecast_model_reload_failures", "Model reloads rejected since startup", {(): reloader.failures}),
+  ]
+
+
+metrics.register_probe("forecast", collect_metrics)
+
+
+@app.get("/model")
+async def model_status():
+  """Active model version and load time, plus the outcome of the last reload."""
+  return reloader.status()
+
+
+@app.post("/model/reload")
+async def reload_model():
+  # the bundle is loaded in a worker thread; on failure the current model keeps serving
+  return await reloader.reload()
+
+
+@app.get("/snapshot")
+async def snapshot(symbol: str = DEFAULT_SYMBOL, last: int | None = None, seconds: float | None = None):
+  """Recent payloads as columns (id, ts, price, qty, side, prob_up), oldest first.
+
+  ``last`` bounds the count, ``seconds`` the age by trade time; with neither the whole buffer is returned.
+  """
+  stream = TRADE_STREAM_PREFIX + symbol.lower()
+  history = await refresh_history(stream)
+  return {"symbol": symbol.lower(), **history.snapshot(*snapshot_window(last, seconds))}
+
+
+@app.get("/trace")
+async def trace_report(top: int = 10):
+  """Rolling per-hop latency percentiles and the slowest recent traced trades."""
+  return tracer.report(top)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+  # scraping reads XINFO from Redis; keep it off the event loop
+  body, content_type = await asyncio.to_thread(metrics.render)
+  return Response(content=body, media_type=content_type)
+
+
+async def watch_disconnect(websocket, subscriber):
+  # the sender loop only waits on the subscriber queue, so closing it is how it learns the client left
+  try:
+    while True:
+      message = await websocket.receive()
+      if message["type"] == "websocket.disconnect":
+        return
+  finally:
+    subscriber.close()
+
 
 @app.websocket("/ws/trades") # define a websocket endpoint at /ws/trades
-async def websocket_trades(websocket: WebSocket):
+async def websocket_trades(
+  websocket: WebSocket,
+  backfill: int = 0,
+  symbol: str = DEFAULT_SYMBOL,
+  snapshot: int | None = None,
+  snapshot_seconds: float | None = None,
+  delivery: str = "event",
+  encoding: str = "json",
+  interval_ms: int = 250,
+):
+  # ?delivery=event sends one JSON payload per trade, batch one frame per hub read and
+  # conflate only the newest payload every ?interval_ms; ?encoding=binary (batch and
+  # conflate only) sends packed columnar frames (forecast.frames) instead of JSON arrays
+  if delivery not in DELIVERY_MODES or encoding not in FORMATS or (encoding == "binary" and delivery == "event"):
+    await websocket.close(code=1008)
+    return
   await websocket.accept() # accept the websocket connection
-  last_id = "0"  # start reading from the beginning of the stream or lastest with "$"
+  # new clients start at the live tail; ?backfill=N replays the last N payloads first, while
+  # ?snapshot=N / ?snapshot_seconds=T send the recent history as one columnar frame
+  stream = TRADE_STREAM_PREFIX + symbol.lower()
+  seen = None
+  if snapshot is not None or snapshot_seconds is not None:
+    history = await refresh_history(stream)
+    frame = history.snapshot(*snapshot_window(snapshot, snapshot_seconds))
+    await websocket.send_json({"type": "snapshot", "symbol": symbol.lower(), **frame})
+    seen = id_key(frame["id"][-1]) if frame["count"] else None
+  hub = get_hub(stream)
+  subscriber = hub.subscribe(backfill=backfill, mode=delivery)
+  watcher = asyncio.create_task(watch_disconnect(websocket, subscriber))
 
   try:
     while True:
-      # read new trades from redis stream; returns None if nothing arrived within block window
-      events = r.xread({"trades:btcusdt": last_id}, block=1000, count=10) # block=1000 means: wait up to 1000ms for new messages, count=10 means: read up to 10 messages at a time
-
-      if not events:
-        await asyncio.sleep(0)  # yield control to event loop to avoid busy waiting
+      item = await subscriber.get() # None once the client left or was dropped for lagging
+      if item is None:
+        break
+      if isinstance(item, str): # event delivery: one shared JSON text per payload
+        if seen is not None: # payloads already in the snapshot frame are skipped once
+          if id_key(json.loads(item)["id"]) <= seen:
+            continue
+          seen = None
+        await websocket.send_text(item) # send the trade event as a JSON string to the client
         continue
-
-      for stream, messages in events:
-        for message_id, fields in messages:
-          ts = int(fields.get("ts", 0))
-          raw_qty = float(fields.get("qty", 0))
-          side = fields.get("side", "buy")
-          price = float(fields.get("price", 0))
-          ofi = float(fields.get("ofi", 0))
-          if ofi == 0:
-            ofi = raw_qty if side == "buy" else -raw_qty
-
-          prob_up, prob_down, source = predictor.predict(
-            {"qty": raw_qty, "side": side, "price": price, "ofi": ofi}
-          )
-
-          payload = {
-            "id": message_id,
-            "ts": ts,
-            "price": price,
-            "qty": raw_qty,
-            "side": side,
-            "ofi": ofi,
-            "prob_up": prob_up,
-            "prob_down": prob_down,
-            "predictor": source,
-          }
-
-          await websocket.send_text(json.dumps(payload)) # send the trade event as a JSON string to the client
-          last_id = message_id  # update last_id to the ID of the last processed message
+      if seen is not None:
+        item = item.after(seen)
+        if not len(item):
+          continue
+        seen = None
+      frame = item.latest(encoding) if delivery == "conflate" else item.frame(encoding)
+      if isinstance(frame, bytes):
+        await websocket.send_bytes(frame)
+      else:
+        await websocket.send_text(frame)
+      if delivery == "conflate":
+        await asyncio.sleep(interval_ms / 1000) # newer batches replace the queued one meanwhile
+    if not watcher.done():
+      await websocket.close(code=1013) # dropped for falling too far behind, or the hub's reader gave up
   except WebSocketDisconnect:
-    return
+    pass
+  finally:
+    watcher.cancel()
+    hub.unsubscribe(subscriber)
@@ -0,0 +1,67 @@
+"""Aggregation of sampled per-trade stage timestamps (``ingest.trace``) at the hand-off to websocket clients."""
+from __future__ import annotations
+
+from collections import deque
+from typing import Deque, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from ingest.trace import TRACE_FIELD, hops, now_us, parse
+from observability import metrics
+
+
+class Tracer:
+    """Per-hop latency of traced payloads, measured when the hub hands them to its clients.
+
+    Every hop is observed in the ``trace_hop_seconds`` histogram and kept in a rolling
+    window of the last ``window`` samples per hop, from which ``report`` derives
+    percentiles and the slowest recent traces with their hop breakdown. Exchange and
+    ingest run on different clocks, so the first hop can read slightly negative.
+    """
+
+    def __init__(self, window: int = 2000):
+        self.window = window
+        self.hops: Dict[str, Deque[int]] = {}
+        self.recent: Deque[Tuple[int, str, int, List[Tuple[str, int]]]] = deque(maxlen=window)
+
+    def observe(self, payload: Mapping[str, object], sent_us: Optional[int] = None) -> None:
+        stages = parse(str(payload[TRACE_FIELD]), int(payload["ts"]))
+        stages["send"] = now_us() if sent_us is None else sent_us
+        path = hops(stages)
+        for name, us in path:
+            if metrics.ENABLED:
+                metrics.TRACE_HOP_SECONDS.labels(name).observe(max(us, 0) / 1e6)
+            samples = self.hops.get(name)
+            if samples is None:
+                samples = self.hops[name] = deque(maxlen=self.window)
+            samples.append(us)
+        if path:
+            self.recent.append((sum(us for _, us in path), str(payload.get("id", "")), int(payload["ts"]), path))
+
+    def report(self, top: int = 10) -> Dict[str, object]:
+        """Rolling per-hop percentiles (ms) and the ``top`` slowest recent traces."""
+        summary = {}
+        for name, samples in self.hops.items():
+            ms = np.fromiter(samples, dtype=float, count=len(samples)) / 1000
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            summary[name] = {
+                "count": len(ms),
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+                "max_ms": float(ms.max()),
+            }
+        slowest = sorted(self.recent, key=lambda trace: trace[0], reverse=True)[:top]
+        return {
+            "hops": summary,
+            "slowest": [
+                {
+                    "id": message_id,
+                    "ts": ts,
+                    "total_ms": total / 1000,
+                    "slowest_hop": max(path, key=lambda hop: hop[1])[0],
+                    "hops_ms": {name: us / 1000 for name, us in path},
+                }
+                for total, message_id, ts, path in slowest
+            ],
+        }
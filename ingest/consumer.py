@@ -1,7 +1,10 @@
 import redis
 import time
 
-r = redis.Redis(host="localhost", port=6379, decode_responses=True)
+from ingest.wire import decode_entry
+
+# raw bytes: entries may be packed binary batches (ingest/wire.py) as well as string fields
+r = redis.Redis(host="localhost", port=6379, decode_responses=False)
 STREAM = "trades:btcusdt"
 
 last_id = "0"  # start reading from the beginning of the stream or lastest with "$"
@@ -17,5 +20,6 @@ while True:
 
   for stream, messages in events:
     for message_id, fields in messages:
-      print(f"Message ID: {message_id}, Field: {fields}") # msg_id = Redis ID, fields = your trade event
+      for trade in decode_entry(fields): # one trade per text entry, a whole batch per binary entry
+        print(f"Message ID: {message_id.decode()}, Field: {trade}") # msg_id = Redis ID, trade = your trade event
       last_id = message_id  # update last_id to the ID of the last processed message
\ No newline at end of file
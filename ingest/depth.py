@@ -0,0 +1,397 @@
+"""Order book depth ingestion: a local book per symbol, kept from a REST snapshot plus the
+``<symbol>@depth@100ms`` diff stream, published as book features.
+
+Books are synced the way Binance documents it. Diffs are buffered while a snapshot is
+fetched; those with ``u <= lastUpdateId`` are dropped, the first one applied must
+straddle ``lastUpdateId + 1`` and every later one must start right after the previous
+one (``U == previous u + 1``). Anything else is a sequence gap: the book is rebuilt from
+a fresh snapshot while new diffs are buffered again.
+
+Each side of a book is a pair of sorted NumPy arrays (price key, quantity), best level
+first, so a diff costs one ``searchsorted`` plus at most one ``np.insert`` and one mask,
+and the top N levels are a slice. After every applied diff the spread, microprice and
+top-N depth imbalance are queued and XADDed to ``book:<symbol>`` in one pipeline per
+flush; the stream processor merges the newest row into its feature rows
+(``python3 -m processor.processor --book``).
+
+Run it with, e.g.::
+
+    python3 -m ingest.depth --symbols btcusdt ethusdt --top-n 10
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import urllib.parse
+import urllib.request
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import redis
+import websockets
+
+from ingest.wire import BINARY_FIELD, WIRE_FORMATS, pack_features
+from observability import metrics
+
+r = redis.Redis(host="localhost", port=6379, decode_responses=False)
+
+BOOK_STREAM_PREFIX = "book:"  # book:<symbol> holds one feature row per applied diff
+BINANCE_STREAM_URL = "wss://stream.binance.com:9443/stream"
+BINANCE_DEPTH_URL = "https://api.binance.com/api/v3/depth"
+SYMBOLS = ["btcusdt"]
+SNAPSHOT_LIMIT = 1000  # levels per side in the REST snapshot
+TOP_N = 10  # levels summed into the depth imbalance
+FLUSH_INTERVAL = 0.1  # seconds between pipelined XADDs of queued book rows
+RETRY_DELAY = 1.0  # seconds before retrying a failed snapshot
+
+APPLIED, STALE, GAP = "applied", "stale", "gap"
+
+Snapshot = Mapping[str, object]  # {"lastUpdateId": int, "bids": [[price, qty], ...], "asks": [...]}
+
+
+def book_stream(symbol: str) -> str:
+    return BOOK_STREAM_PREFIX + symbol.lower()
+
+
+def depth_stream_url(symbols: Sequence[str], base_url: str = BINANCE_STREAM_URL) -> str:
+    """Combined-stream URL subscribing to the 100 ms diff depth channel of every symbol."""
+    return f"{base_url}?streams=" + "/".join(f"{symbol.lower()}@depth@100ms" for symbol in symbols)
+
+
+def parse_depth_message(message: str) -> Tuple[str, Dict[str, object]]:
+    """``(SYMBOL, depthUpdate event)`` from a combined-stream frame or a single-stream one."""
+    raw = json.loads(message)
+    if "data" in raw:
+        raw = raw["data"]
+    return raw["s"].upper(), raw
+
+
+def fetch_snapshot(symbol: str, limit: int = SNAPSHOT_LIMIT, url: str = BINANCE_DEPTH_URL) -> Snapshot:
+    """REST depth snapshot (blocking)."""
+    query = urllib.parse.urlencode({"symbol": symbol.upper(), "limit": limit})
+    with urllib.request.urlopen(f"{url}?{query}", timeout=10) as response:
+        return json.load(response)
+
+
+def _levels(levels: Sequence[Sequence[object]]) -> Tuple[np.ndarray, np.ndarray]:
+    pairs = np.array(levels, dtype=np.float64).reshape(-1, 2)  # Binance sends prices and qtys as strings
+    return pairs[:, 0], pairs[:, 1]
+
+
+class BookSide:
+    """One side of a book as sorted ``(key, qty)`` arrays, best level first (bid keys are
+    negated prices). Levels with zero quantity are never stored, and with ``max_levels``
+    set only the best that many are kept: levels far from the touch stop getting diffs, so
+    without a cap a side would only grow over a long session."""
+
+    def __init__(self, bids: bool, max_levels: Optional[int] = None):
+        self.sign = -1.0 if bids else 1.0
+        self.max_levels = max_levels
+        self.keys = np.empty(0, dtype=np.float64)
+        self.qty = np.empty(0, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def load(self, levels: Sequence[Sequence[object]]) -> None:
+        prices, qty = _levels(levels)
+        keys = prices * self.sign
+        order = np.argsort(keys, kind="stable")
+        keys, qty = keys[order], qty[order]
+        self.keys, self.qty = keys[qty > 0][: self.max_levels], qty[qty > 0][: self.max_levels]
+
+    def apply(self, levels: Sequence[Sequence[object]]) -> None:
+        """Set each listed level's quantity; quantity 0 removes the level."""
+        prices, qty = _levels(levels)
+        if not len(prices):
+            return
+        # unique keys in book order; should a price repeat, its last quantity wins
+        keys, last = np.unique(prices[::-1] * self.sign, return_index=True)
+        qty = qty[::-1][last]
+        pos = np.searchsorted(self.keys, keys)
+        found = pos < len(self.keys)
+        found[found] = self.keys[pos[found]] == keys[found]
+        self.qty[pos[found]] = qty[found]
+        keep = np.ones(len(self.keys), dtype=bool)
+        keep[pos[found & (qty == 0)]] = False
+        new = ~found & (qty > 0)
+        if new.any():
+            self.keys = np.insert(self.keys, pos[new], keys[new])
+            self.qty = np.insert(self.qty, pos[new], qty[new])
+            keep = np.insert(keep, pos[new], True)
+        if not keep.all():
+            self.keys, self.qty = self.keys[keep], self.qty[keep]
+        if self.max_levels is not None and len(self.keys) > self.max_levels:
+            self.keys, self.qty = self.keys[: self.max_levels], self.qty[: self.max_levels]
+
+    def top(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Prices and quantities of the best ``n`` levels."""
+        return self.keys[:n] * self.sign, self.qty[:n]
+
+
+class OrderBook:
+    """Local book of one symbol, synced from a snapshot and sequence-checked diffs, with at
+    most ``max_levels`` levels per side (unbounded when ``None``)."""
+
+    def __init__(self, max_levels: Optional[int] = None):
+        self.bids = BookSide(bids=True, max_levels=max_levels)
+        self.asks = BookSide(bids=False, max_levels=max_levels)
+        self.last_update_id: Optional[int] = None
+        self._straddle = False  # the next diff is the first one after a snapshot
+
+    @property
+    def synced(self) -> bool:
+        return self.last_update_id is not None
+
+    def load_snapshot(self, snapshot: Snapshot) -> None:
+        self.bids.load(snapshot["bids"])
+        self.asks.load(snapshot["asks"])
+        self.last_update_id = int(snapshot["lastUpdateId"])
+        self._straddle = True
+
+    def apply(self, event: Mapping[str, object]) -> str:
+        """Apply a ``depthUpdate`` event: ``APPLIED``, ``STALE`` (already in the snapshot) or
+        ``GAP`` (the book is out of sync until the next snapshot)."""
+        if self.last_update_id is None:
+            return GAP
+        first, last = int(event["U"]), int(event["u"])
+        if last <= self.last_update_id:
+            return STALE
+        expected = self.last_update_id + 1
+        if first > expected or (not self._straddle and first != expected):
+            self.last_update_id = None
+            return GAP
+        self.bids.apply(event.get("b", ()))
+        self.asks.apply(event.get("a", ()))
+        self.last_update_id = last
+        self._straddle = False
+        return APPLIED
+
+    def features(self, top_n: int = TOP_N) -> Optional[Dict[str, float]]:
+        """Spread, microprice and top-N depth imbalance, or ``None`` while a side is empty."""
+        bid_price, bid_qty = self.bids.top(top_n)
+        ask_price, ask_qty = self.asks.top(top_n)
+        if not len(bid_price) or not len(ask_price):
+            return None
+        best_bid, best_ask = float(bid_price[0]), float(ask_price[0])
+        mid = (best_bid + best_ask) / 2
+        bid_depth, ask_depth = float(bid_qty.sum()), float(ask_qty.sum())
+        return {
+            "best_bid": best_bid,
+            "best_ask": best_ask,
+            "spread": best_ask - best_bid,
+            "spread_bps": (best_ask - best_bid) / mid * 10_000,
+            # the touch weighted by the opposite side's size: leans toward the thinner side
+            "microprice": (best_bid * float(ask_qty[0]) + best_ask * float(bid_qty[0])) / float(bid_qty[0] + ask_qty[0]),
+            f"depth_imbalance_{top_n}": (bid_depth - ask_depth) / (bid_depth + ask_depth),
+            f"bid_depth_{top_n}": bid_depth,
+            f"ask_depth_{top_n}": ask_depth,
+        }
+
+
+class DepthIngester:
+    """Keeps one ``OrderBook`` per symbol from a diff depth stream and publishes book features.
+
+    A symbol's first diff, and any sequence gap, start a background resync: its diffs are
+    buffered while ``fetch_snapshot(symbol, limit)`` runs in a worker thread, then replayed
+    onto the snapshot. A snapshot older than the buffered diffs is fetched again.
+
+    Each side is capped at ``snapshot_limit`` levels, the depth a snapshot covers. Book rows
+    are published every ``flush_interval`` seconds by a timer, so rows recorded before a
+    symbol goes quiet (or by a background replay) don't wait for the next message; with
+    ``flush_interval`` 0 they are published after every message instead.
+    """
+
+    def __init__(
+        self,
+        client,
+        symbols: Sequence[str],
+        fetch_snapshot: Callable[[str, int], Snapshot] = fetch_snapshot,
+        top_n: int = TOP_N,
+        snapshot_limit: int = SNAPSHOT_LIMIT,
+        flush_interval: float = FLUSH_INTERVAL,
+        wire: str = "text",
+        retry_delay: float = RETRY_DELAY,
+    ):
+        self.client = client
+        self.books = {symbol.upper(): OrderBook(snapshot_limit) for symbol in symbols}
+        self.fetch_snapshot = fetch_snapshot
+        self.top_n = top_n
+        self.snapshot_limit = snapshot_limit
+        self.flush_interval = flush_interval
+        self.wire = wire
+        self.retry_delay = retry_delay
+        self.applied = dict.fromkeys(self.books, 0)
+        self.gaps = dict.fromkeys(self.books, 0)
+        self.snapshots = dict.fromkeys(self.books, 0)
+        self.rows: Dict[str, List[Dict[str, float]]] = {}  # symbol -> book rows not yet published
+        self._buffered: Dict[str, List[Mapping[str, object]]] = {}  # symbol -> diffs held during a resync
+        self._resyncs: Dict[str, asyncio.Task] = {}
+
+    def handle(self, symbol: str, event: Mapping[str, object]) -> None:
+        book = self.books.get(symbol)
+        if book is None:
+            return
+        if symbol in self._resyncs:
+            self._buffered[symbol].append(event)
+            return
+        was_synced = book.synced
+        status = book.apply(event)
+        if status == APPLIED:
+            self._record(symbol, event)
+        elif status == GAP:
+            if was_synced:
+                self.gaps[symbol] += 1
+                print(f"[depth] {symbol}: sequence gap before update {event['U']}, resyncing")
+            self._resync(symbol, [event])
+
+    def _record(self, symbol: str, event: Mapping[str, object]) -> None:
+        self.applied[symbol] += 1
+        features = self.books[symbol].features(self.top_n)
+        if features is not None:
+            self.rows.setdefault(symbol, []).append({"ts": int(event.get("E", 0)), **features})
+
+    def _resync(self, symbol: str, buffered: List[Mapping[str, object]]) -> None:
+        self._buffered[symbol] = buffered
+        self._resyncs[symbol] = asyncio.get_running_loop().create_task(self._load(symbol))
+
+    async def _load(self, symbol: str) -> None:
+        while True:
+            try:
+                snapshot = await asyncio.to_thread(self.fetch_snapshot, symbol, self.snapshot_limit)
+                break
+            except Exception as e:  # network or rate limit: keep buffering and retry
+                print(f"[depth] {symbol}: snapshot failed ({e}), retrying in {self.retry_delay}s")
+                await asyncio.sleep(self.retry_delay)
+        self.snapshots[symbol] += 1
+        book = self.books[symbol]
+        book.load_snapshot(snapshot)
+        buffered = self._buffered.pop(symbol)
+        del self._resyncs[symbol]
+        for i, event in enumerate(buffered):
+            status = book.apply(event)
+            if status == APPLIED:
+                self._record(symbol, event)
+            elif status == GAP:  # the snapshot predates the buffered diffs: fetch a newer one
+                self._resync(symbol, buffered[i:])
+                return
+
+    def _publish(self, rows: Dict[str, List[Dict[str, float]]]) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        for symbol, symbol_rows in rows.items():
+            if self.wire == "binary":
+                pipe.xadd(book_stream(symbol), {BINARY_FIELD: pack_features(symbol_rows)})
+            else:
+                for row in symbol_rows:
+                    pipe.xadd(book_stream(symbol), row)
+        pipe.execute()
+
+    async def flush(self) -> None:
+        rows, self.rows = self.rows, {}
+        if rows:
+            await asyncio.to_thread(self._publish, rows)
+
+    async def _flush_until(self, stop: asyncio.Event) -> None:
+        """Flush every ``flush_interval`` seconds, and once more when ``stop`` is set."""
+        while True:
+            try:
+                await asyncio.wait_for(stop.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+            if stop.is_set():
+                return
+
+    async def run(self, messages) -> None:
+        """Drive the books until ``messages`` (an async iterable of raw JSON) ends."""
+        stop = asyncio.Event()
+        # the timer, not the next message, decides when rows go out: a quiet socket can't hold them back
+        flusher = asyncio.get_running_loop().create_task(self._flush_until(stop)) if self.flush_interval > 0 else None
+        try:
+            async for message in messages:
+                self.handle(*parse_depth_message(message))
+                if flusher is None:
+                    await self.flush()
+                elif flusher.done():
+                    flusher.result()  # a failed publish stops the ingester, as an inline flush would
+            while self._resyncs:  # let in-flight snapshots replay what they buffered
+                await asyncio.gather(*list(self._resyncs.values()))
+        finally:
+            if flusher is not None:
+                stop.set()
+                await flusher
+        await self.flush()
+
+    def collect_metrics(self):
+        """Prometheus families read at scrape time: applied diffs, gaps, snapshots and book size."""
+        families = []
+        for name, help_text, counts in (
+            ("depth_updates_applied", "Diff depth events applied to the local book", self.applied),
+            ("depth_sequence_gaps", "Sequence gaps that forced a resync", self.gaps),
+            ("depth_snapshots", "REST depth snapshots loaded", self.snapshots),
+        ):
+            family = metrics.CounterMetricFamily(name, help_text, labels=["symbol"])
+            for symbol, count in list(counts.items()):
+                family.add_metric([symbol], count)
+            families.append(family)
+        levels = {(symbol, side): len(getattr(book, side)) for symbol, book in self.books.items() for side in ("bids", "asks")}
+        families.append(metrics.gauge("depth_book_levels", "Price levels held per book side", levels, labels=["symbol", "side"]))
+        return families
+
+
+async def consume_depth(
+    symbols=SYMBOLS,
+    url=None,
+    client=None,
+    fetch=fetch_snapshot,
+    top_n=TOP_N,
+    snapshot_limit=SNAPSHOT_LIMIT,
+    flush_interval=FLUSH_INTERVAL,
+    wire="text",
+    metrics_port=None,
+):
+    ingester = DepthIngester(
+        client if client is not None else r,
+        symbols,
+        fetch_snapshot=fetch,
+        top_n=top_n,
+        snapshot_limit=snapshot_limit,
+        flush_interval=flush_interval,
+        wire=wire,
+    )
+    if metrics_port:
+        metrics.enable(metrics_port)
+        metrics.register_probe("depth", ingester.collect_metrics)
+    async with websockets.connect(url or depth_stream_url(symbols)) as websocket:
+        await ingester.run(websocket)
+    return ingester
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Keep local order books from Binance diff depth and publish book features")
+    parser.add_argument("--symbols", nargs="+", default=SYMBOLS, help="Pairs to subscribe to, e.g. btcusdt ethusdt")
+    parser.add_argument("--url", default=None, help="Websocket endpoint (default: Binance combined depth stream)")
+    parser.add_argument("--snapshot-url", default=BINANCE_DEPTH_URL, help="REST depth snapshot endpoint")
+    parser.add_argument("--snapshot-limit", type=int, default=SNAPSHOT_LIMIT, help="Levels per side in each snapshot")
+    parser.add_argument("--top-n", type=int, default=TOP_N, help="Levels per side summed into depth imbalance")
+    parser.add_argument("--flush-interval", type=float, default=FLUSH_INTERVAL, help="Seconds between XADD pipelines")
+    parser.add_argument("--wire", choices=WIRE_FORMATS, default="text", help="Format of the published book entries")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on this port")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(
+        consume_depth(
+            symbols=args.symbols,
+            url=args.url,
+            fetch=lambda symbol, limit: fetch_snapshot(symbol, limit, args.snapshot_url),
+            top_n=args.top_n,
+            snapshot_limit=args.snapshot_limit,
+            flush_interval=args.flush_interval,
+            wire=args.wire,
+            metrics_port=args.metrics_port,
+        )
+    )
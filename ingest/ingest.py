@@ -1,70 +1,420 @@
+import argparse
 import asyncio
 import websockets # use this to connect to Binance API
 import json # use this to parse JSON messages into Python dictionaries
 import redis
 import duckdb # store trades in a local DuckDB database
+import pandas as pd # build one DataFrame per micro-batch for bulk DuckDB appends
 import sys
-# connect to Redis (running in Docker on localhost:6379) 
-r = redis.Redis(host='localhost', port=6379, decode_responses=True) 
-REDIS_STREAM = "trades:btcusdt" # name of the Redis stream to store trades
-
-# connect to DuckDB (creates trades.db file if it doesn't exist)
-try: 
-  con = duckdb.connect('storage/trades.db')
-  # append only schema: one row per trade
-  con.execute("""
-  CREATE TABLE IF NOT EXISTS trades (
-      ts BIGINT,
-      price DOUBLE,
-      qty DOUBLE,
-      side VARCHAR
-  );
-  """)
-except duckdb.IOException as e:
-    print("❌ Could not open DuckDB database. It may already be locked by another process.")
-    print("💡 Tip: close other DuckDB shells or kill processes using it.")
-    print("🔎 Error details:", e)
-    sys.exit(1)   # exit cleanly
-
-
-
-async def consume_trades(): # this function will connect to Binance's trade stream and keep reading messages
-    # "btcusdt@trade" means: send me every trade that happens on the BTC/USDT pair
-    url = "wss://stream.binance.com:9443/ws/btcusdt@trade"
-
-    # connect to the websocket server at Binance and keep the connection open
-    # async with means: wait for the connection to be established before proceeding, open automatically, close it when done
-    async with websockets.connect(url) as websocket:
-        # loop forever, reading messages as they come in
-        # async for means: wait for the next message without blocking other tasks
-        async for message in websocket:
-            # print the raw JSON message received from Binance
-            # at this point, message is just a JSON string
-            raw = json.loads(message)
-            event = normalize_trade(raw) # normalize the trade data into clean schema
-
-            r.xadd(REDIS_STREAM, event) # add the normalized trade data to the Redis stream
-
-            # write to duckdb
-            con.execute("INSERT INTO trades VALUES (?, ?, ?, ?)", (event["ts"], event["price"], event["qty"], event["side"]))
-
-
-
-
-            print(event) # print the normalized trade data
-           
-            # in a real application, you would parse the JSON and store it in a database or process it further
-            # for example:
-            # trade = json.loads(message)
-            # store_trade_in_db(trade)
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from ingest.lake import compact, write_segments
+from ingest.retention import RETENTION_INTERVAL, Retention, parse_policy, stream_symbol
+from ingest.schema import SCHEMA_VERSION, migrate, schema_version
+from ingest.trace import TRACE_FIELD, now_us, sampled, stamp
+from ingest.wire import BINARY_FIELD, WIRE_FORMATS, pack_traces, pack_trades
+from observability import metrics
+# connect to Redis (running in Docker on localhost:6379)
+r = redis.Redis(host='localhost', port=6379, decode_responses=True)
+REDIS_STREAM_PREFIX = "trades:" # each symbol gets its own Redis stream, e.g. trades:btcusdt
+BINANCE_STREAM_URL = "wss://stream.binance.com:9443/stream" # combined-stream endpoint: many pairs, one connection
+SYMBOLS = ["btcusdt"] # default symbol list
+
+TRADE_COLUMNS = ("trade_id", "ts", "price", "qty", "side", "symbol")
+
+QUEUE_SIZE = 10_000 # max trades buffered between the websocket reader and the writers
+BATCH_SIZE = 500 # flush a micro-batch once it holds this many trades...
+FLUSH_INTERVAL = 0.1 # ...or once this many seconds passed since its first trade
+SINK_QUEUE_SIZE = 8 # max micro-batches waiting on each writer before the batcher blocks
+REPORT_INTERVAL = 5.0 # seconds between ingest rate reports
+
+DB_PATH = "storage/trades.db"
+COMPACT_INTERVAL = 60.0 # seconds between lake compaction passes
+
+con = None # DuckDB connection, opened on first use so --lake runs never lock trades.db
+
+
+def connect_duckdb(path=DB_PATH):
+  """Open (creating if needed) the DuckDB trade store and make sure it has the current schema."""
+  try:
+    connection = duckdb.connect(path)
+    version = schema_version(connection)
+    if version is None:
+      migrate(connection) # empty database: create the versioned trades table
+    elif version != SCHEMA_VERSION:
+      print(f"❌ {path} uses trade schema version {version}, ingest writes version {SCHEMA_VERSION}.")
+      print(f"💡 Tip: migrate it first with: python3 -m ingest.schema {path}")
+      sys.exit(1)
+  except duckdb.IOException as e:
+      print("❌ Could not open DuckDB database. It may already be locked by another process.")
+      print("💡 Tip: close other DuckDB shells or kill processes using it, or ingest into a Parquet lake with --lake.")
+      print("🔎 Error details:", e)
+      sys.exit(1)   # exit cleanly
+  return connection
+
+
+_STOP = object() # sentinel pushed through the queues once the websocket closes
+
+
+@dataclass
+class IngestStats:
+    """Counters shared by the pipeline stages, used for the periodic rate report."""
+
+    received: int = 0
+    per_symbol: dict = field(default_factory=dict) # symbol -> trades received
+    written: dict = field(default_factory=dict) # sink name -> trades written
+    batches: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.received / elapsed if elapsed > 0 else 0.0
+
+
+def trade_stream(symbol):
+    """Redis stream holding one symbol's trades."""
+    return REDIS_STREAM_PREFIX + symbol.lower()
+
+
+def combined_stream_url(symbols, base_url=BINANCE_STREAM_URL):
+    """Binance combined-stream URL subscribing to the trade channel of every symbol."""
+    return f"{base_url}?streams=" + "/".join(f"{symbol.lower()}@trade" for symbol in symbols)
+
+
+def parse_message(message, trace_every=0):
+    """Return ``(SYMBOL, event)`` for a combined-stream frame or a plain single-stream one.
+
+    With ``trace_every`` set, one trade id in ``trace_every`` gets a ``trace`` holding the
+    Binance event time ``E`` and the time it was received here (see ``ingest.trace``).
+    """
+    received = now_us() if trace_every else None
+    raw = json.loads(message)
+    if "data" in raw: # combined streams wrap the trade: {"stream": "btcusdt@trade", "data": {...}}
+        raw = raw["data"]
+    event = normalize_trade(raw)
+    if received is not None and sampled(event["trade_id"], trace_every):
+        exchange = raw["E"] * 1000 if "E" in raw else None
+        event[TRACE_FIELD] = stamp(None, event["ts"], exchange=exchange, ingest=received)
+    return raw["s"].upper(), event
+
+
+def write_redis_batch(client, batch, wire="text"):
+    """XADD every ``(symbol, event)`` of the batch to its symbol's stream in one pipelined round trip.
+
+    With ``wire="binary"`` each symbol's trades in the batch become one packed entry (see
+    ``ingest.wire``) instead of one string-field entry per trade.
+    """
+    pipe = client.pipeline(transaction=False)
+    if wire == "binary":
+        by_symbol = {}
+        for symbol, event in batch:
+            by_symbol.setdefault(symbol, []).append(event)
+        for symbol, events in by_symbol.items():
+            entry = {BINARY_FIELD: pack_trades(events)}
+            traces = pack_traces(events)
+            if traces:
+                entry[TRACE_FIELD] = traces
+            pipe.xadd(trade_stream(symbol), entry)
+    else:
+        for symbol, event in batch:
+            pipe.xadd(trade_stream(symbol), event)
+    pipe.execute()
+
+
+def write_duckdb_batch(connection, batch):
+    """Append the batch to DuckDB with a single INSERT ... SELECT, skipping trades already stored.
+
+    Reconnects can redeliver trades, so rows whose (symbol, trade_id) is already in the
+    table are dropped. The lookup is limited to the batch's ts range: rows are appended in
+    ts order, so DuckDB's zonemaps skip every row group outside that range and the check
+    stays cheap however large the table grows. Inserting the same batch twice is a no-op.
+    """
+    frame = pd.DataFrame.from_records(
+        [(e["trade_id"], e["ts"], e["price"], e["qty"], e["side"], symbol) for symbol, e in batch], columns=TRADE_COLUMNS
+    )
+    frame = frame.drop_duplicates(["symbol", "trade_id"]).sort_values("ts", kind="stable")
+    connection.register("trades_batch", frame)
+    try:
+        connection.execute(
+            """
+            INSERT INTO trades (trade_id, ts, price, qty, side, symbol)
+            SELECT b.trade_id, b.ts, b.price, b.qty, b.side, b.symbol FROM trades_batch b
+            WHERE NOT EXISTS (
+                SELECT 1 FROM trades t
+                WHERE t.ts BETWEEN ? AND ? AND t.symbol = b.symbol AND t.trade_id = b.trade_id
+            )
+            ORDER BY b.ts
+            """,
+            [int(frame["ts"].min()), int(frame["ts"].max())],
+        )
+    finally:
+        connection.unregister("trades_batch")
+
+
+class IngestPipeline:
+    """Staged ingest: websocket reader -> bounded queue -> batcher -> one writer task per sink.
+
+    The reader only parses and enqueues. When the queue is full ``queue.put`` suspends the
+    reader, which stops pulling frames off the socket (backpressure). The batcher cuts
+    micro-batches by size or by ``flush_interval`` and hands them to every sink's own
+    bounded queue, so a slow DuckDB insert never delays the Redis fan-out (until its
+    queue fills up too). Sink writes run in worker threads, off the event loop.
+    """
+
+    def __init__(
+        self,
+        sinks,
+        queue_size=QUEUE_SIZE,
+        batch_size=BATCH_SIZE,
+        flush_interval=FLUSH_INTERVAL,
+        sink_queue_size=SINK_QUEUE_SIZE,
+        report_interval=REPORT_INTERVAL,
+        trace_every=0,
+        verbose=False,
+    ):
+        self.sinks = dict(sinks) # name -> callable(batch), called in a worker thread
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sink_queue_size = sink_queue_size
+        self.report_interval = report_interval
+        self.trace_every = trace_every
+        self.verbose = verbose
+        self.stats = IngestStats(written={name: 0 for name in self.sinks})
+        self.queue = None
+        self._sink_queues = {}
+
+    async def run(self, messages):
+        """Drive the pipeline until ``messages`` (an async iterable of raw JSON) ends.
+
+        The stages are awaited together: if any of them fails (a sink write raising, say),
+        the others are cancelled and the error is re-raised here, instead of the upstream
+        stages blocking forever on a queue nobody drains.
+        """
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._sink_queues = {name: asyncio.Queue(maxsize=self.sink_queue_size) for name in self.sinks}
+
+        stages = [
+            asyncio.create_task(self._read(messages)),
+            asyncio.create_task(self._batch()),
+            *(asyncio.create_task(self._write(name, fn)) for name, fn in self.sinks.items()),
+        ]
+        reporter = asyncio.create_task(self._report()) if self.report_interval else None
+        try:
+            pending = set(stages)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    if task.exception() is not None:
+                        raise task.exception()
+        finally:
+            for task in [*stages, reporter]:
+                if task is not None and not task.done():
+                    task.cancel()
+        return self.stats
+
+    async def _read(self, messages):
+        per_symbol = self.stats.per_symbol
+        async for message in messages:
+            symbol, event = parse_message(message, self.trace_every)
+            await self.queue.put((symbol, event)) # waits while the queue is full
+            self.stats.received += 1
+            per_symbol[symbol] = per_symbol.get(symbol, 0) + 1
+            if self.verbose:
+                print(symbol, event)
+        await self.queue.put(_STOP)
+
+    async def _collect(self):
+        """Return the next micro-batch, or ``None`` once the reader has stopped."""
+        loop = asyncio.get_running_loop()
+        first = await self.queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                item = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if item is _STOP:
+                self.queue.put_nowait(_STOP) # flush what we have, stop on the next call
+                break
+            batch.append(item)
+        return batch
+
+    async def _batch(self):
+        while True:
+            batch = await self._collect()
+            if batch is None:
+                break
+            self.stats.batches += 1
+            for sink_queue in self._sink_queues.values():
+                await sink_queue.put(batch)
+        for sink_queue in self._sink_queues.values():
+            await sink_queue.put(_STOP)
+
+    async def _write(self, name, fn):
+        sink_queue = self._sink_queues[name]
+        while True:
+            batch = await sink_queue.get()
+            if batch is _STOP:
+                return
+            started = time.perf_counter()
+            await asyncio.to_thread(fn, batch)
+            if metrics.ENABLED:
+                metrics.SINK_WRITE_SECONDS.labels(name).observe(time.perf_counter() - started)
+            self.stats.written[name] += len(batch)
+
+    def collect_metrics(self):
+        """Prometheus families read from the pipeline's own counters at scrape time."""
+        received = metrics.CounterMetricFamily(
+            "ingest_trades_received", "Trades read from the websocket", labels=["symbol"]
+        )
+        for symbol, count in list(self.stats.per_symbol.items()):
+            received.add_metric([symbol], count)
+        written = metrics.CounterMetricFamily("ingest_trades_written", "Trades written per sink", labels=["sink"])
+        for name, count in list(self.stats.written.items()):
+            written.add_metric([name], count)
+        depth = {("reader",): self.queue.qsize() if self.queue else 0}
+        depth.update({(name,): queue.qsize() for name, queue in self._sink_queues.items()})
+        return [
+            received,
+            written,
+            metrics.CounterMetricFamily("ingest_batches", "Micro-batches flushed", value=self.stats.batches),
+            metrics.gauge("ingest_queue_depth", "Items waiting in the pipeline queues", depth, labels=["queue"]),
+        ]
+
+    async def _report(self, top=5):
+        last_received = 0
+        last_per_symbol = {}
+        last_time = time.monotonic()
+        while True:
+            await asyncio.sleep(self.report_interval)
+            now = time.monotonic()
+            elapsed = now - last_time
+            received = self.stats.received
+            per_symbol = dict(self.stats.per_symbol)
+            rate = (received - last_received) / elapsed
+            written = ", ".join(f"{name}={count}" for name, count in self.stats.written.items())
+            symbol_rates = sorted(
+                ((symbol, (count - last_per_symbol.get(symbol, 0)) / elapsed) for symbol, count in per_symbol.items()),
+                key=lambda item: item[1],
+                reverse=True,
+            )
+            busiest = ", ".join(f"{symbol}={symbol_rate:,.0f}/s" for symbol, symbol_rate in symbol_rates[:top])
+            print(
+                f"[ingest] {rate:,.0f} trades/s (avg {self.stats.rate():,.0f}), "
+                f"queue={self.queue.qsize()}/{self.queue_size}, batches={self.stats.batches}, written: {written}"
+                f" | {len(per_symbol)} symbols, busiest: {busiest}"
+            )
+            last_received, last_per_symbol, last_time = received, per_symbol, now
+
+
+async def compact_lake(lake_dir, interval=COMPACT_INTERVAL):
+    """Background task merging the lake's small per-batch segments every ``interval`` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        merged = await asyncio.to_thread(compact, lake_dir)
+        if merged:
+            print(f"[ingest] compacted {len(merged)} lake partition(s)")
+
+
+def record_watermarks(write, watermarks):
+    """Wrap a durable sink so ``watermarks[symbol]`` holds the newest ts it has stored."""
+    def sink(batch):
+        write(batch)
+        for symbol, event in batch:
+            watermarks[symbol] = max(watermarks.get(symbol, event["ts"]), event["ts"])
+    return sink
+
+
+async def retain_streams(retention, streams, interval=RETENTION_INTERVAL):
+    """Background task trimming this process' trade streams to what the durable sink holds."""
+    while True:
+        await asyncio.sleep(interval)
+        for report in await asyncio.to_thread(retention.run_once, streams):
+            if report.trimmed or report.held_back:
+                print(report.summary())
+
+
+async def consume_trades(
+    symbols=SYMBOLS,
+    url=None,
+    batch_size=BATCH_SIZE,
+    flush_interval=FLUSH_INTERVAL,
+    queue_size=QUEUE_SIZE,
+    report_interval=REPORT_INTERVAL,
+    lake_dir=None,
+    compact_interval=COMPACT_INTERVAL,
+    retain=(),
+    retention_interval=RETENTION_INTERVAL,
+    wire="text",
+    metrics_port=None,
+    trace_every=0,
+    verbose=False,
+): # this function will connect to Binance's trade stream and keep reading messages
+    # "btcusdt@trade" means: send me every trade that happens on the BTC/USDT pair;
+    # the combined endpoint multiplexes the trade channel of every symbol over one connection
+    global con
+    url = url or combined_stream_url(symbols)
+    sinks = {"redis": lambda batch: write_redis_batch(r, batch, wire)}
+    watermarks = {} # symbol -> newest ts persisted; retention never trims past it
+    if lake_dir is not None:
+        # hour-partitioned Parquet segments: readers scan them without touching trades.db
+        sinks["lake"] = record_watermarks(lambda batch: write_segments(lake_dir, batch), watermarks)
+    else:
+        if con is None:
+            con = connect_duckdb()
+        sinks["duckdb"] = record_watermarks(lambda batch: write_duckdb_batch(con, batch), watermarks)
+    pipeline = IngestPipeline(
+        sinks=sinks,
+        queue_size=queue_size,
+        batch_size=batch_size,
+        flush_interval=flush_interval,
+        report_interval=report_interval,
+        trace_every=trace_every,
+        verbose=verbose,
+    )
+    if metrics_port:
+        metrics.enable(metrics_port)
+        metrics.register_probe("ingest", pipeline.collect_metrics)
+
+    compactor = asyncio.create_task(compact_lake(lake_dir, compact_interval)) if lake_dir and compact_interval else None
+    retainer = None
+    if retain:
+        # its own bytes client: packed binary entries are not valid UTF-8
+        raw = redis.Redis(**{**r.connection_pool.connection_kwargs, "decode_responses": False})
+        retention = Retention(raw, [parse_policy(text) for text in retain], lambda stream: watermarks.get(stream_symbol(stream)))
+        retainer = asyncio.create_task(retain_streams(retention, [trade_stream(s) for s in symbols], retention_interval))
+    try:
+        # connect to the websocket server at Binance and keep the connection open
+        # async with means: wait for the connection to be established before proceeding, open automatically, close it when done
+        async with websockets.connect(url) as websocket:
+            # the websocket is an async iterable of raw JSON strings; the pipeline reads it
+            # on the event loop and leaves Redis/DuckDB writes to its writer tasks
+            return await pipeline.run(websocket)
+    finally:
+        for task in (compactor, retainer):
+            if task is not None:
+                task.cancel()
 
 def normalize_trade(raw):
     """
     Convert Binance's raw trade message into our clean schema.
     raw: the original dict from Binance
-    return: dict with fields (ts, price, qty, side)
+    return: dict with fields (trade_id, ts, price, qty, side)
     """
     event = {
+        "trade_id": raw["t"], # Binance trade id, unique per symbol: used to drop redelivered trades
         "ts": raw["T"], # trade time
         "price": float(raw["p"]), # price as float
         "qty": float(raw["q"]), # quantity as float
@@ -72,11 +422,77 @@ def normalize_trade(raw):
     }
     return event
 
-    
-if __name__ == "__main__":
-    # run the consume_trades coroutine until it completes (which it never will in this case)
-    asyncio.run(consume_trades())
-
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Stream Binance trades into Redis and DuckDB")
+    parser.add_argument("--symbols", nargs="+", default=SYMBOLS, help="Pairs to subscribe to, e.g. btcusdt ethusdt")
+    parser.add_argument("--url", default=None, help="Websocket endpoint (default: Binance combined stream for --symbols)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Max trades per micro-batch")
+    parser.add_argument(
+        "--flush-interval", type=float, default=FLUSH_INTERVAL, help="Max seconds a micro-batch waits before flushing"
+    )
+    parser.add_argument(
+        "--queue-size", type=int, default=QUEUE_SIZE, help="Trades buffered before the reader is throttled"
+    )
+    parser.add_argument(
+        "--report-interval", type=float, default=REPORT_INTERVAL, help="Seconds between ingest rate reports (0 disables)"
+    )
+    parser.add_argument(
+        "--lake", type=Path, default=None, help="Write hour-partitioned Parquet segments here instead of DuckDB"
+    )
+    parser.add_argument(
+        "--compact-interval",
+        type=float,
+        default=COMPACT_INTERVAL,
+        help="Seconds between merges of small lake segments (0 disables)",
+    )
+    parser.add_argument(
+        "--retain",
+        action="append",
+        default=[],
+        metavar="PATTERN=LIMIT[,LIMIT]",
+        help="Trim matching trade streams to a length and/or age (e.g. 'trades:*=1000000,6h') once persisted",
+    )
+    parser.add_argument(
+        "--retention-interval", type=float, default=RETENTION_INTERVAL, help="Seconds between retention passes"
+    )
+    parser.add_argument(
+        "--wire",
+        choices=WIRE_FORMATS,
+        default="text",
+        help="Redis entry format: one string-field entry per trade, or one packed binary entry per symbol and batch",
+    )
+    parser.add_argument(
+        "--metrics-port", type=int, default=None, help="Serve Prometheus metrics on this port (off by default)"
+    )
+    parser.add_argument(
+        "--trace-every",
+        type=int,
+        default=0,
+        help="Carry stage timestamps on one trade id in N through the streams (0 disables)",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Print every normalized trade")
+    return parser.parse_args()
 
 
+if __name__ == "__main__":
+    args = parse_args()
+    # run the consume_trades coroutine until it completes (which it never will in this case)
+    asyncio.run(
+        consume_trades(
+            symbols=args.symbols,
+            url=args.url,
+            batch_size=args.batch_size,
+            flush_interval=args.flush_interval,
+            queue_size=args.queue_size,
+            report_interval=args.report_interval,
+            lake_dir=args.lake,
+            compact_interval=args.compact_interval,
+            retain=args.retain,
+            retention_interval=args.retention_interval,
+            wire=args.wire,
+            metrics_port=args.metrics_port,
+            trace_every=args.trace_every,
+            verbose=args.verbose,
+        )
+    )
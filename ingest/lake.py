@@ -0,0 +1,152 @@
+"""Hour-partitioned Parquet trade lake.
+
+Trades are stored as ``<lake>/symbol=<SYMBOL>/hour=<ts // 3600000>/seg-<ns>.parquet``.
+Every segment is written to a hidden temporary file and renamed into place, so readers
+never see a partial file, and any number of DuckDB readers can scan the lake while the
+ingest process keeps appending. ``seg-<ns>`` names sort in write order; together with
+the row position inside a file that gives trades sharing a timestamp a stable order.
+
+Segments carry the Binance ``trade_id``: a reconnect or a replay can write the same trade
+twice, so ``compact`` and ``scan_sql`` keep only the first copy of each ``(symbol,
+trade_id)``, as ``write_duckdb_batch`` does for the DuckDB store. Rows without an id
+(segments written before it was stored) are always kept.
+"""
+from __future__ import annotations
+
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+LAKE_DIR = Path("storage/lake")
+HOUR_MS = 3_600_000
+SEGMENT_COLUMNS = ("trade_id", "ts", "price", "qty", "side")
+COMPACT_TARGET_BYTES = 64 * 1024 * 1024  # segments at least this large are left alone
+
+
+def partition_dir(lake_dir: Path, symbol: str, hour: int) -> Path:
+    return lake_dir / f"symbol={symbol.upper()}" / f"hour={hour}"
+
+
+def segment_paths(partition: Path) -> List[Path]:
+    """Segments of one partition in write order."""
+    return sorted(partition.glob("seg-*.parquet"))
+
+
+def _write_atomic(frame: pd.DataFrame, path: Path) -> None:
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    frame.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def _dedup(frame: pd.DataFrame) -> pd.DataFrame:
+    """Drop repeated trade ids of one symbol, keeping the first copy and every row without an id."""
+    repeated = frame.duplicated("trade_id") & frame["trade_id"].notna()
+    return frame[~repeated] if repeated.any() else frame
+
+
+def write_segments(lake_dir: Path, batch: Iterable[Tuple[str, Dict[str, object]]]) -> List[Path]:
+    """Write an ingest micro-batch of ``(symbol, event)`` pairs as one segment per symbol/hour."""
+    frame = pd.DataFrame.from_records(
+        [(symbol.upper(), e.get("trade_id"), e["ts"], e["price"], e["qty"], e["side"]) for symbol, e in batch],
+        columns=("symbol", *SEGMENT_COLUMNS),
+    )
+    if frame.empty:
+        return []
+    frame["trade_id"] = frame["trade_id"].astype("Int64")
+    frame["hour"] = frame["ts"] // HOUR_MS
+    name = f"seg-{time.time_ns():019d}.parquet"
+    written = []
+    for (symbol, hour), group in frame.groupby(["symbol", "hour"], sort=True):
+        partition = partition_dir(lake_dir, symbol, int(hour))
+        partition.mkdir(parents=True, exist_ok=True)
+        path = partition / name
+        _write_atomic(_dedup(group.sort_values("ts", kind="stable").loc[:, list(SEGMENT_COLUMNS)]), path)
+        written.append(path)
+    return written
+
+
+def compact(
+    lake_dir: Path,
+    min_segments: int = 2,
+    target_bytes: int = COMPACT_TARGET_BYTES,
+) -> List[Path]:
+    """Merge the small segments of each partition into one file; returns the merged files.
+
+    The merged file takes the name of its first input with a ``-c`` suffix, so it keeps
+    its place in the write order, rows are stably sorted by ``ts`` and repeated trade ids
+    are dropped (a partition holds a single symbol). It is renamed
+    into place before the inputs are removed: a reader listing the partition in between
+    may see those trades twice, never zero times.
+    """
+    merged = []
+    for partition in sorted(lake_dir.glob("symbol=*/hour=*")):
+        small = [path for path in segment_paths(partition) if path.stat().st_size < target_bytes]
+        if len(small) < min_segments:
+            continue
+        frames = [pd.read_parquet(path) for path in small]
+        for part in frames:
+            if "trade_id" not in part:
+                part["trade_id"] = pd.NA  # segment written before trade ids were stored
+            part["trade_id"] = part["trade_id"].astype("Int64")
+        frame = pd.concat(frames, ignore_index=True)
+        frame = _dedup(frame.sort_values("ts", kind="stable").loc[:, list(SEGMENT_COLUMNS)])
+        stem = small[0].stem
+        path = partition / f"{stem if stem.endswith('-c') else stem + '-c'}.parquet"
+        _write_atomic(frame, path)
+        for old in small:
+            if old != path:
+                old.unlink()
+        merged.append(path)
+    return merged
+
+
+def scan_sql(
+    lake_dir: Path,
+    symbol: Optional[str] = None,
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
+) -> Optional[Tuple[str, List[object]]]:
+    """DuckDB query over the lake selecting ``trade_id, ts, price, qty, side, symbol, seq``.
+
+    ``seq`` orders trades that share a timestamp in write order; of a ``(symbol, trade_id)``
+    written more than once only the first copy is returned. The ``hour`` bounds let
+    DuckDB skip whole partitions and the ``ts`` bounds use the Parquet row-group stats.
+    Returns ``None`` when no segment matches ``symbol``.
+    """
+    symbol_dir = f"symbol={symbol.upper()}" if symbol is not None else "symbol=*"
+    if not any(lake_dir.glob(f"{symbol_dir}/hour=*/*.parquet")):
+        return None
+
+    pattern = (lake_dir / symbol_dir / "hour=*" / "*.parquet").as_posix().replace("'", "''")
+    filters: List[str] = []
+    params: List[object] = []
+    if start_ts is not None:
+        filters.extend(["hour >= ?", "ts >= ?"])
+        params.extend([start_ts // HOUR_MS, start_ts])
+    if end_ts is not None:
+        filters.extend(["hour <= ?", "ts <= ?"])
+        params.extend([end_ts // HOUR_MS, end_ts])
+    where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
+    query = f"""
+        SELECT trade_id, ts, price, qty, side, symbol, (filename, file_row_number) AS seq
+        FROM (
+            -- an empty typed row set, so trade_id exists even if no segment stores it yet
+            SELECT NULL::BIGINT AS trade_id WHERE false
+            UNION ALL BY NAME
+            SELECT * FROM read_parquet(
+                '{pattern}',
+                hive_partitioning = true,
+                hive_types = {{'symbol': VARCHAR, 'hour': BIGINT}},
+                union_by_name = true,
+                filename = true,
+                file_row_number = true
+            )
+        )
+        {where_clause}
+        QUALIFY trade_id IS NULL
+            OR row_number() OVER (PARTITION BY symbol, trade_id ORDER BY filename, file_row_number) = 1
+    """
+    return query, params
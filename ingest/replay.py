@@ -1,42 +1,204 @@
+import argparse
 import redis
 import duckdb
 import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from ingest.lake import scan_sql
+from ingest.wire import BINARY_FIELD, WIRE_FORMATS, pack_trades
 
 # connect to Redis (running in Docker on localhost:6379)
 r = redis.Redis(host="localhost",port=6379,decode_responses=True)
-STREAM = "trades:btcusdt"
+DEFAULT_SYMBOL = "btcusdt" # the store holds many pairs; a replay always sends exactly one
+STREAM = f"trades:{DEFAULT_SYMBOL}"
+
+# connect to duckdb read-only on first use, so a replay never blocks the ingest writer
+DB_PATH = "storage/trades.db"
+con = None
+
+CHUNK_SIZE = 10_000 # rows pulled from DuckDB per fetchmany
+BATCH_SIZE = 500 # XADDs sent per pipeline round trip
+
+
+@dataclass
+class ReplayReport:
+  """Throughput and pacing summary printed at the end of a replay."""
+
+  rows: int = 0
+  batches: int = 0
+  elapsed: float = 0.0
+  data_span: float = 0.0 # seconds between the first and last replayed trade
+  max_lag: float = 0.0 # worst delay behind the pacing schedule, in seconds
+  total_lag: float = 0.0
+
+  @property
+  def rate(self):
+    return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+  @property
+  def mean_lag(self):
+    return self.total_lag / self.rows if self.rows else 0.0
+
+  def summary(self):
+    speedup = self.data_span / self.elapsed if self.elapsed > 0 else 0.0
+    return (
+      f"[Replay] {self.rows:,} trades in {self.elapsed:.2f}s ({self.rate:,.0f} trades/s, "
+      f"{speedup:,.1f}x real time) over {self.batches:,} pipelines; "
+      f"lag behind schedule mean={self.mean_lag * 1000:.1f}ms max={self.max_lag * 1000:.1f}ms"
+    )
+
+
+def connection():
+  global con
+  if con is None:
+    con = duckdb.connect(DB_PATH, read_only=True)
+  return con
+
 
-# connect to duckdb
-con = duckdb.connect("storage/trades.db")
+def stream_rows(start_ts, end_ts, symbol=DEFAULT_SYMBOL, chunk_size=CHUNK_SIZE, lake_dir=None):
+  """Yield one symbol's (ts, price, qty, side) rows in ts order, holding at most one chunk in memory.
 
-def replay(start_ts, end_ts, delay=0.05): # explain
+  Trades sharing a ts keep their insertion order (rowid, or seq in the lake), so repeated
+  replays of the same range send the same sequence.
+
+  With lake_dir the rows are scanned from the Parquet trade lake (ingest/lake.py), reading
+  only the hour partitions that overlap [start_ts, end_ts].
+  """
+  if lake_dir is not None:
+    scan = scan_sql(Path(lake_dir), symbol, start_ts, end_ts)
+    if scan is None:
+      return
+    lake_query, params = scan
+    cursor = duckdb.connect(":memory:").execute(
+      f"SELECT ts, price, qty, side FROM ({lake_query}) ORDER BY ts, seq", params
+    )
+  else:
+    query = """
+    SELECT ts, price::DOUBLE, qty::DOUBLE, side::VARCHAR FROM trades
+                      WHERE ts BETWEEN ? AND ?
+                      AND symbol = ?
+                      ORDER BY ts, rowid
+                      """
+    cursor = connection().execute(query, [start_ts, end_ts, symbol.upper()])
+
+  while True:
+    rows = cursor.fetchmany(chunk_size)
+    if not rows:
+      return
+    yield from rows
+
+
+def replay(
+  start_ts,
+  end_ts,
+  delay=None,
+  speed=0.0,
+  symbol=DEFAULT_SYMBOL,
+  batch_size=BATCH_SIZE,
+  chunk_size=CHUNK_SIZE,
+  lake_dir=None,
+  wire="text",
+  verbose=False,
+):
   """
   Replay trades between [start_ts, end_ts] into redis
-  delay = sleep between trades, in seconds, to simulate real-time ingestion
+  speed = pacing: 0 sends as fast as possible, 1 reproduces the real gaps between trade
+          timestamps, N replays N times faster than real time
+  delay = fixed sleep between trades, in seconds (overrides speed)
+  symbol = the pair to replay, into trades:<symbol>
+  lake_dir = read from the Parquet trade lake instead of storage/trades.db
+  wire = "text" sends one string-field entry per trade; "binary" packs the trades of each
+         pipeline flush into one entry (see ingest/wire.py)
   """
+  stream = f"trades:{symbol.lower()}"
+  report = ReplayReport()
+  pipe = r.pipeline(transaction=False)
+  pending = 0
+  packed = [] # binary wire: trades waiting to be packed into one entry at the next flush
+
+  def flush():
+    nonlocal pipe, pending
+    if packed:
+      pipe.xadd(stream, {BINARY_FIELD: pack_trades(packed)})
+      packed.clear()
+    if pending:
+      pipe.execute()
+      report.batches += 1
+      pipe = r.pipeline(transaction=False)
+      pending = 0
 
-  row = con.execute("""
-  SELECT ts, price, qty, side FROM trades
-                    WHERE ts BETWEEN ? AND ?
-                    ORDER BY ts
-                    """, [start_ts, end_ts]).fetchall()
-  
-  for ts, price, qty, side in row:
+  started = time.perf_counter()
+  first_ts = last_ts = None
+  paced = bool(delay) or speed > 0
+  for i, (ts, price, qty, side) in enumerate(stream_rows(start_ts, end_ts, symbol, chunk_size, lake_dir)):
     event = {
       "ts": int(ts),
       "price": float(price),
       "qty": float(qty),
       "side": side,
     }
+    if first_ts is None:
+      first_ts = event["ts"]
+    last_ts = event["ts"]
 
-    # redis streams store string values; convert to str while keeping JSON-friendly types
-    r.xadd(STREAM, {k: str(v) for k, v in event.items()})
-    print("[Replay]", event)
-    time.sleep(delay) # wait a bit before sending the next trade, to simulate real-time
+    if paced:
+      # when this trade is due, relative to the start of the replay
+      offset = i * delay if delay else (event["ts"] - first_ts) / 1000 / speed
+      wait = started + offset - time.perf_counter()
+      if wait > 0:
+        flush() # send what is due before sleeping so nothing waits in the pipeline
+        time.sleep(wait)
+      else:
+        report.max_lag = max(report.max_lag, -wait)
+        report.total_lag += -wait
 
+    if wire == "binary":
+      packed.append(event)
+    else:
+      # redis streams store string values; convert to str while keeping JSON-friendly types
+      pipe.xadd(stream, {k: str(v) for k, v in event.items()})
+    pending += 1
+    report.rows += 1
+    if verbose:
+      print("[Replay]", event)
+    if pending >= batch_size:
+      flush()
 
-if __name__ == "__main__":
-  # Ex: replay the last 1 min of trades
+  flush()
+  report.elapsed = time.perf_counter() - started
+  if first_ts is not None:
+    report.data_span = (last_ts - first_ts) / 1000
+  print(report.summary())
+  return report
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="Replay stored trades into Redis")
   now = int(time.time() * 1000) # current time in ms
-  one_min_ago = now - 60_000
-  replay(one_min_ago, now) # replay last 1 min of trades
+  parser.add_argument("--start-ts", type=int, default=now - 60_000, help="Start timestamp (ms), default 1 min ago")
+  parser.add_argument("--end-ts", type=int, default=now, help="End timestamp (ms), default now")
+  parser.add_argument(
+    "--speed", type=float, default=1.0, help="0 = as fast as possible, 1 = real time, N = N times real time"
+  )
+  parser.add_argument("--symbol", default=DEFAULT_SYMBOL, help="Pair to replay, into trades:<symbol>")
+  parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="XADDs per pipeline")
+  parser.add_argument("--lake", type=Path, default=None, help="Replay from this Parquet trade lake instead of DuckDB")
+  parser.add_argument("--wire", choices=WIRE_FORMATS, default="text", help="Redis entry format (binary packs each pipeline)")
+  parser.add_argument("--verbose", action="store_true", help="Print every replayed trade")
+  return parser.parse_args()
+
+
+if __name__ == "__main__":
+  # Ex: replay the last 1 min of trades at 10x: python3 -m ingest.replay --speed 10
+  args = parse_args()
+  replay(
+    args.start_ts,
+    args.end_ts,
+    speed=args.speed,
+    symbol=args.symbol,
+    batch_size=args.batch_size,
+    lake_dir=args.lake,
+    wire=args.wire,
+    verbose=args.verbose,
+  )
@@ -0,0 +1,253 @@
+"""Bounded Redis stream retention that only trims what the durable store already holds.
+
+A ``RetentionPolicy`` caps the streams matching a pattern by length (``maxlen``) and/or
+by age (``max_age_ms``, judged by the entry id's millisecond part). Each pass walks the
+entries the policy would drop, oldest first, and stops at the first one whose trades are
+newer than the durable store's watermark for that symbol (DuckDB or the Parquet lake),
+then trims with ``XTRIM MINID`` up to there. Memory reclaimed is measured with
+``MEMORY USAGE`` before and after.
+
+Readers that were behind the trim point lost entries they never saw;
+``trimmed_past`` tells them so, and they can reload that range from the durable store.
+
+    python3 -m ingest.retention --policy 'trades:*=1000000,6h' --policy 'features:*=2h' --lake storage/lake
+"""
+from __future__ import annotations
+
+import argparse
+import fnmatch
+import re
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import duckdb
+
+from ingest.lake import scan_sql
+from ingest.wire import decode_entry
+
+SCAN_LIMIT = 10_000  # entries inspected per stream and pass; later passes continue
+RETENTION_INTERVAL = 30.0
+_AGE_UNITS = {"ms": 1, "s": 1000, "m": 60_000, "h": 3_600_000, "d": 86_400_000}
+
+Watermark = Callable[[str], Optional[int]]
+
+
+@dataclass
+class RetentionPolicy:
+    """Limits for every stream whose name matches ``pattern`` (fnmatch, e.g. ``trades:*``)."""
+
+    pattern: str
+    maxlen: Optional[int] = None
+    max_age_ms: Optional[int] = None
+    approximate: bool = True  # "~" trims whole radix-tree nodes: cheaper, never past the target
+
+    def matches(self, stream: str) -> bool:
+        return fnmatch.fnmatchcase(stream, self.pattern)
+
+
+def parse_policy(text: str) -> RetentionPolicy:
+    """``PATTERN=LIMIT[,LIMIT]`` where a limit is an entry count or an age like ``90s``/``6h``/``2d``."""
+    pattern, sep, limits = text.partition("=")
+    if not sep or not pattern or not limits:
+        raise ValueError(f"Retention policy must look like 'trades:*=1000000,6h', got {text!r}")
+    policy = RetentionPolicy(pattern)
+    for limit in limits.split(","):
+        match = re.fullmatch(r"(\d+)(ms|s|m|h|d)?", limit.strip())
+        if not match:
+            raise ValueError(f"Bad retention limit {limit!r} in {text!r}")
+        value, unit = int(match.group(1)), match.group(2)
+        if unit is None:
+            policy.maxlen = value
+        else:
+            policy.max_age_ms = value * _AGE_UNITS[unit]
+    return policy
+
+
+@dataclass
+class TrimReport:
+    stream: str
+    trimmed: int = 0
+    held_back: int = 0  # entries past the limit that are kept because they are not persisted yet
+    bytes_before: int = 0
+    bytes_after: int = 0
+
+    @property
+    def reclaimed(self) -> int:
+        return max(self.bytes_before - self.bytes_after, 0)
+
+    def summary(self) -> str:
+        text = f"[retention] {self.stream}: trimmed {self.trimmed:,} entries, reclaimed {self.reclaimed / 1e6:,.2f} MB"
+        if self.held_back:
+            text += f", {self.held_back:,} over the limit kept until persisted"
+        return text
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def id_key(message_id) -> Tuple[int, int]:
+    ms, _, seq = _text(message_id).partition("-")
+    return int(ms), int(seq or 0)
+
+
+def stream_symbol(stream: str) -> str:
+    """``trades:btcusdt`` -> ``BTCUSDT``."""
+    return stream.rsplit(":", 1)[-1].upper()
+
+
+def entry_ts(fields) -> Optional[int]:
+    """Newest trade timestamp carried by an entry (text or packed), None if it has none."""
+    stamps = [int(record["ts"]) for record in decode_entry(fields) if "ts" in record]
+    return max(stamps) if stamps else None
+
+
+def trim_stream(
+    client,
+    stream: str,
+    policy: RetentionPolicy,
+    persisted_ts: Optional[int],
+    now_ms: Optional[int] = None,
+    scan_limit: int = SCAN_LIMIT,
+) -> TrimReport:
+    """Trim ``stream`` to ``policy``, but never past an entry newer than ``persisted_ts``."""
+    report = TrimReport(stream)
+    candidates: Sequence = []
+    if policy.maxlen is not None:
+        excess = client.xlen(stream) - policy.maxlen
+        if excess > 0:
+            candidates = client.xrange(stream, "-", "+", count=min(excess, scan_limit))
+    if policy.max_age_ms is not None:
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        aged = client.xrange(stream, "-", f"({now_ms - policy.max_age_ms}-0", count=scan_limit)
+        if len(aged) > len(candidates):  # both ranges start at the first entry
+            candidates = aged
+    if not candidates:
+        return report
+
+    persisted = 0
+    if persisted_ts is not None:
+        for _message_id, fields in candidates:
+            ts = entry_ts(fields)
+            if ts is None or ts > persisted_ts:
+                break
+            persisted += 1
+    report.held_back = len(candidates) - persisted
+    if not persisted:
+        return report
+
+    ms, seq = id_key(candidates[persisted - 1][0])
+    report.bytes_before = client.memory_usage(stream) or 0
+    report.trimmed = client.xtrim(stream, minid=f"{ms}-{seq + 1}", approximate=policy.approximate)
+    report.bytes_after = client.memory_usage(stream) or 0
+    return report
+
+
+class Retention:
+    """Applies the first matching policy to each stream, using ``watermark(stream)``.
+
+    ``watermark`` returns the newest trade timestamp the durable store holds for the
+    stream's symbol, or None when unknown (nothing is trimmed then).
+    """
+
+    def __init__(self, client, policies: Iterable[RetentionPolicy], watermark: Watermark, scan_limit: int = SCAN_LIMIT):
+        self.client = client
+        self.policies = list(policies)
+        self.watermark = watermark
+        self.scan_limit = scan_limit
+
+    def policy_for(self, stream: str) -> Optional[RetentionPolicy]:
+        return next((policy for policy in self.policies if policy.matches(stream)), None)
+
+    def streams(self) -> List[str]:
+        names = (_text(name) for name in self.client.scan_iter(_type="STREAM"))
+        return sorted(name for name in names if self.policy_for(name) is not None)
+
+    def run_once(self, streams: Optional[Iterable[str]] = None, now_ms: Optional[int] = None) -> List[TrimReport]:
+        reports = []
+        for stream in self.streams() if streams is None else streams:
+            policy = self.policy_for(stream)
+            if policy is None:
+                continue
+            reports.append(
+                trim_stream(self.client, stream, policy, self.watermark(stream), now_ms=now_ms, scan_limit=self.scan_limit)
+            )
+        return reports
+
+
+def store_watermark(db_path: Optional[Path] = None, lake_dir: Optional[Path] = None) -> Watermark:
+    """Watermark read from the DuckDB trade table or the Parquet lake.
+
+    DuckDB allows no readers next to a writing process, so while ``ingest`` writes to
+    ``trades.db`` run retention inside ingest (``--retain``) or use the lake.
+    """
+
+    def watermark(stream: str) -> Optional[int]:
+        symbol = stream_symbol(stream)
+        if lake_dir is not None:
+            scan = scan_sql(lake_dir, symbol)
+            if scan is None:
+                return None
+            query, params = scan
+            with duckdb.connect() as con:
+                return con.execute(f"SELECT max(ts) FROM ({query})", params).fetchone()[0]
+        if db_path is None or not db_path.exists():
+            return None
+        with duckdb.connect(db_path.as_posix(), read_only=True) as con:
+            return con.execute("SELECT max(ts) FROM trades WHERE symbol = ?", [symbol]).fetchone()[0]
+
+    return watermark
+
+
+def trimmed_past(client, stream: str, last_id) -> Optional[Tuple[str, Dict]]:
+    """The stream's first entry if it is newer than ``last_id``, else None.
+
+    A reader whose last entry is older than the first one still in the stream may have
+    lost the entries in between to trimming; it should reload trades with timestamps
+    between its last one and this entry's from the durable store.
+    """
+    first = client.xrange(stream, "-", "+", count=1)
+    if not first or id_key(first[0][0]) <= id_key(last_id):
+        return None
+    message_id, fields = first[0]
+    return _text(message_id), fields
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Trim Redis streams once their trades are persisted")
+    parser.add_argument(
+        "--policy",
+        action="append",
+        required=True,
+        help="PATTERN=LIMIT[,LIMIT], e.g. 'trades:*=1000000,6h' (count and/or age in ms/s/m/h/d)",
+    )
+    parser.add_argument("--lake", type=Path, default=None, help="Parquet trade lake holding the persisted trades")
+    parser.add_argument("--db", type=Path, default=Path("storage/trades.db"), help="DuckDB trade store (without --lake)")
+    parser.add_argument("--interval", type=float, default=RETENTION_INTERVAL, help="Seconds between passes (0 = once)")
+    parser.add_argument("--redis-url", default="redis://localhost:6379", help="Redis to trim")
+    return parser.parse_args()
+
+
+def main() -> None:
+    import redis
+
+    args = parse_args()
+    client = redis.Redis.from_url(args.redis_url, decode_responses=False)
+    retention = Retention(
+        client,
+        [parse_policy(text) for text in args.policy],
+        store_watermark(db_path=None if args.lake else args.db, lake_dir=args.lake),
+    )
+    while True:
+        for report in retention.run_once():
+            if report.trimmed or report.held_back:
+                print(report.summary())
+        if not args.interval:
+            return
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Versioned DuckDB schema for the trade store, and the migration CLI.
+
+Version 2 keys every trade by its Binance trade id, stores ``side`` as a one-byte ENUM
+and can keep ``price``/``qty`` as DECIMAL (a scaled 128-bit integer) instead of DOUBLE. Rows are
+appended in ``ts`` order so DuckDB's per-row-group min/max (zonemaps) let range
+queries skip most of the table. Readers cast back to ``DOUBLE``/``VARCHAR`` and see the
+same logical rows as with version 1.
+
+    python3 -m ingest.schema storage/trades.db [--decimal]
+"""
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import Optional
+
+import duckdb
+
+SCHEMA_VERSION = 2
+SIDES = ("buy", "sell")
+DECIMAL_TYPE = "DECIMAL(38, 8)"  # Binance quotes at most 8 decimals; 18 digits would cap qty below 1e10 (SHIB, PEPE)
+
+
+def table_exists(con: duckdb.DuckDBPyConnection, name: str) -> bool:
+    return bool(
+        con.execute("SELECT count(*) FROM information_schema.tables WHERE table_name = ?", [name]).fetchone()[0]
+    )
+
+
+def schema_version(con: duckdb.DuckDBPyConnection) -> Optional[int]:
+    """Version of the trade store, 1 for tables created before versioning, None if empty."""
+    if table_exists(con, "schema_version"):
+        return con.execute("SELECT max(version) FROM schema_version").fetchone()[0]
+    return 1 if table_exists(con, "trades") else None
+
+
+def create_trades_table(con: duckdb.DuckDBPyConnection, name: str = "trades", decimal: bool = False) -> None:
+    number = DECIMAL_TYPE if decimal else "DOUBLE"
+    sides = ", ".join(f"'{side}'" for side in SIDES)
+    con.execute(f"CREATE TYPE IF NOT EXISTS trade_side AS ENUM ({sides})")
+    con.execute(
+        f"""
+        CREATE TABLE {name} (
+            trade_id BIGINT,
+            ts BIGINT,
+            price {number},
+            qty {number},
+            side trade_side,
+            symbol VARCHAR
+        )
+        """
+    )
+
+
+def _record_version(con: duckdb.DuckDBPyConnection) -> None:
+    con.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER)")
+    con.execute("DELETE FROM schema_version")
+    con.execute("INSERT INTO schema_version VALUES (?)", [SCHEMA_VERSION])
+
+
+def migrate(con: duckdb.DuckDBPyConnection, decimal: bool = False) -> int:
+    """Bring the store up to ``SCHEMA_VERSION`` in one transaction; returns the old version.
+
+    Version 1 rows are copied in ``(ts, rowid)`` order with a NULL trade id (it was never
+    stored); a missing ``symbol`` column means the rows were all BTCUSDT. An empty
+    database just gets the current schema.
+    """
+    version = schema_version(con)
+    if version == SCHEMA_VERSION:
+        return version
+    if version is not None and version > SCHEMA_VERSION:
+        raise ValueError(f"Trade store is at schema version {version}, newer than {SCHEMA_VERSION}")
+
+    con.execute("BEGIN TRANSACTION")
+    try:
+        if version is None:
+            create_trades_table(con, decimal=decimal)
+        else:
+            columns = {row[1] for row in con.execute("PRAGMA table_info('trades')").fetchall()}
+            symbol = "symbol" if "symbol" in columns else "'BTCUSDT'"
+            con.execute("ALTER TABLE trades RENAME TO trades_v1")
+            create_trades_table(con, decimal=decimal)
+            con.execute(
+                f"""
+                INSERT INTO trades (trade_id, ts, price, qty, side, symbol)
+                SELECT NULL, ts, price, qty, side, {symbol} FROM trades_v1 ORDER BY ts, rowid
+                """
+            )
+            con.execute("DROP TABLE trades_v1")
+        _record_version(con)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return version
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Create or migrate the DuckDB trade store to the current schema")
+    parser.add_argument("db", type=Path, nargs="?", default=Path("storage/trades.db"), help="Path to trades.db")
+    parser.add_argument(
+        "--decimal", action="store_true", help="Store price/qty as DECIMAL(38, 8) scaled integers instead of DOUBLE"
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    with duckdb.connect(args.db.as_posix()) as con:
+        old = migrate(con, decimal=args.decimal)
+        rows = con.execute("SELECT count(*) FROM trades").fetchone()[0]
+    if old == SCHEMA_VERSION:
+        print(f"✅ {args.db} is already at schema version {SCHEMA_VERSION}")
+    else:
+        print(f"✅ Migrated {args.db} from schema version {old or 0} to {SCHEMA_VERSION} ({rows:,} trades)")
+
+
+if __name__ == "__main__":
+    main()
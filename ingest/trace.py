@@ -0,0 +1,63 @@
+"""Compact per-trade stage timestamps carried through the Redis streams.
+
+A sampled trade carries a ``trace`` field: comma-separated microsecond offsets from its
+trade time ``ts`` for the stages in ``STAGES`` order, empty where a stage was not
+recorded, e.g. ``"900,2350"`` (Binance event time 0.9 ms and ingest receive 2.35 ms
+after the trade). The Redis append time is the entry id's millisecond part, so readers
+fill it in from the id; the processor writes it explicitly when it republishes a trace
+on ``features:<symbol>``, and the forecast service adds ``send`` when it is measured.
+
+Packed binary entries keep their fixed-size records and put the traces of their sampled
+records in a separate ``trace`` field (see ``ingest.wire``).
+"""
+from __future__ import annotations
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+STAGES = ("exchange", "ingest", "redis", "processor", "send")
+TRACE_FIELD = "trace"
+
+
+def now_us() -> int:
+    return time.time_ns() // 1000
+
+
+def sampled(trade_id, every: int) -> bool:
+    """Trace one trade in ``every`` (by trade id, so every component agrees); 0 disables."""
+    return bool(every) and int(trade_id) % every == 0
+
+
+def encode(stages: Dict[str, int], ts: int) -> str:
+    """Absolute stage times (µs since the epoch) -> offsets from ``ts`` (ms)."""
+    base = int(ts) * 1000
+    offsets = [str(stages[stage] - base) if stages.get(stage) is not None else "" for stage in STAGES]
+    while offsets and not offsets[-1]:
+        offsets.pop()
+    return ",".join(offsets)
+
+
+def parse(trace: str, ts: int) -> Dict[str, int]:
+    """Offsets from ``encode`` -> absolute stage times (µs since the epoch)."""
+    base = int(ts) * 1000
+    return {stage: base + int(offset) for stage, offset in zip(STAGES, trace.split(",")) if offset}
+
+
+def stamp(trace: Optional[str], ts: int, **stages: Optional[int]) -> str:
+    """Add (or overwrite) stage times in a trace string."""
+    times = parse(trace, ts) if trace else {}
+    times.update({stage: at for stage, at in stages.items() if at is not None})
+    return encode(times, ts)
+
+
+def id_us(message_id) -> int:
+    """Redis append time of an entry: its id's millisecond part, in µs."""
+    if isinstance(message_id, bytes):
+        message_id = message_id.decode()
+    return int(message_id.partition("-")[0]) * 1000
+
+
+def hops(stages: Dict[str, int]) -> List[Tuple[str, int]]:
+    """``("exchange->ingest", µs)`` pairs between consecutive recorded stages."""
+    present = [stage for stage in STAGES if stage in stages]
+    return [(f"{a}->{b}", stages[b] - stages[a]) for a, b in zip(present, present[1:])]
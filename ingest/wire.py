@@ -0,0 +1,135 @@
+"""Redis stream payload formats.
+
+``text`` entries are the original one-trade-per-entry string fields
+(``ts``/``price``/``qty``/``side``, plus ``trade_id`` from ingest). ``binary`` entries
+carry a single ``bin`` field holding a packed batch: a version byte and a record count,
+followed by fixed-size little-endian records. Version 1 records are trades, version 2
+records are feature rows (column names once, then one float64 per column per row).
+
+Sampled records may carry a ``trace`` (``ingest.trace``): a string field on text entries,
+and on binary entries a separate ``trace`` field of ``index:trace`` pairs joined by ``;``.
+
+Binary values are not UTF-8, so readers must use a client with
+``decode_responses=False``; ``decode_entry`` accepts both formats and both ``str`` and
+``bytes`` fields, which lets producers switch formats without a coordinated restart.
+"""
+from __future__ import annotations
+
+import struct
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Union
+
+from ingest.trace import TRACE_FIELD
+
+WIRE_FORMATS = ("text", "binary")
+BINARY_FIELD = "bin"
+TRADE_VERSION = 1
+FEATURE_VERSION = 2
+
+_HEADER = struct.Struct("<BI")  # version, record count
+_TRADE = struct.Struct("<qqddB")  # trade_id (-1 if unknown), ts, price, qty, side (0 buy, 1 sell)
+_NAMES = struct.Struct("<H")  # byte length of the feature column names
+_NAME_SEP = "\x1f"
+_TEXT_TYPES = {"ts": int, "trade_id": int, "price": float, "qty": float}
+
+Fields = Mapping[Union[str, bytes], Union[str, bytes]]
+
+
+def _text(value: Union[str, bytes]) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def pack_trades(events: Iterable[Mapping[str, object]]) -> bytes:
+    """Pack normalized trade events (``ts``, ``price``, ``qty``, ``side``[, ``trade_id``])."""
+    records = [
+        _TRADE.pack(
+            int(e.get("trade_id", -1)),
+            int(e["ts"]),
+            float(e["price"]),
+            float(e["qty"]),
+            e["side"] == "sell",
+        )
+        for e in events
+    ]
+    return _HEADER.pack(TRADE_VERSION, len(records)) + b"".join(records)
+
+
+def pack_features(rows: Sequence[Mapping[str, float]]) -> bytes:
+    """Pack feature rows sharing the same columns (the first row's, in its order, minus ``trace``)."""
+    columns = [col for col in rows[0] if col != TRACE_FIELD] if rows else []
+    names = _NAME_SEP.join(columns).encode()
+    values = struct.pack(f"<{len(columns) * len(rows)}d", *(float(row[col]) for row in rows for col in columns))
+    return _HEADER.pack(FEATURE_VERSION, len(rows)) + _NAMES.pack(len(names)) + names + values
+
+
+def pack_traces(records: Sequence[Mapping[str, object]]) -> Optional[str]:
+    """The ``trace`` field of a packed entry, or None when none of its records is traced."""
+    traces = [f"{i}:{record[TRACE_FIELD]}" for i, record in enumerate(records) if record.get(TRACE_FIELD)]
+    return ";".join(traces) or None
+
+
+def _unpack_trades(data: bytes, count: int) -> List[Dict[str, object]]:
+    trades = []
+    for trade_id, ts, price, qty, sell in _TRADE.iter_unpack(data[_HEADER.size : _HEADER.size + count * _TRADE.size]):
+        event: Dict[str, object] = {"ts": ts, "price": price, "qty": qty, "side": "sell" if sell else "buy"}
+        if trade_id >= 0:
+            event["trade_id"] = trade_id
+        trades.append(event)
+    return trades
+
+
+def _unpack_features(data: bytes, count: int) -> List[Dict[str, object]]:
+    offset = _HEADER.size
+    (length,) = _NAMES.unpack_from(data, offset)
+    offset += _NAMES.size
+    columns = data[offset : offset + length].decode().split(_NAME_SEP) if length else []
+    offset += length
+    values = struct.unpack_from(f"<{len(columns) * count}d", data, offset)
+    rows = []
+    for i in range(count):
+        row: Dict[str, object] = dict(zip(columns, values[i * len(columns) : (i + 1) * len(columns)]))
+        if "ts" in row:
+            row["ts"] = int(row["ts"])
+        rows.append(row)
+    return rows
+
+
+def unpack(data: bytes) -> List[Dict[str, object]]:
+    version, count = _HEADER.unpack_from(data)
+    if version == TRADE_VERSION:
+        return _unpack_trades(data, count)
+    if version == FEATURE_VERSION:
+        return _unpack_features(data, count)
+    raise ValueError(f"Unknown binary stream payload version {version}")
+
+
+def decode_entry(fields: Fields) -> List[Dict[str, object]]:
+    """Records carried by one stream entry, in order; empty for a trimmed (empty) entry.
+
+    Text entries yield one record with ``ts``/``trade_id`` as ints, ``price``/``qty`` as
+    floats and every other field as a string.
+    """
+    if not fields:
+        return []
+    packed = fields.get(BINARY_FIELD, fields.get(BINARY_FIELD.encode()))
+    if packed is not None:
+        if not isinstance(packed, bytes):
+            raise TypeError("Binary stream entries must be read with decode_responses=False")
+        records = unpack(packed)
+        traces = fields.get(TRACE_FIELD, fields.get(TRACE_FIELD.encode()))
+        if traces:
+            for item in _text(traces).split(";"):
+                index, _, trace = item.partition(":")
+                records[int(index)][TRACE_FIELD] = trace
+        return records
+    record: Dict[str, object] = {}
+    for key, value in fields.items():
+        key = _text(key)
+        convert = _TEXT_TYPES.get(key)
+        record[key] = convert(value) if convert is not None else _text(value)
+    return [record]
+
+
+def record_id(message_id: Union[str, bytes], index: int, count: int) -> str:
+    """Id of the ``index``-th of ``count`` records in an entry: the entry id, suffixed in batches."""
+    message_id = _text(message_id)
+    return message_id if count == 1 else f"{message_id}.{index}"
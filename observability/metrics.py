@@ -0,0 +1,146 @@
+"""Prometheus metrics shared by ingest, the processor and the forecast service.
+
+Two kinds of instrumentation keep the hot paths cheap:
+
+* counters and gauges the components already keep (trades received and written, queue
+  depths, connected clients, consumer lag) are read only when ``/metrics`` is scraped,
+  through ``register_probe`` callbacks, and cost nothing in between;
+* the few timings that have to be measured inline (sink write latency, processor batch
+  size and per-event compute time, predict latency) are histograms that callers only
+  observe behind ``if metrics.ENABLED:``, a single module attribute check when disabled.
+
+``ENABLED`` starts from the ``METRICS_ENABLED`` environment variable; the standalone
+workers turn it on with ``--metrics-port``, which also serves ``REGISTRY`` over HTTP.
+"""
+from __future__ import annotations
+
+import os
+from typing import Callable, Dict, Iterable, Optional, Union
+
+import redis
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Histogram, generate_latest, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, Metric
+
+ENABLED = os.environ.get("METRICS_ENABLED", "").lower() not in ("", "0", "false", "no")
+REGISTRY = CollectorRegistry()
+
+_LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+_EVENT_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 5e-3)
+
+SINK_WRITE_SECONDS = Histogram(
+    "ingest_sink_write_seconds", "Time to write one micro-batch to a sink", ["sink"],
+    buckets=_LATENCY_BUCKETS, registry=REGISTRY,
+)
+PROCESSOR_READ_ENTRIES = Histogram(
+    "processor_read_batch_entries", "Stream entries per XREADGROUP batch handled by the processor",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000), registry=REGISTRY,
+)
+PROCESSOR_EVENT_SECONDS = Histogram(
+    "processor_event_compute_seconds", "Feature compute time per trade, averaged over each batch",
+    buckets=_EVENT_BUCKETS, registry=REGISTRY,
+)
+PREDICT_SECONDS = Histogram(
+    "forecast_predict_seconds", "Time of one predict_batch call in the forecast service",
+    buckets=_LATENCY_BUCKETS, registry=REGISTRY,
+)
+# traces are sampled upstream (ingest --trace-every), so this one is observed whenever one arrives
+TRACE_HOP_SECONDS = Histogram(
+    "trace_hop_seconds", "Latency between consecutive stages of traced trades", ["hop"],
+    buckets=_LATENCY_BUCKETS + (5.0, 10.0), registry=REGISTRY,
+)
+
+
+def enable(port: Optional[int] = None) -> None:
+    """Turn on the inline histograms and, with ``port``, serve ``REGISTRY`` on it."""
+    global ENABLED
+    ENABLED = True
+    if port:
+        start_http_server(port, registry=REGISTRY)
+
+
+class _Probe:
+    """Collector whose metric families are computed by a callback at scrape time."""
+
+    def __init__(self, collect: Callable[[], Iterable[Metric]]):
+        self._collect = collect
+
+    def collect(self):
+        return list(self._collect())
+
+    def describe(self):
+        # no names up front: the registry would otherwise call collect() (and Redis) on register
+        return []
+
+
+_probes: Dict[str, _Probe] = {}
+
+
+def register_probe(name: str, collect: Callable[[], Iterable[Metric]]) -> None:
+    """Register (or replace) the scrape-time callback known as ``name``."""
+    unregister_probe(name)
+    _probes[name] = _Probe(collect)
+    REGISTRY.register(_probes[name])
+
+
+def unregister_probe(name: str) -> None:
+    probe = _probes.pop(name, None)
+    if probe is not None:
+        REGISTRY.unregister(probe)
+
+
+def render() -> tuple:
+    """``(body, content_type)`` of the Prometheus text exposition for ``REGISTRY``."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def gauge(name: str, documentation: str, values: Dict[tuple, float], labels=()) -> GaugeMetricFamily:
+    family = GaugeMetricFamily(name, documentation, labels=list(labels))
+    for label_values, value in values.items():
+        family.add_metric(list(label_values), value)
+    return family
+
+
+def _text(value: Union[str, bytes]) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def id_lag_seconds(tail_id, last_id) -> float:
+    """Seconds between two stream ids' millisecond parts (a reader's position vs the tail)."""
+    tail_ms = int(_text(tail_id).partition("-")[0])
+    last_ms = int(_text(last_id).partition("-")[0])
+    return max(tail_ms - last_ms, 0) / 1000
+
+
+def stream_tail(client, stream: str) -> Optional[tuple]:
+    """``(length, last generated id)`` of a stream, None if it does not exist."""
+    try:
+        info = client.xinfo_stream(stream)
+    except redis.ResponseError:  # no such key
+        return None
+    return info["length"], _text(info["last-generated-id"])
+
+
+def group_lag(client, streams: Iterable[str]) -> Iterable[Metric]:
+    """Stream length plus, per consumer group, lag behind the tail in entries and in seconds.
+
+    Entry lag is Redis' own ``lag`` (7.0+; absent when it cannot be computed). Seconds
+    compare the group's last-delivered id with the last generated id.
+    """
+    length = GaugeMetricFamily("redis_stream_length", "Entries in the stream", labels=["stream"])
+    entries = GaugeMetricFamily(
+        "redis_stream_group_lag_entries", "Entries not yet delivered to the group", labels=["stream", "group"]
+    )
+    seconds = GaugeMetricFamily(
+        "redis_stream_group_lag_seconds", "Stream tail minus the group's last-delivered id", labels=["stream", "group"]
+    )
+    for stream in streams:
+        tail = stream_tail(client, stream)
+        if tail is None:
+            continue
+        length.add_metric([stream], tail[0])
+        for group in client.xinfo_groups(stream):
+            labels = [stream, _text(group["name"])]
+            seconds.add_metric(labels, id_lag_seconds(tail[1], group["last-delivered-id"]))
+            if group.get("lag") is not None:
+                entries.add_metric(labels, group["lag"])
+    return [length, entries, seconds]
@@ -0,0 +1,224 @@
+"""Vectorized backtest of the direction model over a feature file.
+
+The bundle scores every bar in one ``predict_batch`` call, then a whole grid of
+(threshold, holding horizon) strategies is simulated with array operations over blocks
+of bars. Only the few values that cross a block boundary (the last ``horizon - 1``
+signals, the open position, equity and its peak) are carried, so memory stays bounded
+on long files while the data is still read once.
+
+Strategy: at each bar's close a signal is taken from ``prob_up`` (+1 at or above
+``threshold``, -1 at or below ``1 - threshold`` unless long-only, else 0) and held for
+``horizon`` bars as one of ``horizon`` overlapping tranches, so the position is the mean
+of the last ``horizon`` signals. It earns the next bar's close-to-close return and pays
+``fee_bps + slippage_bps`` on every unit of position change.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .predictor import PriceDirectionPredictor
+from .train_model import FEATURE_DIR, MODEL_DIR, load_features
+
+SECONDS_PER_YEAR = 365 * 86_400
+
+
+def next_returns(close: np.ndarray) -> np.ndarray:
+    """Return from each bar's close to the next one (0 for the last bar)."""
+    returns = np.zeros(len(close), dtype=np.float64)
+    returns[:-1] = close[1:] / close[:-1] - 1.0
+    return returns
+
+
+def bars_per_year(index: pd.Index) -> Optional[float]:
+    """Annualization factor from the median bar spacing of a DatetimeIndex."""
+    if not isinstance(index, pd.DatetimeIndex) or len(index) < 2:
+        return None
+    step = np.median(np.diff(index.values)) / np.timedelta64(1, "s")  # any datetime64 unit
+    return SECONDS_PER_YEAR / step if step > 0 else None
+
+
+def signals(prob_up: np.ndarray, thresholds: np.ndarray, long_only: bool = False) -> np.ndarray:
+    """(len(thresholds), len(prob_up)) array of -1/0/+1 entries."""
+    p = prob_up[np.newaxis, :]
+    t = thresholds[:, np.newaxis]
+    out = (p >= t).astype(np.float64)
+    if not long_only:
+        out -= p <= 1.0 - t
+    return out
+
+
+class GridBacktest:
+    """Accumulates every (threshold, horizon) strategy's statistics block by block."""
+
+    def __init__(
+        self,
+        thresholds: Sequence[float],
+        horizons: Sequence[int],
+        cost_bps: float = 0.0,
+        long_only: bool = False,
+        periods_per_year: Optional[float] = None,
+    ):
+        self.thresholds = np.asarray(thresholds, dtype=np.float64)
+        self.horizons = [int(h) for h in horizons]
+        if min(self.horizons) < 1:
+            raise ValueError("holding horizons must be at least one bar")
+        self.cost = cost_bps / 10_000
+        self.long_only = long_only
+        self.periods_per_year = periods_per_year
+        k = len(self.thresholds)
+        self.bars = 0
+        self._tail = np.zeros((k, max(self.horizons) - 1))  # last signals, for tranches still open
+        shape = (len(self.horizons), k)
+        self._position = np.zeros(shape)
+        self._equity = np.zeros(shape)  # cumulative (non-compounded) return
+        self._peak = np.zeros(shape)
+        self._drawdown = np.zeros(shape)
+        self._sum = np.zeros(shape)
+        self._sumsq = np.zeros(shape)
+        self._turnover = np.zeros(shape)
+        self._exposure = np.zeros(shape)
+        self._costs = np.zeros(shape)
+
+    def update(self, prob_up: np.ndarray, returns: np.ndarray) -> None:
+        """Advance every strategy over one block of bars."""
+        n = len(prob_up)
+        if n == 0:
+            return
+        sig = signals(np.asarray(prob_up, dtype=np.float64), self.thresholds, self.long_only)
+        history = np.concatenate([self._tail, sig], axis=1)
+        # running sums along time; a window sum is a difference of two of them
+        cumulative = np.concatenate([np.zeros((len(self.thresholds), 1)), np.cumsum(history, axis=1)], axis=1)
+        lead = self._tail.shape[1]
+        for i, h in enumerate(self.horizons):
+            position = (cumulative[:, lead + 1 : lead + n + 1] - cumulative[:, lead + 1 - h : lead + n + 1 - h]) / h
+            change = np.abs(np.diff(position, axis=1, prepend=self._position[i][:, np.newaxis]))
+            cost = change * self.cost
+            pnl = position * returns[np.newaxis, :] - cost
+            equity = self._equity[i][:, np.newaxis] + np.cumsum(pnl, axis=1)
+            peak = np.maximum(np.maximum.accumulate(equity, axis=1), self._peak[i][:, np.newaxis])
+            self._drawdown[i] = np.maximum(self._drawdown[i], (peak - equity).max(axis=1))
+            self._peak[i] = peak[:, -1]
+            self._equity[i] = equity[:, -1]
+            self._position[i] = position[:, -1]
+            self._sum[i] += pnl.sum(axis=1)
+            self._sumsq[i] += np.square(pnl).sum(axis=1)
+            self._turnover[i] += change.sum(axis=1)
+            self._exposure[i] += np.abs(position).sum(axis=1)
+            self._costs[i] += cost.sum(axis=1)
+        if lead:
+            self._tail = history[:, -lead:]
+        self.bars += n
+
+    def results(self) -> List[Dict[str, object]]:
+        """One row per strategy, best Sharpe first."""
+        n = max(self.bars, 1)
+        mean = self._sum / n
+        std = np.sqrt(np.maximum(self._sumsq / n - mean**2, 0.0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sharpe = np.where(std > 0, mean / std, 0.0) * np.sqrt(self.periods_per_year or 1.0)
+        rows = []
+        for i, horizon in enumerate(self.horizons):
+            for j, threshold in enumerate(self.thresholds.tolist()):
+                rows.append(
+                    {
+                        "threshold": threshold,
+                        "horizon": horizon,
+                        "pnl": float(self._sum[i, j]),
+                        "sharpe": float(sharpe[i, j]),
+                        "max_drawdown": float(self._drawdown[i, j]),
+                        "turnover": float(self._turnover[i, j]),
+                        "exposure": float(self._exposure[i, j] / n),
+                        "costs": float(self._costs[i, j]),
+                        "bars": self.bars,
+                    }
+                )
+        rows.sort(key=lambda row: row["sharpe"], reverse=True)
+        return rows
+
+
+def backtest(
+    features: pd.DataFrame,
+    predictor: PriceDirectionPredictor,
+    thresholds: Sequence[float],
+    horizons: Sequence[int],
+    fee_bps: float = 0.0,
+    slippage_bps: float = 0.0,
+    long_only: bool = False,
+    block_size: int = 200_000,
+    periods_per_year: Optional[float] = None,
+) -> List[Dict[str, object]]:
+    """Score ``features`` with ``predictor`` and backtest the strategy grid over it."""
+    if not predictor.feature_cols:
+        raise ValueError(f"No model bundle at {predictor.model_path}; train one with processor.train_model")
+    features = features.sort_index()
+    X = features.loc[:, list(predictor.feature_cols)].to_numpy(dtype=np.float64)
+    prob_up, _, _ = predictor.predict_batch(X)
+    returns = next_returns(features["price_close"].to_numpy(dtype=np.float64))
+
+    grid = GridBacktest(
+        thresholds,
+        horizons,
+        cost_bps=fee_bps + slippage_bps,
+        long_only=long_only,
+        periods_per_year=periods_per_year or bars_per_year(features.index),
+    )
+    for start in range(0, len(features), block_size):
+        grid.update(prob_up[start : start + block_size], returns[start : start + block_size])
+    return grid.results()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Backtest a model bundle over a feature file")
+    parser.add_argument("symbol", help="Trading pair symbol, e.g. BTCUSDT")
+    parser.add_argument("--features", type=Path, help="Feature parquet file or partition directory")
+    parser.add_argument("--freq", default="1min", help="Feature frequency label")
+    parser.add_argument("--horizon", type=int, default=1, help="Label horizon of the bundle to load")
+    parser.add_argument("--model", type=Path, help="Model bundle (default <model-dir>/<symbol>_<freq>_h<horizon>.joblib)")
+    parser.add_argument("--features-dir", type=Path, default=FEATURE_DIR, help="Where to find features when --features omitted")
+    parser.add_argument("--model-dir", type=Path, default=MODEL_DIR, help="Where to find the bundle when --model omitted")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.55], help="prob_up entry thresholds")
+    parser.add_argument("--holds", type=int, nargs="+", default=[1], help="Holding horizons in bars")
+    parser.add_argument("--fee-bps", type=float, default=4.0, help="Fee per unit of position change (bps)")
+    parser.add_argument("--slippage-bps", type=float, default=1.0, help="Slippage per unit of position change (bps)")
+    parser.add_argument("--long-only", action="store_true", help="Never go short")
+    parser.add_argument("--block-size", type=int, default=200_000, help="Bars simulated per block")
+    parser.add_argument("--out", type=Path, help="Write the results as JSON")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    feature_path = args.features or args.features_dir / f"{args.symbol.lower()}_{args.freq}.parquet"
+    model_path = args.model or args.model_dir / f"{args.symbol.lower()}_{args.freq}_h{args.horizon}.joblib"
+    if not model_path.exists():
+        raise SystemExit(f"Model bundle not found: {model_path}")
+
+    results = backtest(
+        load_features(feature_path),
+        PriceDirectionPredictor(model_path),
+        args.thresholds,
+        args.holds,
+        fee_bps=args.fee_bps,
+        slippage_bps=args.slippage_bps,
+        long_only=args.long_only,
+        block_size=args.block_size,
+    )
+    print(f"{'threshold':>9} {'hold':>4} {'pnl':>9} {'sharpe':>7} {'max_dd':>8} {'turnover':>9}")
+    for row in results:
+        print(
+            f"{row['threshold']:>9g} {row['horizon']:>4} {row['pnl']:>9.4f} {row['sharpe']:>7.2f}"
+            f" {row['max_drawdown']:>8.4f} {row['turnover']:>9.1f}"
+        )
+    if args.out:
+        args.out.write_text(json.dumps(results, indent=2))
+        print(f"✅ Results saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,21 @@
 from __future__ import annotations
 
 import argparse
+import time
 from pathlib import Path
 
-from .features import build_and_save_features
+from .feature_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, FeatureCache
+from .features import ENGINES, build_and_save_features, build_features_incremental
+from .shards import build_sharded
 
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Generate resampled feature set from trades")
-    parser.add_argument("symbol", help="Trading pair symbol, e.g. BTCUSDT")
+    parser.add_argument("symbols", nargs="+", help="Trading pair symbol(s), e.g. BTCUSDT ETHUSDT")
     parser.add_argument(
         "--output",
         type=Path,
-        help="Destination Parquet file",
+        help="Destination Parquet file (directory of daily partitions with --incremental)",
         default=None,
     )
     parser.add_argument("--start-ts", type=int, default=None, help="Start timestamp (ms)")
@@ -28,21 +31,107 @@ def parse_args() -> argparse.Namespace:
         default=Path("storage/trades.db"),
         help="Path to DuckDB database",
     )
+    parser.add_argument(
+        "--lake",
+        type=Path,
+        default=None,
+        help="Read trades from this Parquet trade lake (see ingest --lake) instead of --db",
+    )
     parser.add_argument(
         "--outdir",
         type=Path,
         default=Path("storage/features"),
         help="Directory for generated features when --output omitted",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Maintain daily Parquet partitions and only recompute bars after the stored watermark",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="duckdb",
+        help="Aggregate bars inside DuckDB (default) or load every trade into pandas",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Serve repeated or overlapping builds from the content-addressed feature cache",
+    )
+    parser.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR, help="Feature cache directory")
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=DEFAULT_MAX_BYTES // 1024**2,
+        help="Evict least recently used cache entries beyond this size",
+    )
+    parser.add_argument(
+        "--shard-days",
+        type=int,
+        default=None,
+        help="Build daily partitions in shards of this many days on a process pool (default 1 with several symbols)",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Processes for sharded builds (default: CPU count)")
+    args = parser.parse_args()
+    if len(args.symbols) > 1 and args.shard_days is None:
+        args.shard_days = 1
+    if args.shard_days is not None and (args.output or args.incremental or args.cache):
+        parser.error("sharded builds write <outdir>/<symbol>_<resample>/ partitions; drop --output/--incremental/--cache")
+    args.symbol = args.symbols[0]
+    return args
+
+
+def run_sharded(args: argparse.Namespace) -> None:
+    started = time.perf_counter()
+    results = build_sharded(
+        args.symbols,
+        lambda symbol: args.outdir / f"{symbol.lower()}_{args.resample}",
+        start_ts=args.start_ts,
+        end_ts=args.end_ts,
+        resample=args.resample,
+        rolling_windows=args.rolling,
+        shard_days=args.shard_days,
+        db_path=args.db,
+        engine=args.engine,
+        lake_dir=args.lake,
+        workers=args.workers,
+    )
+    wall = time.perf_counter() - started
+    busy = sum(result.seconds for result in results)
+    print(
+        f"✅ {len(results)} shard(s), {sum(result.rows for result in results)} rows,"
+        f" {sum(len(result.paths) for result in results)} partition(s) under {args.outdir}"
+        f" in {wall:.1f}s ({busy:.1f}s of shard time, {busy / wall if wall else 0:.1f}x parallel)"
+    )
 
 
 def main() -> None:
     args = parse_args()
+    if args.shard_days is not None:
+        run_sharded(args)
+        return
     output = args.output
+    if args.incremental:
+        output = output or args.outdir / f"{args.symbol.lower()}_{args.resample}"
+        written = build_features_incremental(
+            symbol=args.symbol,
+            output_dir=output,
+            start_ts=args.start_ts,
+            end_ts=args.end_ts,
+            resample=args.resample,
+            rolling_windows=args.rolling,
+            db_path=args.db,
+            engine=args.engine,
+            lake_dir=args.lake,
+        )
+        print(f"✅ {len(written)} partition(s) updated in {output}")
+        return
+
     if output is None:
         output = args.outdir / f"{args.symbol.lower()}_{args.resample}.parquet"
 
+    cache = FeatureCache(args.cache_dir, args.cache_max_mb * 1024**2) if args.cache else None
     path = build_and_save_features(
         symbol=args.symbol,
         output_path=output,
@@ -51,8 +140,17 @@ def main() -> None:
         resample=args.resample,
         rolling_windows=args.rolling,
         db_path=args.db,
+        engine=args.engine,
+        lake_dir=args.lake,
+        cache=cache,
     )
     print(f"✅ Features written to {path}")
+    if cache is not None:
+        report = cache.report()
+        print(
+            f"🗄️  Feature cache: {report['session']} this run, {report['total']} overall,"
+            f" {report['entries']} entries / {report['bytes'] / 1024**2:.1f} MB"
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,233 @@
+"""Content-addressed on-disk cache of computed feature sets.
+
+An entry is keyed by a hash of everything its rows depend on: symbol, requested ts
+range, resample rule, rolling windows, ``FEATURE_VERSION`` and a stamp of the source
+trades in that range (``features.source_fingerprint``: their count, ts bounds and a
+content hash). New or rewritten trades change the stamp and so the key; stale entries
+are never served, only aged out.
+Stamps are memoized within a lookup, so each range is counted once.
+
+A request with no exact entry may still be served from an entry for the same settings
+whose range covers it and whose source data is unchanged, but only when slicing it gives
+exactly what a fresh build would: the entry holds no trades before the request's first
+one (so the rolling windows start just as cold) and none after its last one within that
+trade's bar. The rows from the first to the last trade's bar are then sliced out of it.
+
+Entries live as ``<key>.parquet`` + ``<key>.json`` under the cache directory. A hit
+refreshes the file's mtime; after every store the least recently used entries are
+deleted until the directory fits ``max_bytes``. Hit/miss counts are kept per instance
+(``stats``); ``flush_stats`` appends the counts since the last flush as one line to
+``_stats.jsonl``, so processes sharing the cache never overwrite each other's counts.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+DEFAULT_CACHE_DIR = Path("storage/features/cache")
+DEFAULT_MAX_BYTES = 2 * 1024**3
+STATS_FILE = "_stats.jsonl"
+STAT_KEYS = ("hits", "overlap_hits", "misses", "evictions")
+
+
+class FeatureRequest(NamedTuple):
+    symbol: str
+    start_ts: Optional[int]
+    end_ts: Optional[int]
+    resample: str
+    rolling_windows: Tuple[int, ...]
+
+    def settings(self) -> Dict[str, object]:
+        return {"symbol": self.symbol, "resample": self.resample, "rolling_windows": list(self.rolling_windows)}
+
+    def covered_by(self, start_ts: Optional[int], end_ts: Optional[int]) -> bool:
+        """Whether ``[start_ts, end_ts]`` (``None`` = unbounded) contains this request's range."""
+        starts_before = start_ts is None or (self.start_ts is not None and start_ts <= self.start_ts)
+        ends_after = end_ts is None or (self.end_ts is not None and end_ts >= self.end_ts)
+        return starts_before and ends_after
+
+
+class Lookup(NamedTuple):
+    features: Optional[pd.DataFrame]
+    key: str
+    fingerprint: Dict[str, object]
+
+
+def cache_key(request: FeatureRequest, version: int, fingerprint: Dict[str, object]) -> str:
+    payload = {**request._asdict(), "rolling_windows": list(request.rolling_windows)}
+    payload.update(version=version, fingerprint=fingerprint)
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:24]
+
+
+class FeatureCache:
+    def __init__(self, root: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.stats = dict.fromkeys(STAT_KEYS, 0)
+        self._unflushed = dict.fromkeys(STAT_KEYS, 0)
+
+    def _entries(self) -> Iterator[Tuple[str, Dict[str, object]]]:
+        for meta_path in self.root.glob("*.json"):
+            if not meta_path.with_suffix(".parquet").exists():
+                continue
+            try:
+                yield meta_path.stem, json.loads(meta_path.read_text())
+            except (OSError, ValueError):  # being written or evicted by another process
+                continue
+
+    def _read(self, key: str) -> Optional[pd.DataFrame]:
+        path = self.root / f"{key}.parquet"
+        try:
+            features = pd.read_parquet(path)
+            os.utime(path)  # LRU: mtime is the last use
+        except FileNotFoundError:
+            return None
+        return features
+
+    def _count(self, stat: str, n: int = 1) -> None:
+        self.stats[stat] += n
+        self._unflushed[stat] += n
+
+    def flush_stats(self) -> None:
+        """Append the counts since the last flush to the cumulative stats (once per build)."""
+        counts = {stat: n for stat, n in self._unflushed.items() if n}
+        if not counts:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        # one short O_APPEND write per flush: concurrent processes never lose each other's lines
+        fd = os.open(self.root / STATS_FILE, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, (json.dumps(counts) + "\n").encode())
+        finally:
+            os.close(fd)
+        self._unflushed = dict.fromkeys(STAT_KEYS, 0)
+
+    def lookup(
+        self,
+        request: FeatureRequest,
+        version: int,
+        fingerprint: Callable[[Optional[int], Optional[int]], Dict[str, object]],
+        bar_ms: int,
+    ) -> Lookup:
+        """Cached features for ``request`` (``None`` on a miss), plus the key and source
+        fingerprint to ``store`` a miss under.
+
+        ``fingerprint(start_ts, end_ts)`` stamps the source trades in a range with at least
+        their ``count``, ``first_ts`` and ``last_ts``.
+        """
+        stamps: Dict[Tuple[Optional[int], Optional[int]], Dict[str, object]] = {}
+
+        def stamp(start: Optional[int], end: Optional[int]) -> Dict[str, object]:
+            if (start, end) not in stamps:
+                stamps[start, end] = fingerprint(start, end)
+            return stamps[start, end]
+
+        source = stamp(request.start_ts, request.end_ts)
+        key = cache_key(request, version, source)
+        features = self._read(key)
+        if features is not None:
+            self._count("hits")
+            return Lookup(features, key, source)
+
+        entries = sorted(self._entries(), key=lambda entry: -entry[1].get("rows", 0)) if source.get("count") else []
+        for other, meta in entries:
+            if meta.get("version") != version or {k: meta.get(k) for k in request.settings()} != request.settings():
+                continue
+            start, end = meta.get("start_ts"), meta.get("end_ts")
+            if not request.covered_by(start, end) or stamp(start, end) != meta.get("fingerprint"):
+                continue  # doesn't cover the request, or its source data changed since it was built
+            first_ts, last_ts = int(source["first_ts"]), int(source["last_ts"])
+            if meta["fingerprint"].get("first_ts") != first_ts:
+                continue  # it has trades before the request's: its rolling windows are warmer
+            last_bar = last_ts - last_ts % bar_ms
+            if request.end_ts is not None and request.end_ts < last_bar + bar_ms - 1:
+                tail_end = last_bar + bar_ms - 1 if end is None else min(end, last_bar + bar_ms - 1)
+                if stamp(request.end_ts + 1, tail_end).get("count"):
+                    continue  # it has more trades in the request's last bar
+            covering = self._read(other)
+            if covering is None:
+                continue
+            bar_start = covering.index.as_unit("ms").asi8
+            self._count("overlap_hits")
+            return Lookup(covering[(bar_start >= first_ts - first_ts % bar_ms) & (bar_start <= last_bar)], key, source)
+
+        self._count("misses")
+        return Lookup(None, key, source)
+
+    def store(
+        self,
+        key: str,
+        request: FeatureRequest,
+        version: int,
+        fingerprint: Dict[str, object],
+        features: pd.DataFrame,
+    ) -> Path:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / f"{key}.parquet"
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        features.to_parquet(tmp_path)
+        os.replace(tmp_path, path)
+        meta = {
+            **request._asdict(),
+            "rolling_windows": list(request.rolling_windows),
+            "version": version,
+            "fingerprint": fingerprint,
+            "rows": len(features),
+            "created": time.time(),
+        }
+        path.with_suffix(".json").write_text(json.dumps(meta, indent=2))
+        self.evict(keep=key)
+        return path
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """Delete least recently used entries until the cache fits ``max_bytes``."""
+        entries = []
+        for parquet in self.root.glob("*.parquet"):
+            try:
+                stat = parquet.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, parquet))
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, parquet in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if parquet.stem == keep:
+                continue
+            parquet.unlink(missing_ok=True)
+            parquet.with_suffix(".json").unlink(missing_ok=True)
+            total -= size
+            evicted += 1
+        if evicted:
+            self._count("evictions", evicted)
+        return evicted
+
+    def report(self) -> Dict[str, object]:
+        """This instance's hit/miss counts, the cumulative ones and the cache size."""
+        totals: Dict[str, int] = {}
+        try:
+            lines = (self.root / STATS_FILE).read_text().splitlines()
+        except OSError:
+            lines = []
+        for line in lines:
+            try:
+                counts = json.loads(line)
+            except ValueError:  # a line still being appended
+                continue
+            for stat, n in counts.items():
+                totals[stat] = totals.get(stat, 0) + n
+        sizes = [path.stat().st_size for path in self.root.glob("*.parquet")] if self.root.exists() else []
+        return {
+            "session": dict(self.stats),
+            "total": {stat: totals.get(stat, 0) for stat in STAT_KEYS},
+            "entries": len(sizes),
+            "bytes": sum(sizes),
+            "max_bytes": self.max_bytes,
+        }
@@ -1,20 +1,95 @@
 """Feature engineering utilities for trade data."""
 from __future__ import annotations
 
+import json
+import os
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Iterable, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 import duckdb
+import numpy as np
 import pandas as pd
 
+from ingest.lake import scan_sql
+
+from .feature_cache import FeatureCache, FeatureRequest
+from .streaming import resample_to_ms
+
 DEFAULT_DB_PATH = Path("storage/trades.db")
 
 
+def _has_symbol_column(con: duckdb.DuckDBPyConnection) -> bool:
+    return any(row[1] == "symbol" for row in con.execute("PRAGMA table_info('trades')").fetchall())
+
+
+def _trade_filters(
+    symbol: str,
+    start_ts: Optional[int],
+    end_ts: Optional[int],
+    has_symbol: bool,
+) -> Tuple[str, List[object]]:
+    """WHERE clause and parameters selecting ``symbol`` trades in ``[start_ts, end_ts]``.
+
+    Older databases have no ``symbol`` column; all their trades are used.
+    """
+    filters: List[str] = []
+    params: List[object] = []
+    if has_symbol:
+        filters.append("symbol = ?")
+        params.append(symbol)
+    if start_ts is not None:
+        filters.append("ts >= ?")
+        params.append(start_ts)
+    if end_ts is not None:
+        filters.append("ts <= ?")
+        params.append(end_ts)
+    where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
+    return where_clause, params
+
+
+TradeSource = Tuple[duckdb.DuckDBPyConnection, str, List[object], bool]
+
+
+@contextmanager
+def _trade_source(
+    symbol: str,
+    start_ts: Optional[int],
+    end_ts: Optional[int],
+    db_path: Path,
+    lake_dir: Optional[Path],
+) -> Iterator[Optional[TradeSource]]:
+    """Connection, query, parameters and whether trades carry a ``symbol`` column.
+
+    The query selects ``ts, price, qty, side[, symbol], seq`` from the DuckDB table, or
+    from the Parquet lake when ``lake_dir`` is given; ``seq`` breaks timestamp ties in
+    insertion order. Yields ``None`` when the lake holds no segments for ``symbol``.
+    """
+    if lake_dir is not None:
+        scan = scan_sql(lake_dir, symbol, start_ts, end_ts)
+        with duckdb.connect() as con:
+            yield (con, *scan, True) if scan is not None else None
+        return
+
+    if not db_path.exists():
+        raise FileNotFoundError(f"DuckDB database not found at {db_path}")
+    with duckdb.connect(db_path.as_posix(), read_only=True) as con:
+        has_symbol = _has_symbol_column(con)
+        where_clause, params = _trade_filters(symbol, start_ts, end_ts, has_symbol)
+        # schema v2 may store DECIMAL prices and an ENUM side; readers always get DOUBLE/VARCHAR
+        query = (
+            "SELECT ts, price::DOUBLE AS price, qty::DOUBLE AS qty, side::VARCHAR AS side"
+            f"{', symbol' if has_symbol else ''}, rowid AS seq FROM trades {where_clause}"
+        )
+        yield con, query, params, has_symbol
+
+
 def load_trades(
     symbol: str,
     start_ts: Optional[int] = None,
     end_ts: Optional[int] = None,
     db_path: Path = DEFAULT_DB_PATH,
+    lake_dir: Optional[Path] = None,
 ) -> pd.DataFrame:
     """Load raw trades from DuckDB into a DataFrame.
 
@@ -28,83 +103,235 @@ def load_trades(
         Inclusive timestamp (ms) upper bound.
     db_path : Path
         Location of the DuckDB file.
+    lake_dir : Optional[Path]
+        Read the hour-partitioned Parquet lake (``ingest.lake``) instead of ``db_path``.
     """
-    if not db_path.exists():
-        raise FileNotFoundError(f"DuckDB database not found at {db_path}")
+    with _trade_source(symbol, start_ts, end_ts, db_path, lake_dir) as source:
+        if source is None:
+            return pd.DataFrame(columns=["ts", "price", "qty", "side", "symbol"])
+        con, query, params, has_symbol = source
+        columns = f"ts, price, qty, side{', symbol' if has_symbol else ''}"
+        # seq keeps trades sharing a timestamp in insertion order, as load_bars does
+        df = con.execute(f"SELECT {columns} FROM ({query}) ORDER BY ts, seq", params).fetch_df()
 
-    params: list[object] = []
-    filters = []
+    return df
 
-    if start_ts is not None:
-        filters.append("ts >= ?")
-        params.append(start_ts)
-    if end_ts is not None:
-        filters.append("ts <= ?")
-        params.append(end_ts)
 
-    with duckdb.connect(db_path.as_posix(), read_only=True) as con:
-        columns = {
-            row[1] for row in con.execute("PRAGMA table_info('trades')").fetchall()
-        }
+BAR_COLUMNS = ("price_close", "price_open", "price_high", "price_low", "volume", "trade_count", "vwap")
+PRICE_COLUMNS = ("price_close", "price_open", "price_high", "price_low")
+WATERMARK_FILE = "_watermark.json"
+ENGINES = ("duckdb", "pandas")
+DAY_MS = 86_400_000
+FEATURE_VERSION = 1  # bump when a change to this module changes the computed features
 
-        query_filters = filters.copy()
-        if "symbol" in columns:
-            query_filters.insert(0, "symbol = ?")
-            params.insert(0, symbol)
 
-        where_clause = f"WHERE {' AND '.join(query_filters)}" if query_filters else ""
-        query = f"SELECT ts, price, qty, side{', symbol' if 'symbol' in columns else ''} FROM trades {where_clause} ORDER BY ts"
-        df = con.execute(query, params).fetch_df()
+def resample_trades(trades: pd.DataFrame, resample: str = "1min") -> pd.DataFrame:
+    """Raw per-bar OHLC, volume, trade count and VWAP.
 
-    return df
+    Bars without trades keep NaN prices and VWAP (zero volume and count); ``fill_bars``
+    forward fills them.
+    """
+    index = pd.DatetimeIndex(pd.to_datetime(trades["ts"].to_numpy(), unit="ms", utc=True), name="timestamp")
+    price = pd.Series(trades["price"].to_numpy(dtype=float), index=index)
+    volume = pd.Series(trades["qty"].to_numpy(dtype=float), index=index)
 
+    ohlc = price.resample(resample).ohlc()
+    bars = pd.DataFrame(index=ohlc.index)
+    bars["price_close"] = ohlc["close"]
+    bars["price_open"] = ohlc["open"]
+    bars["price_high"] = ohlc["high"]
+    bars["price_low"] = ohlc["low"]
+    bars["volume"] = volume.resample(resample).sum().fillna(0)
+    bars["trade_count"] = price.resample(resample).count().fillna(0)
 
-def compute_window_features(
-    trades: pd.DataFrame,
+    vwap_num = (price * volume).resample(resample).sum()
+    bars["vwap"] = vwap_num / bars["volume"].where(bars["volume"] != 0)
+    return bars
+
+
+def _empty_bars() -> pd.DataFrame:
+    return pd.DataFrame(columns=list(BAR_COLUMNS), index=pd.DatetimeIndex([], tz="UTC", name="timestamp"))
+
+
+def load_bars(
+    symbol: str,
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
     resample: str = "1min",
-    rolling_windows: Iterable[int] = (3, 5, 15),
+    db_path: Path = DEFAULT_DB_PATH,
+    lake_dir: Optional[Path] = None,
 ) -> pd.DataFrame:
-    """Aggregate trades into time-based features.
+    """``resample_trades(load_trades(...), resample)`` computed inside DuckDB.
 
-    Returns a DataFrame indexed by timestamp with columns such as
-    price_close, volume, trade_count, rolling statistics, and returns.
+    Trades are bucketed, like pandas, on multiples of the bar length from midnight UTC
+    of the first trade's day. Open/close come from ``arg_min``/``arg_max`` over
+    ``(ts, seq)`` and the sums use Kahan summation like pandas' groupby sums, so the
+    bars are identical to the pandas path. Only the bar table is materialized in
+    Python, not the raw trades.
     """
-    if trades.empty:
-        return pd.DataFrame()
+    bar_ms = resample_to_ms(resample)
 
-    df = trades.copy()
-    df["timestamp"] = pd.to_datetime(df["ts"], unit="ms", utc=True)
-    df = df.set_index("timestamp")
+    with _trade_source(symbol, start_ts, end_ts, db_path, lake_dir) as source:
+        if source is None:
+            return _empty_bars()
+        con, trades_query, params, _ = source
+        query = f"""
+            WITH filtered AS ({trades_query}),
+            origin AS (
+                SELECT min(ts) - min(ts) % {DAY_MS} AS day FROM filtered
+            )
+            SELECT
+                day + (ts - day) // {bar_ms} * {bar_ms} AS bucket,
+                arg_max(price, (ts, seq)) AS price_close,
+                arg_min(price, (ts, seq)) AS price_open,
+                max(price) AS price_high,
+                min(price) AS price_low,
+                kahan_sum(qty) AS volume,
+                count(*) AS trade_count,
+                kahan_sum(price * qty) AS notional
+            FROM filtered, origin
+            GROUP BY bucket
+            ORDER BY bucket
+        """
+        rows = con.execute(query, params).fetch_df()
 
-    price = df["price"].astype(float)
-    volume = df["qty"].astype(float)
+    if rows.empty:
+        return _empty_bars()
 
-    agg = pd.DataFrame()
-    agg["price_close"] = price.resample(resample).last().ffill()
-    agg["price_open"] = price.resample(resample).first().fillna(method="ffill")
-    agg["price_high"] = price.resample(resample).max().fillna(method="ffill")
-    agg["price_low"] = price.resample(resample).min().fillna(method="ffill")
-    agg["volume"] = volume.resample(resample).sum().fillna(0)
-    agg["trade_count"] = price.resample(resample).count().fillna(0)
+    buckets = rows.pop("bucket").to_numpy(dtype="int64")
+    rows.index = pd.DatetimeIndex(pd.to_datetime(buckets, unit="ms", utc=True), name="timestamp")
+    full_index = pd.date_range(rows.index[0], rows.index[-1], freq=resample, name="timestamp")
+    bars = rows.reindex(full_index)
+    bars["volume"] = bars["volume"].fillna(0.0)
+    bars["trade_count"] = bars["trade_count"].fillna(0).astype("int64")
+    bars["vwap"] = bars.pop("notional") / bars["volume"].where(bars["volume"] != 0)
+    return bars[list(BAR_COLUMNS)]
 
-    vwap_num = (price * volume).resample(resample).sum()
-    agg["vwap"] = (vwap_num / agg["volume"].replace({0: pd.NA})).fillna(method="ffill").fillna(agg["price_close"])
 
-    agg["return_1"] = agg["price_close"].pct_change().fillna(0)
+def fill_bars(
+    bars: pd.DataFrame,
+    previous: Optional[pd.Series] = None,
+    last_valid_vwap: Optional[float] = None,
+) -> pd.DataFrame:
+    """Forward fill empty bars produced by ``resample_trades``.
+
+    ``previous`` (the filled bar just before ``bars``) and ``last_valid_vwap`` (the last
+    VWAP computed from actual volume) seed the fill when ``bars`` continues an existing
+    series; a VWAP with nothing to carry forward falls back to the bar's close.
+    """
+    filled = bars.copy()
+    for col in PRICE_COLUMNS:
+        filled[col] = bars[col].ffill()
+        if previous is not None:
+            filled[col] = filled[col].fillna(previous[col])
+    vwap = bars["vwap"].ffill()
+    if last_valid_vwap is not None:
+        vwap = vwap.fillna(last_valid_vwap)
+    filled["vwap"] = vwap.fillna(filled["price_close"])
+    return filled
 
+
+def _rolling_stats(values: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Rolling mean and sample std with ``min_periods=1``, like pandas ``rolling``.
+
+    Each row is summed over its own window in a fixed order instead of pandas' running
+    add/remove, so a row's value depends only on the values in its window. That makes a
+    series computed in pieces (incremental or sharded builds) bit-identical to one
+    computed in a single pass.
+    """
+    n = len(values)
+    total = np.zeros(n)
+    count = np.zeros(n)
+    high = np.full(n, -np.inf)
+    low = np.full(n, np.inf)
+    for lag in range(min(window, n)):
+        shifted = values[: n - lag]
+        total[lag:] += shifted
+        count[lag:] += 1
+        np.maximum(high[lag:], shifted, out=high[lag:])
+        np.minimum(low[lag:], shifted, out=low[lag:])
+    mean = total / count
+
+    squares = np.zeros(n)
+    for lag in range(min(window, n)):
+        squares[lag:] += (values[: n - lag] - mean[lag:]) ** 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        std = np.sqrt(squares / (count - 1))
+    # single observations have no sample std; constant windows are exactly 0 (as in pandas)
+    std = np.where((count < 2) | (high == low), 0.0, std)
+    return mean, std
+
+
+def add_rolling_features(
+    bars: pd.DataFrame,
+    rolling_windows: Iterable[int] = (3, 5, 15),
+    history: Optional[pd.DataFrame] = None,
+) -> pd.DataFrame:
+    """Add ``return_1`` and the rolling ``ma_N``/``vol_N``/``volumema_N`` columns.
+
+    ``history`` holds already computed feature rows that directly precede ``bars``; they
+    warm up the returns and rolling windows and are not part of the result.
+    """
+    agg = bars.copy()
+    offset = 0
+    closes, returns_history, volumes = agg["price_close"], None, agg["volume"]
+    if history is not None and not history.empty:
+        offset = len(history)
+        closes = pd.concat([history["price_close"], agg["price_close"]])
+        returns_history = history["return_1"].to_numpy(dtype=float)
+        volumes = pd.concat([history["volume"], agg["volume"]])
+
+    returns = np.array(closes.pct_change().fillna(0), dtype=float)
+    if returns_history is not None:
+        returns[:offset] = returns_history
+    agg["return_1"] = returns[offset:]
+
+    close_values = closes.to_numpy(dtype=float)
+    volume_values = volumes.to_numpy(dtype=float)
     for window in rolling_windows:
         col_suffix = f"{window}"
-        agg[f"ma_{col_suffix}"] = agg["price_close"].rolling(window=window, min_periods=1).mean()
-        agg[f"vol_{col_suffix}"] = agg["return_1"].rolling(window=window, min_periods=1).std().fillna(0)
-        agg[f"volumema_{col_suffix}"] = agg["volume"].rolling(window=window, min_periods=1).mean()
+        ma, _ = _rolling_stats(close_values, window)
+        _, vol = _rolling_stats(returns, window)
+        volumema, _ = _rolling_stats(volume_values, window)
+        agg[f"ma_{col_suffix}"] = ma[offset:]
+        agg[f"vol_{col_suffix}"] = vol[offset:]
+        agg[f"volumema_{col_suffix}"] = volumema[offset:]
+    return agg
+
+
+def compute_bar_features(
+    bars: pd.DataFrame,
+    symbol: str,
+    rolling_windows: Iterable[int] = (3, 5, 15),
+) -> pd.DataFrame:
+    """Fill raw bars (``resample_trades`` or ``load_bars``) and add the rolling features."""
+    if bars.empty:
+        return pd.DataFrame()
 
+    agg = add_rolling_features(fill_bars(bars), rolling_windows)
     agg = agg.dropna()
+    agg["symbol"] = symbol
+    return agg
+
+
+def compute_window_features(
+    trades: pd.DataFrame,
+    resample: str = "1min",
+    rolling_windows: Iterable[int] = (3, 5, 15),
+) -> pd.DataFrame:
+    """Aggregate trades into time-based features.
+
+    Returns a DataFrame indexed by timestamp with columns such as
+    price_close, volume, trade_count, rolling statistics, and returns.
+    """
+    if trades.empty:
+        return pd.DataFrame()
+
     if "symbol" in trades:
         symbol_value = trades["symbol"].iloc[0]
     else:
         symbol_value = trades.attrs.get("symbol", "UNKNOWN")
-    agg["symbol"] = symbol_value
-    return agg
+    return compute_bar_features(resample_trades(trades, resample), symbol_value, rolling_windows)
 
 
 def save_features(df: pd.DataFrame, output_path: Path) -> Path:
@@ -113,6 +340,90 @@ def save_features(df: pd.DataFrame, output_path: Path) -> Path:
     return output_path
 
 
+def _load_raw_bars(
+    symbol: str,
+    start_ts: Optional[int],
+    end_ts: Optional[int],
+    resample: str,
+    db_path: Path,
+    engine: str,
+    lake_dir: Optional[Path] = None,
+) -> pd.DataFrame:
+    if engine == "duckdb":
+        return load_bars(symbol, start_ts=start_ts, end_ts=end_ts, resample=resample, db_path=db_path, lake_dir=lake_dir)
+    if engine == "pandas":
+        trades = load_trades(symbol, start_ts=start_ts, end_ts=end_ts, db_path=db_path, lake_dir=lake_dir)
+        if trades.empty:
+            return pd.DataFrame()
+        return resample_trades(trades, resample)
+    raise ValueError(f"Unknown aggregation engine {engine!r}; expected one of {ENGINES}")
+
+
+def source_fingerprint(
+    symbol: str,
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
+    db_path: Path = DEFAULT_DB_PATH,
+    lake_dir: Optional[Path] = None,
+) -> Dict[str, object]:
+    """Count, ts bounds and a content hash of the trades in a range, a stamp of the source data.
+
+    One scan: ``count``/``min``/``max`` of ``ts`` plus an order-independent XOR of per-trade
+    hashes of the values the features read. Adding or removing trades changes it, and so
+    does rewriting them in place (``ingest.schema.migrate --decimal`` rounding prices or
+    quantities); a rewrite that leaves every value unchanged keeps the cache valid.
+    """
+    with _trade_source(symbol, start_ts, end_ts, db_path, lake_dir) as source:
+        if source is None:
+            return {"count": 0}
+        con, query, params, _ = source
+        count, first, last, content = con.execute(
+            f"SELECT count(*), min(ts), max(ts), bit_xor(hash(ts, price, qty, side)) FROM ({query})", params
+        ).fetchone()
+    return {"count": int(count), "first_ts": first, "last_ts": last, "content": content}
+
+
+def build_features(
+    symbol: str,
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
+    resample: str = "1min",
+    rolling_windows: Iterable[int] = (3, 5, 15),
+    db_path: Path = DEFAULT_DB_PATH,
+    engine: str = "duckdb",
+    lake_dir: Optional[Path] = None,
+    cache: Optional[FeatureCache] = None,
+) -> pd.DataFrame:
+    """Features for ``symbol``, served from ``cache`` when it holds them.
+
+    ``engine="duckdb"`` aggregates bars inside DuckDB (``load_bars``); ``"pandas"`` loads
+    every trade and resamples in pandas. Both produce the same features. Trades come from
+    ``lake_dir`` instead of ``db_path`` when it is given. A cache miss is computed and stored.
+    """
+    request = FeatureRequest(symbol, start_ts, end_ts, resample, tuple(rolling_windows))
+    lookup = None
+    try:
+        if cache is not None:
+
+            def fingerprint(start: Optional[int], end: Optional[int]) -> Dict[str, object]:
+                return source_fingerprint(symbol, start, end, db_path, lake_dir)
+
+            lookup = cache.lookup(request, FEATURE_VERSION, fingerprint, resample_to_ms(resample))
+            if lookup.features is not None and not lookup.features.empty:
+                return lookup.features
+
+        bars = _load_raw_bars(symbol, start_ts, end_ts, resample, db_path, engine, lake_dir)
+        features = compute_bar_features(bars, symbol, rolling_windows=request.rolling_windows)
+        if features.empty:
+            raise ValueError("No features generated; check trade availability or time window")
+        if lookup is not None:
+            cache.store(lookup.key, request, FEATURE_VERSION, lookup.fingerprint, features)
+        return features
+    finally:
+        if cache is not None:
+            cache.flush_stats()  # one append to the shared counts per build
+
+
 def build_and_save_features(
     symbol: str,
     output_path: Path,
@@ -121,10 +432,150 @@ def build_and_save_features(
     resample: str = "1min",
     rolling_windows: Iterable[int] = (3, 5, 15),
     db_path: Path = DEFAULT_DB_PATH,
+    engine: str = "duckdb",
+    lake_dir: Optional[Path] = None,
+    cache: Optional[FeatureCache] = None,
 ) -> Path:
-    trades = load_trades(symbol, start_ts=start_ts, end_ts=end_ts, db_path=db_path)
-    trades["symbol"] = symbol
-    features = compute_window_features(trades, resample=resample, rolling_windows=rolling_windows)
-    if features.empty:
-        raise ValueError("No features generated; check trade availability or time window")
+    """Build features for ``symbol`` (see ``build_features``) and write them to one Parquet file."""
+    features = build_features(symbol, start_ts, end_ts, resample, rolling_windows, db_path, engine, lake_dir, cache)
     return save_features(features, output_path)
+
+
+def _write_atomic(df: pd.DataFrame, path: Path) -> None:
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    df.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def partition_paths(output_dir: Path) -> List[Path]:
+    """Daily feature partitions (``YYYY-MM-DD.parquet``) in date order."""
+    return sorted(output_dir.glob("????-??-??.parquet"))
+
+
+def write_partitions(features: pd.DataFrame, output_dir: Path) -> List[Path]:
+    """Write one Parquet file per UTC day of ``features``, replacing existing days."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for day, frame in features.groupby(features.index.strftime("%Y-%m-%d"), sort=True):
+        path = output_dir / f"{day}.parquet"
+        _write_atomic(frame, path)
+        written.append(path)
+    return written
+
+
+def load_partitions(output_dir: Path) -> pd.DataFrame:
+    paths = partition_paths(output_dir)
+    if not paths:
+        return pd.DataFrame()
+    return pd.concat([pd.read_parquet(path) for path in paths])
+
+
+def read_watermark(output_dir: Path) -> Optional[Dict[str, object]]:
+    path = output_dir / WATERMARK_FILE
+    return json.loads(path.read_text()) if path.exists() else None
+
+
+def _write_watermark(output_dir: Path, watermark: Dict[str, object]) -> None:
+    path = output_dir / WATERMARK_FILE
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text(json.dumps(watermark, indent=2))
+    os.replace(tmp_path, path)
+
+
+def _last_valid_vwap(raw_bars: pd.DataFrame, default: Optional[float] = None) -> Optional[float]:
+    valid = raw_bars["vwap"].dropna()
+    return float(valid.iloc[-1]) if not valid.empty else default
+
+
+def _history_before(output_dir: Path, cutoff: pd.Timestamp, rows: int) -> pd.DataFrame:
+    """The last ``rows`` persisted feature rows strictly before ``cutoff``."""
+    frames: List[pd.DataFrame] = []
+    found = 0
+    for path in reversed(partition_paths(output_dir)):
+        frame = pd.read_parquet(path)
+        frame = frame[frame.index < cutoff]
+        if frame.empty:
+            continue
+        frames.insert(0, frame)
+        found += len(frame)
+        if found >= rows:
+            break
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames).iloc[-rows:]
+
+
+def build_features_incremental(
+    symbol: str,
+    output_dir: Path,
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
+    resample: str = "1min",
+    rolling_windows: Iterable[int] = (3, 5, 15),
+    db_path: Path = DEFAULT_DB_PATH,
+    engine: str = "duckdb",
+    lake_dir: Optional[Path] = None,
+) -> List[Path]:
+    """Bring a partitioned feature set up to date, recomputing only the tail.
+
+    ``output_dir`` holds one Parquet file per UTC day plus a watermark: the start of the
+    last bar written and the last VWAP computed from real volume. Without a watermark the
+    whole range is built. Otherwise only trades from the watermark bar onwards are loaded
+    (that bar may have been partial); the persisted rows before it supply the lookback for
+    returns and the largest rolling window. Days from the watermark on are rewritten, so
+    the files are identical to a full rebuild over the same trades. Returns the paths of
+    the partitions written.
+    """
+    rolling_windows = tuple(rolling_windows)
+    bar_ms = resample_to_ms(resample)
+    if DAY_MS % bar_ms:
+        raise ValueError(f"Incremental builds need a resample rule that divides a day, got {resample!r}")
+
+    watermark = read_watermark(output_dir)
+    settings = {"symbol": symbol, "resample": resample, "rolling_windows": list(rolling_windows)}
+    history = None
+    previous = None
+    last_valid_vwap = None
+    if watermark is not None:
+        stale = {key: watermark.get(key) for key in settings if watermark.get(key) != settings[key]}
+        if stale:
+            raise ValueError(f"Watermark in {output_dir} was built with different settings {stale}; rebuild fully")
+        start_ts = int(watermark["last_bar_ts"])
+        last_valid_vwap = watermark.get("last_valid_vwap")
+
+    raw = _load_raw_bars(symbol, start_ts, end_ts, resample, db_path, engine, lake_dir)
+    if raw.empty:
+        return []
+
+    if watermark is not None:
+        cutoff = pd.Timestamp(start_ts, unit="ms", tz="UTC")
+        history = _history_before(output_dir, cutoff, max(rolling_windows, default=1))
+        if not history.empty:
+            previous = history.iloc[-1]
+    features = add_rolling_features(
+        fill_bars(raw, previous=previous, last_valid_vwap=last_valid_vwap), rolling_windows, history=history
+    )
+    features = features.dropna()
+    features["symbol"] = symbol
+
+    if watermark is not None:
+        # rows of the first rewritten day that precede the watermark bar are kept as they are
+        first_day = features.index[0].strftime("%Y-%m-%d")
+        day_path = output_dir / f"{first_day}.parquet"
+        if day_path.exists():
+            kept = pd.read_parquet(day_path)
+            features = pd.concat([kept[kept.index < features.index[0]], features])
+    else:
+        for path in partition_paths(output_dir):
+            path.unlink()
+
+    written = write_partitions(features, output_dir)
+    _write_watermark(
+        output_dir,
+        {
+            **settings,
+            "last_bar_ts": int(features.index[-1].value // 1_000_000),
+            "last_valid_vwap": _last_valid_vwap(raw, last_valid_vwap),
+        },
+    )
+    return written
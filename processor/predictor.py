@@ -1,11 +1,50 @@
 """Runtime predictor utilities for serving model outputs."""
 from __future__ import annotations
 
+import hashlib
+import io
 import json
+import time
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Any, Dict, Mapping, NamedTuple, Optional, Sequence, Tuple, Union
 
 import joblib
+import numpy as np
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+
+Events = Union[Sequence[Mapping[str, object]], np.ndarray]
+
+
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    # exp(-log(1 + exp(-z))) never overflows, unlike 1 / (1 + exp(-z)) for large negative z
+    return np.exp(-np.logaddexp(0.0, -z))
+
+
+class ModelBundle(NamedTuple):
+    """Everything a prediction reads, swapped as one object so a reload is atomic."""
+
+    model: Any = None
+    feature_cols: Tuple[str, ...] | None = None
+    linear: Tuple[np.ndarray, float] | None = None
+    version: Optional[str] = None  # content hash of the bundle file
+    loaded_at: Optional[float] = None  # epoch seconds
+
+
+def load_bundle(path: Path) -> ModelBundle:
+    """Read and unpack a ``train_model`` bundle (blocking: run it off the event loop)."""
+    data = Path(path).read_bytes()
+    bundle = joblib.load(io.BytesIO(data))
+    model = bundle.get("model")
+    feature_cols = tuple(bundle.get("feature_cols", ()))
+    if model is None or not feature_cols:
+        raise ValueError(f"{path} is not a model bundle with a model and feature_cols")
+    return ModelBundle(
+        model=model,
+        feature_cols=feature_cols,
+        linear=PriceDirectionPredictor._linear_params(model),
+        version=hashlib.sha256(data).hexdigest()[:12],
+        loaded_at=time.time(),
+    )
 
 
 class PriceDirectionPredictor:
@@ -13,35 +52,103 @@ class PriceDirectionPredictor:
 
     def __init__(self, model_path: Path | None = None):
         self.model_path = model_path or Path("storage/models/btcusdt_1min_h1.joblib")
-        self._model = None
-        self._feature_cols: Tuple[str, ...] | None = None
+        self._active = ModelBundle()
         self._load_model()
 
     def _load_model(self) -> None:
-        if self.model_path.exists():
-            bundle = joblib.load(self.model_path)
-            self._model = bundle.get("model")
-            self._feature_cols = tuple(bundle.get("feature_cols", ()))
-        else:
-            self._model = None
-            self._feature_cols = None
+        self._active = ModelBundle()
+        if not self.model_path.exists():
+            return
+        try:
+            self._active = load_bundle(self.model_path)
+        except Exception as exc:  # a malformed bundle on disk must not stop the service starting
+            print(f"[predictor] {self.model_path} not loaded, using the heuristic: {type(exc).__name__}: {exc}")
 
-    def predict(self, event: Dict[str, float]) -> Tuple[float, float, str]:
-        """Return (prob_up, prob_down, source)."""
-        if self._model and self._feature_cols:
-            features = [float(event.get(col, 0.0)) for col in self._feature_cols]
-            prob = self._model.predict_proba([features])[0]
-            return float(prob[1]), float(prob[0]), "model"
+    def swap(self, bundle: ModelBundle) -> None:
+        """Serve ``bundle`` from the next prediction on; in-flight batches finish on the old one."""
+        self._active = bundle
+
+    @property
+    def bundle(self) -> ModelBundle:
+        return self._active
 
+    @property
+    def feature_cols(self) -> Tuple[str, ...] | None:
+        """Feature columns the loaded bundle was trained on (``None`` without a model)."""
+        return self._active.feature_cols
+
+    def info(self) -> Dict[str, object]:
+        """Active model version, load time and feature columns."""
+        active = self._active
+        return {
+            "path": self.model_path.as_posix(),
+            "source": "model" if active.model is not None else "heuristic",
+            "version": active.version,
+            "loaded_at": active.loaded_at,
+            "feature_cols": list(active.feature_cols or ()),
+        }
+
+    @staticmethod
+    def _linear_params(model) -> Tuple[np.ndarray, float] | None:
+        """Weights for the NumPy fast path when the model is a binary logistic regression
+        (including a log-loss ``SGDClassifier`` from out-of-core training)."""
+        logistic = isinstance(model, LogisticRegression) or (
+            isinstance(model, SGDClassifier) and model.loss == "log_loss"
+        )
+        if not logistic or len(getattr(model, "classes_", ())) != 2:
+            return None
+        return np.asarray(model.coef_[0], dtype=np.float64), float(model.intercept_[0])
+
+    def feature_matrix(
+        self, events: Sequence[Mapping[str, object]], cols: Sequence[str] | None = None
+    ) -> np.ndarray:
+        """Stack events into a 2-D array in ``feature_cols`` order (missing values -> 0.0)."""
+        cols = cols if cols is not None else self._active.feature_cols or ()
+        return np.array(
+            [[float(event.get(col, 0.0)) for col in cols] for event in events], dtype=np.float64
+        ).reshape(len(events), len(cols))
+
+    def predict_batch(self, events: Events) -> Tuple[np.ndarray, np.ndarray, str]:
+        """Score a block of events in one call.
+
+        ``events`` is either a sequence of event dicts or a 2-D array whose columns are in
+        ``feature_cols`` order (arrays require a loaded model). Returns
+        ``(prob_up, prob_down, source)`` with one probability per row.
+        """
+        active = self._active  # one bundle for the whole batch, even if a reload swaps mid-call
+        if active.model is not None and active.feature_cols:
+            cols = active.feature_cols
+            X = events if isinstance(events, np.ndarray) else self.feature_matrix(events, cols)
+            X = np.asarray(X, dtype=np.float64)
+            if X.ndim != 2 or X.shape[1] != len(cols):
+                raise ValueError(f"Expected a 2-D array with {len(cols)} columns, got shape {X.shape}")
+            if active.linear is not None:
+                coef, intercept = active.linear
+                prob_up = _sigmoid(X @ coef + intercept)
+                return prob_up, 1.0 - prob_up, "model"
+            prob = active.model.predict_proba(X)
+            return prob[:, 1], prob[:, 0], "model"
+
+        if isinstance(events, np.ndarray):
+            raise ValueError("Array input needs a loaded model; pass event dicts for the heuristic")
+        return self._heuristic(events)
+
+    @staticmethod
+    def _heuristic(events: Sequence[Mapping[str, object]]) -> Tuple[np.ndarray, np.ndarray, str]:
         # Fallback heuristic based on order-flow imbalance or trade side
-        qty = float(event.get("qty", 0))
-        side = event.get("side", "buy")
-        ofi = float(event.get("ofi", 0))
+        qty = np.array([float(event.get("qty", 0)) for event in events], dtype=np.float64)
+        is_buy = np.array([event.get("side", "buy") == "buy" for event in events], dtype=bool)
+        ofi = np.array([float(event.get("ofi", 0)) for event in events], dtype=np.float64)
 
-        bias = ofi if ofi != 0 else (qty if side == "buy" else -qty)
-        prob_up = max(0.0, min(1.0, 0.5 + bias * 0.05))
-        prob_down = 1.0 - prob_up
-        return prob_up, prob_down, "heuristic"
+        bias = np.where(ofi != 0, ofi, np.where(is_buy, qty, -qty))
+        prob_up = np.clip(0.5 + bias * 0.05, 0.0, 1.0)
+        return prob_up, 1.0 - prob_up, "heuristic"
+
+    def predict(self, event: Dict[str, float]) -> Tuple[float, float, str]:
+        """Return (prob_up, prob_down, source)."""
+        prob_up, prob_down, source = self.predict_batch([event])
+        return float(prob_up[0]), float(prob_down[0]), source
 
     def reload(self) -> None:
-        self._load_model()
+        """Load ``model_path`` again; the current model stays active if that fails."""
+        self.swap(load_bundle(self.model_path))
@@ -1,47 +1,375 @@
+import argparse
+import time
+import zlib
 import redis
-from collections import deque
+from pathlib import Path
 
-# connect to Redis (running in Docker on localhost:6379)
-r = redis.Redis(host="localhost", port=6379, decode_responses=True)
+from ingest.retention import id_key, trimmed_past
+from ingest.trace import TRACE_FIELD, id_us, now_us, stamp
+from ingest.wire import BINARY_FIELD, WIRE_FORMATS, decode_entry, pack_features, pack_traces
+from observability import metrics
+from processor.predictor import PriceDirectionPredictor
+from processor.streaming import StreamingFeatureEngine, windows_from_feature_cols
 
-TRADE_STREAM = "trades:btcusdt"  # name of the Redis stream to read trades from
-FEATURE_STREAM = "features:btcusdt"  # name of the Redis stream to write features to
+# connect to Redis (running in Docker on localhost:6379); raw bytes so packed binary entries survive
+r = redis.Redis(host="localhost", port=6379, decode_responses=False)
 
-WINDOW_SIZE = 100 # keep the last 100 trades in memory for feature calculation
-trades_window = deque(maxlen=WINDOW_SIZE) # deque is a double-ended queue that can be used as a sliding window
+TRADE_STREAM_PREFIX = "trades:"  # trades:<symbol> streams are read...
+FEATURE_STREAM_PREFIX = "features:"  # ...and features:<symbol> streams are written
+BOOK_STREAM_PREFIX = "book:"  # book features from ingest.depth, merged in with --book
 
-last_id = "0"  # start reading from the beginning of the stream or lastest with "$"
+WINDOW_SIZE = 100 # order flow imbalance is computed over the last 100 trades
+DEFAULT_MODEL = Path("storage/models/btcusdt_1min_h1.joblib")
+DEFAULT_GROUP = "processor"
 
-while True:
-  # read 1 new event at a time
-  events = r.xread({TRADE_STREAM: last_id}, block=0, count=1)
 
-  for stream, messages in events:
+def make_engine(resample, feature_cols):
+  """Streaming feature engine for one symbol.
+
+  With a model bundle's ``feature_cols`` the rolling windows are taken from the column
+  names; without a model the batch defaults (3, 5, 15) are used and every feature is published.
+  """
+  windows = windows_from_feature_cols(feature_cols) if feature_cols else (3, 5, 15)
+  return StreamingFeatureEngine(resample=resample, rolling_windows=windows, ofi_window=WINDOW_SIZE)
+
+
+def process_trade(engine, feature_cols, fields):
+  """Feed one trade (a text entry's fields or a record from ``decode_entry``) to the engine
+  and return the feature event to publish."""
+  # convert fields from strings to appropriate types
+  ts = int(fields.get("ts", 0))
+  price = float(fields.get("price", 0))
+  qty = float(fields.get("qty", 0))
+  side = fields.get("side", "buy")
+
+  # O(1) update: closes any finished bars and refreshes the open bar's rolling stats
+  engine.update(ts, price, qty, side)
+  features = {"ts": ts}
+  features.update(engine.features(feature_cols))
+  features.pop("bar_ts", None)
+  return features
+
+
+def assigned_symbols(symbols, worker_index=0, worker_count=1):
+  """Symbols owned by one worker: a stable hash of the symbol modulo the worker count.
+
+  Every symbol is owned by exactly one worker, so its trades are processed in order by
+  a single feature engine while the symbol set is spread across processes.
+  """
+  if not 0 <= worker_index < worker_count:
+    raise ValueError(f"worker_index must be in [0, {worker_count}), got {worker_index}")
+  return [s for s in symbols if zlib.crc32(s.lower().encode()) % worker_count == worker_index]
+
+
+class FeatureWorker:
+  """Importable stream processor built on Redis consumer groups.
+
+  Each owned symbol's ``trades:<symbol>`` stream is read with XREADGROUP in batches of
+  ``batch_size``; the feature XADDs and the XACKs for a batch go out in one pipeline.
+  Delivered-but-unacknowledged entries survive restarts: the consumer name is stable per
+  worker index (``worker-<index>``), so on start the worker replays its own pending entries
+  before its first new read. Every ``claim_interval`` seconds it also XAUTOCLAIMs entries
+  that another consumer left idle for ``claim_idle_ms`` (e.g. a worker that died for good).
+  Reclaimed trades older than the newest trade already fed to the engine are acknowledged
+  without being applied (counted in ``stale``): feeding them late would corrupt its
+  rolling windows. Feature engines start empty after a restart and warm up over the next bars.
+
+  Trade entries may be text or packed binary batches (``ingest.wire``); ``wire`` picks
+  the format of the published features, and with ``"binary"`` a batch's feature rows go
+  out as one packed entry.
+
+  Before each read the worker checks that stream retention (``ingest.retention``) has
+  not trimmed entries it has yet to read. If it has, the gap is reported (``gaps``) and,
+  given ``backfill(symbol, start_ts, end_ts)`` returning the trades stored in DuckDB or
+  the Parquet lake, the missing trades are fed through the engine and published before
+  reading resumes. Trades sharing a timestamp with either edge of the gap are not reloaded.
+
+  With ``book`` set, the newest row of each symbol's ``book:<symbol>`` stream (spread,
+  microprice, depth imbalance from ``ingest.depth``) is read once per batch and merged
+  into every feature row of that batch.
+  """
+
+  def __init__(
+    self,
+    client,
+    symbols,
+    group=DEFAULT_GROUP,
+    consumer=None,
+    worker_index=0,
+    resample="1min",
+    model_path=DEFAULT_MODEL,
+    batch_size=100,
+    block_ms=1000,
+    claim_idle_ms=30_000,
+    claim_interval=10.0,
+    start_id="$",
+    wire="text",
+    backfill=None,
+    book=False,
+    verbose=False,
+  ):
+    self.client = client
+    self.symbols = [s.lower() for s in symbols]
+    self.group = group
+    self.consumer = consumer or f"worker-{worker_index}"
+    self.batch_size = batch_size
+    self.block_ms = block_ms
+    self.claim_idle_ms = claim_idle_ms
+    self.claim_interval = claim_interval
+    self.start_id = start_id
+    self.wire = wire
+    self.backfill = backfill
+    self.book = book
+    self.verbose = verbose
+    self.processed = 0
+    self.per_stream = {} # stream -> trades processed, exported by collect_metrics
+    self.gaps = 0
+    self.stale = 0 # reclaimed trades older than what the engine has seen, acked unapplied
+    self._engine_ts = {} # stream -> ts of the newest trade fed to its engine
+    self._last_seen = {} # stream -> (id, trade ts) of the newest entry processed
+    self._last_claim = 0.0
+    self.feature_cols = PriceDirectionPredictor(model_path).feature_cols
+    self._engines = {TRADE_STREAM_PREFIX + symbol: make_engine(resample, self.feature_cols) for symbol in self.symbols}
+
+  @property
+  def streams(self):
+    return list(self._engines)
+
+  def ensure_groups(self):
+    for stream in self.streams:
+      try:
+        self.client.xgroup_create(stream, self.group, id=self.start_id, mkstream=True)
+      except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e): # the group already exists: keep its position
+          raise
+
+  def handle(self, stream, messages, reclaimed=False):
+    """Compute features for one stream's entries, then publish and acknowledge them together.
+
+    With ``reclaimed`` set, trades older than the newest one the engine has seen are skipped.
+    """
+    if not messages:
+      return 0
+    engine = self._engines[stream]
+    symbol = stream[len(TRADE_STREAM_PREFIX):]
+    feature_stream = FEATURE_STREAM_PREFIX + symbol
+    book = self.latest_book(symbol) if self.book else None
+
+    pipe = self.client.pipeline(transaction=False)
+    rows = []
+    started = time.perf_counter() if metrics.ENABLED else 0.0
+    newest = self._engine_ts.get(stream)
+    stale = 0
     for message_id, fields in messages:
-      # convert fields from strings to appropriate types
-      ts = int(fields.get("ts", 0))
-      price = float(fields.get("price", 0))
-      qty = float(fields.get("qty", 0))
-      side = fields.get("side", "buy")
+      # pending entries that were trimmed from the stream come back empty and decode to no trades; just ack them
+      for trade in decode_entry(fields):
+        ts = int(trade.get("ts", 0))
+        if reclaimed and newest is not None and ts < newest:
+          stale += 1
+          continue
+        newest = ts if newest is None else max(newest, ts)
+        features = process_trade(engine, self.feature_cols, trade)
+        if book:
+          features.update(book)
+        if TRACE_FIELD in trade: # sampled trade: pass its stage timestamps on with ours added
+          features[TRACE_FIELD] = stamp(trade[TRACE_FIELD], features["ts"], redis=id_us(message_id), processor=now_us())
+        rows.append(features)
+      self._seen(stream, message_id, rows[-1]["ts"] if rows else None)
+    if metrics.ENABLED:
+      metrics.PROCESSOR_READ_ENTRIES.observe(len(messages))
+      if rows:
+        metrics.PROCESSOR_EVENT_SECONDS.observe((time.perf_counter() - started) / len(rows))
+    if newest is not None:
+      self._engine_ts[stream] = newest
+    if stale:
+      self.stale += stale
+      print(f"[processor] {stream}: dropped {stale} reclaimed trade(s) older than the engine's last trade")
+    self._publish(pipe, feature_stream, rows)
+    handled = len(rows)
+    pipe.xack(stream, self.group, *[message_id for message_id, _ in messages])
+    pipe.execute()
+    self.processed += handled
+    self.per_stream[stream] = self.per_stream.get(stream, 0) + handled
+    return handled
+
+  def latest_book(self, symbol):
+    """Book features of the newest ``book:<symbol>`` entry, or ``None`` if there is none yet."""
+    latest = self.client.xrevrange(BOOK_STREAM_PREFIX + symbol, count=1)
+    records = decode_entry(latest[0][1]) if latest else []
+    if not records:
+      return None
+    return {key: float(value) for key, value in records[-1].items() if key != "ts"}
+
+  def _publish(self, pipe, feature_stream, rows):
+    if self.verbose:
+      for features in rows:
+        print(features)
+    if self.wire == "binary":
+      if rows:
+        entry = {BINARY_FIELD: pack_features(rows)}
+        traces = pack_traces(rows)
+        if traces:
+          entry[TRACE_FIELD] = traces
+        pipe.xadd(feature_stream, entry)
+    else:
+      for features in rows:
+        pipe.xadd(feature_stream, features)
+
+  def _seen(self, stream, message_id, ts):
+    last = self._last_seen.get(stream)
+    if last is None or id_key(message_id) > id_key(last[0]):
+      self._last_seen[stream] = (message_id, ts if ts is not None else (last[1] if last else None))
+
+  def fill_gaps(self):
+    """Detect entries trimmed before this worker read them and reload them from the durable store."""
+    handled = 0
+    for stream, (last_id, last_ts) in list(self._last_seen.items()):
+      first = trimmed_past(self.client, stream, last_id)
+      if first is None:
+        continue
+      first_id, fields = first
+      stamps = [record["ts"] for record in decode_entry(fields) if "ts" in record]
+      self.gaps += 1
+      print(
+        f"[processor] {stream}: entries after {id_key(last_id)[0]}-{id_key(last_id)[1]} were trimmed before being read;"
+        f" stream now starts at {first_id}" + ("" if self.backfill else " (no --backfill store, skipping them)")
+      )
+      # from here on, reading resumes at the first remaining entry
+      self._last_seen[stream] = (first_id, last_ts)
+      if self.backfill is None or last_ts is None or not stamps:
+        continue
+      symbol = stream[len(TRADE_STREAM_PREFIX):]
+      engine = self._engines[stream]
+      rows = [process_trade(engine, self.feature_cols, trade) for trade in self.backfill(symbol, last_ts + 1, min(stamps) - 1)]
+      pipe = self.client.pipeline(transaction=False)
+      self._publish(pipe, FEATURE_STREAM_PREFIX + symbol, rows)
+      pipe.execute()
+      self.processed += len(rows)
+      handled += len(rows)
+    return handled
+
+  def recover_pending(self):
+    """Re-process entries delivered to this consumer name but never acknowledged."""
+    handled = 0
+    for stream in self.streams:
+      last_id = "0"
+      while True:
+        events = self.client.xreadgroup(self.group, self.consumer, {stream: last_id}, count=self.batch_size)
+        messages = [m for _, batch in events or [] for m in batch]
+        if not messages:
+          break
+        handled += self.handle(stream, messages)
+        last_id = messages[-1][0]
+    return handled
+
+  def reclaim(self):
+    """Take over entries other consumers have left pending for longer than ``claim_idle_ms``."""
+    handled = 0
+    for stream in self.streams:
+      start = "0-0"
+      while True:
+        result = self.client.xautoclaim(
+          stream, self.group, self.consumer, self.claim_idle_ms, start_id=start, count=self.batch_size
+        )
+        start, messages = result[0], result[1]
+        handled += self.handle(stream, messages, reclaimed=True)
+        if start in ("0-0", b"0-0"):
+          break
+    self._last_claim = time.monotonic()
+    return handled
+
+  def run_once(self):
+    """One read/compute/publish cycle; returns the number of trades processed."""
+    handled = 0
+    if time.monotonic() - self._last_claim >= self.claim_interval:
+      handled += self.reclaim()
+    handled += self.fill_gaps()
+    events = self.client.xreadgroup(
+      self.group, self.consumer, {stream: ">" for stream in self.streams}, count=self.batch_size, block=self.block_ms
+    )
+    for stream, messages in events or []:
+      # redis-py returns stream names as bytes on a decode_responses=False client
+      handled += self.handle(stream.decode() if isinstance(stream, bytes) else stream, messages)
+    return handled
+
+  def collect_metrics(self):
+    """Prometheus families read at scrape time: trades per stream, gaps, consumer-group lag."""
+    trades = metrics.CounterMetricFamily("processor_trades", "Trades turned into feature events", labels=["stream"])
+    for stream, count in list(self.per_stream.items()):
+      trades.add_metric([stream], count)
+    gaps = metrics.CounterMetricFamily("processor_trim_gaps", "Reads that found unread entries trimmed", value=self.gaps)
+    stale = metrics.CounterMetricFamily(
+      "processor_stale_reclaimed", "Reclaimed trades dropped as older than the engine's last trade", value=self.stale
+    )
+    return [trades, gaps, stale, *metrics.group_lag(self.client, self.streams)]
+
+  def run(self):
+    self.ensure_groups()
+    # everything left pending, ours from before a restart first, goes through before new entries
+    self.recover_pending()
+    self.reclaim()
+    while True:
+      self.run_once()
+
 
-      # add the new trade to the sliding window
-      trades_window.append(side)
+def durable_trades(db_path=None, lake_dir=None):
+  """``backfill`` callable reading trades back from the DuckDB store or the Parquet lake."""
+  from processor.features import DEFAULT_DB_PATH, load_trades
 
-      buys = trades_window.count("buy")
-      sells = trades_window.count("sell")
-      total = buys + sells if (buys + sells) > 0 else 1 # avoid division by zero
-      ofi = (buys - sells) / total # order flow imbalance is the normalized difference between buy and sell trades, used as a simple feature to predict short-term price movements
-      features = {"ts": ts, "ofi": ofi}
+  def backfill(symbol, start_ts, end_ts):
+    trades = load_trades(symbol.upper(), start_ts, end_ts, db_path=db_path or DEFAULT_DB_PATH, lake_dir=lake_dir)
+    return trades.to_dict("records")
 
-      # print for now
-      print(features)
+  return backfill
 
-      # (later) push features into Redis for forecast service
-      r.xadd(FEATURE_STREAM, features)
 
-      # update last_id so we don’t re-read old events
-      last_id = message_id
+def main():
+  parser = argparse.ArgumentParser(description="Compute streaming features from the trade streams")
+  parser.add_argument("--symbols", nargs="+", default=["btcusdt"], help="Symbols handled by the worker pool")
+  parser.add_argument("--worker-index", type=int, default=0, help="This worker's index in the pool")
+  parser.add_argument("--worker-count", type=int, default=1, help="Number of workers sharing the symbols")
+  parser.add_argument("--group", default=DEFAULT_GROUP, help="Redis consumer group name")
+  parser.add_argument("--consumer", default=None, help="Consumer name (default worker-<worker-index>)")
+  parser.add_argument("--batch-size", type=int, default=100, help="Max entries per XREADGROUP")
+  parser.add_argument("--claim-idle-ms", type=int, default=30_000, help="Reclaim entries pending this long")
+  parser.add_argument("--start-id", default="$", help="Where a new consumer group starts (\"0\" = whole stream)")
+  parser.add_argument("--resample", default="1min", help="Bar size, same rule as processor.build_features")
+  parser.add_argument("--model", type=Path, default=DEFAULT_MODEL, help="Model bundle whose feature_cols are published")
+  parser.add_argument("--wire", choices=WIRE_FORMATS, default="text", help="Format of the published feature entries")
+  parser.add_argument(
+    "--backfill-db", type=Path, default=None, help="DuckDB store to reload trades trimmed before they were read"
+  )
+  parser.add_argument("--backfill-lake", type=Path, default=None, help="Parquet lake to reload trimmed trades from")
+  parser.add_argument("--book", action="store_true", help="Merge the latest book:<symbol> features into each row")
+  parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on this port")
+  parser.add_argument("--verbose", action="store_true", help="Print every feature event")
+  args = parser.parse_args()
 
+  symbols = assigned_symbols(args.symbols, args.worker_index, args.worker_count)
+  if not symbols:
+    parser.error("no symbols hash to this worker index; lower --worker-count or add symbols")
+  worker = FeatureWorker(
+    r,
+    symbols,
+    group=args.group,
+    consumer=args.consumer,
+    worker_index=args.worker_index,
+    resample=args.resample,
+    model_path=args.model,
+    batch_size=args.batch_size,
+    claim_idle_ms=args.claim_idle_ms,
+    start_id=args.start_id,
+    wire=args.wire,
+    backfill=durable_trades(args.backfill_db, args.backfill_lake) if args.backfill_db or args.backfill_lake else None,
+    book=args.book,
+    verbose=args.verbose,
+  )
+  if args.metrics_port:
+    metrics.enable(args.metrics_port)
+    metrics.register_probe("processor", worker.collect_metrics)
+  print(f"[processor] {worker.consumer} handling {', '.join(symbols)}")
+  worker.run()
 
 
-     
\ No newline at end of file
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,288 @@
+"""Parallel feature builds over many symbols, sharded by whole UTC days.
+
+Every (symbol, shard) pair is an independent task on a process pool. A shard loads its
+own trades plus the ``max(rolling_windows)`` bars before it, which warm up the returns
+and rolling windows, and is seeded with the last bar that had trades before that
+lookback (prices to forward fill across a quiet stretch, and the last VWAP from real
+volume). It then builds exactly the rows a single pass over the whole range gives for
+its days. Bars are on the same grid whatever the shard, because the bar length divides
+a day, and ``add_rolling_features`` sums each window on its own, so the stitched
+partitions are identical to ``build_features`` output.
+
+Each task writes its own daily partitions (``YYYY-MM-DD.parquet``, as ``--incremental``
+does) and reports its timing; a watermark per symbol lets later ``--incremental`` runs
+continue the set.
+"""
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+from .features import (
+    BAR_COLUMNS,
+    DAY_MS,
+    DEFAULT_DB_PATH,
+    _last_valid_vwap,
+    _load_raw_bars,
+    _trade_source,
+    _write_watermark,
+    add_rolling_features,
+    fill_bars,
+    partition_paths,
+    write_partitions,
+)
+from .streaming import resample_to_ms
+
+
+class ShardTask(NamedTuple):
+    symbol: str
+    start_ts: int  # first ms of the shard's first day
+    end_ts: int  # first ms after the shard's last day
+    first_ts: int  # first and last trade of the whole build, for the bar grid's ends
+    last_ts: int
+    range_start: Optional[int]  # the build's own --start-ts, never read before
+    output_dir: Path
+    resample: str
+    rolling_windows: Tuple[int, ...]
+    db_path: Path
+    engine: str
+    lake_dir: Optional[Path]
+
+
+class ShardResult(NamedTuple):
+    symbol: str
+    start_ts: int
+    end_ts: int
+    rows: int
+    seconds: float
+    paths: List[Path]
+    last_bar_ts: Optional[int]
+    last_valid_vwap: Optional[float]
+
+
+def trade_bounds(
+    symbol: str,
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
+    db_path: Path = DEFAULT_DB_PATH,
+    lake_dir: Optional[Path] = None,
+) -> Optional[Tuple[int, int]]:
+    """First and last trade ts of ``symbol`` in ``[start_ts, end_ts]``, or ``None`` if it has none."""
+    with _trade_source(symbol, start_ts, end_ts, db_path, lake_dir) as source:
+        if source is None:
+            return None
+        con, query, params, _ = source
+        first, last = con.execute(f"SELECT min(ts), max(ts) FROM ({query})", params).fetchone()
+    return None if first is None else (int(first), int(last))
+
+
+def shard_ranges(first_ts: int, last_ts: int, shard_days: int = 1) -> List[Tuple[int, int]]:
+    """``[start, end)`` ranges of ``shard_days`` UTC days covering ``first_ts..last_ts``."""
+    if shard_days < 1:
+        raise ValueError("shards must span at least one day")
+    step = shard_days * DAY_MS
+    start = first_ts - first_ts % DAY_MS
+    return [(lo, lo + step) for lo in range(start, last_ts + 1, step)]
+
+
+def _last_trades_before(task: ShardTask, before: int) -> Tuple[Optional[int], Optional[int]]:
+    """ts of the last trade, and of the last one with volume, before ``before``.
+
+    The search window doubles from a day back, so a shard only scans the stretch
+    directly before it and not the whole history.
+    """
+    span = DAY_MS
+    floor = task.first_ts if task.range_start is None else max(task.first_ts, task.range_start)
+    last = last_traded = None
+    while last_traded is None:
+        lo = max(before - span, floor)
+        with _trade_source(task.symbol, lo, before - 1, task.db_path, task.lake_dir) as source:
+            if source is not None:
+                con, query, params, _ = source
+                found, found_traded = con.execute(
+                    f"SELECT max(ts), max(ts) FILTER (WHERE qty > 0) FROM ({query})", params
+                ).fetchone()
+                last = last if last is not None else found
+                last_traded = found_traded
+        if lo <= floor:
+            break
+        span *= 2
+    return last, last_traded
+
+
+def _seed(task: ShardTask, grid_start: int, bar_ms: int) -> Tuple[Optional[pd.Series], Optional[float]]:
+    """The filled bar just before ``grid_start`` and the last VWAP from real volume."""
+    last, last_traded = _last_trades_before(task, grid_start)
+    if last is None:
+        return None, None
+
+    def bar_at(ts: int) -> pd.DataFrame:
+        bucket = ts - ts % bar_ms
+        lo = bucket if task.range_start is None else max(bucket, task.range_start)
+        return _load_raw_bars(task.symbol, lo, bucket + bar_ms - 1, task.resample, task.db_path, task.engine, task.lake_dir)
+
+    previous = bar_at(last)
+    if last_traded is None:
+        return previous.iloc[-1], None
+    vwap_bar = previous if last_traded // bar_ms == last // bar_ms else bar_at(last_traded)
+    return previous.iloc[-1], _last_valid_vwap(vwap_bar)
+
+
+def build_shard(task: ShardTask) -> ShardResult:
+    """Build and write one shard's daily partitions."""
+    started = time.perf_counter()
+    bar_ms = resample_to_ms(task.resample)
+    lookback = max(task.rolling_windows, default=1) * bar_ms
+    first_bar = task.first_ts - task.first_ts % bar_ms
+    last_bar = task.last_ts - task.last_ts % bar_ms
+    load_start = max(task.start_ts - lookback, task.first_ts)
+    load_end = min(task.end_ts - 1, task.last_ts)
+    grid_start = max(load_start - load_start % bar_ms, first_bar)
+    grid_end = min(task.end_ts - bar_ms, last_bar)
+
+    def empty() -> ShardResult:
+        return ShardResult(task.symbol, task.start_ts, task.end_ts, 0, time.perf_counter() - started, [], None, None)
+
+    if grid_end < max(task.start_ts, first_bar):
+        return empty()
+    raw = _load_raw_bars(task.symbol, load_start, load_end, task.resample, task.db_path, task.engine, task.lake_dir)
+    # the whole grid, including quiet bars at either end that a single pass fills as well
+    grid = pd.date_range(
+        pd.to_datetime(grid_start, unit="ms", utc=True),
+        pd.to_datetime(grid_end, unit="ms", utc=True),
+        freq=task.resample,
+        name="timestamp",
+    )
+    bars = raw.reindex(grid) if not raw.empty else pd.DataFrame(index=grid, columns=list(BAR_COLUMNS), dtype=float)
+    bars["volume"] = bars["volume"].fillna(0.0)
+    bars["trade_count"] = bars["trade_count"].fillna(0).astype("int64")
+    previous, last_valid_vwap = _seed(task, grid_start, bar_ms) if grid_start > first_bar else (None, None)
+    if previous is None and bars["price_close"].isna().all():
+        return empty()
+
+    features = add_rolling_features(fill_bars(bars, previous=previous, last_valid_vwap=last_valid_vwap), task.rolling_windows)
+    features = features.dropna()
+    features = features[features.index >= pd.to_datetime(task.start_ts, unit="ms", utc=True)]
+    features["symbol"] = task.symbol
+    paths = write_partitions(features, task.output_dir) if not features.empty else []
+    shard_vwap = _last_valid_vwap(raw, last_valid_vwap) if not raw.empty else last_valid_vwap
+    return ShardResult(
+        task.symbol,
+        task.start_ts,
+        task.end_ts,
+        len(features),
+        time.perf_counter() - started,
+        paths,
+        int(features.index[-1].value // 1_000_000) if not features.empty else None,
+        shard_vwap,
+    )
+
+
+def plan_shards(
+    symbols: Iterable[str],
+    output_dir_for,
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
+    resample: str = "1min",
+    rolling_windows: Iterable[int] = (3, 5, 15),
+    shard_days: int = 1,
+    db_path: Path = DEFAULT_DB_PATH,
+    engine: str = "duckdb",
+    lake_dir: Optional[Path] = None,
+) -> Iterator[ShardTask]:
+    """Shard tasks of every symbol with trades in range; ``output_dir_for(symbol)`` names its directory."""
+    rolling_windows = tuple(rolling_windows)
+    if DAY_MS % resample_to_ms(resample):
+        raise ValueError(f"Sharded builds need a resample rule that divides a day, got {resample!r}")
+    for symbol in symbols:
+        bounds = trade_bounds(symbol, start_ts, end_ts, db_path, lake_dir)
+        if bounds is None:
+            print(f"⚠️  {symbol}: no trades in range, skipped")
+            continue
+        first_ts, last_ts = bounds
+        for lo, hi in shard_ranges(first_ts, last_ts, shard_days):
+            yield ShardTask(
+                symbol=symbol,
+                start_ts=lo,
+                end_ts=hi,
+                first_ts=first_ts,
+                last_ts=last_ts,
+                range_start=start_ts,
+                output_dir=output_dir_for(symbol),
+                resample=resample,
+                rolling_windows=rolling_windows,
+                db_path=db_path,
+                engine=engine,
+                lake_dir=lake_dir,
+            )
+
+
+def build_sharded(
+    symbols: Iterable[str],
+    output_dir_for,
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
+    resample: str = "1min",
+    rolling_windows: Iterable[int] = (3, 5, 15),
+    shard_days: int = 1,
+    db_path: Path = DEFAULT_DB_PATH,
+    engine: str = "duckdb",
+    lake_dir: Optional[Path] = None,
+    workers: Optional[int] = None,
+    verbose: bool = True,
+) -> List[ShardResult]:
+    """Build every symbol's features as daily partitions, shards in parallel.
+
+    Each symbol's directory is rebuilt from scratch, like a first ``--incremental`` run,
+    and gets a watermark for later incremental updates. Returns one result per shard.
+    """
+    rolling_windows = tuple(rolling_windows)
+    tasks = list(
+        plan_shards(symbols, output_dir_for, start_ts, end_ts, resample, rolling_windows, shard_days, db_path, engine, lake_dir)
+    )
+    for output_dir in {task.output_dir for task in tasks}:
+        for path in partition_paths(output_dir):
+            path.unlink()
+
+    workers = workers if workers is not None else os.cpu_count() or 1
+    results: List[ShardResult] = []
+
+    def report(result: ShardResult) -> None:
+        results.append(result)
+        if verbose:
+            day = pd.to_datetime(result.start_ts, unit="ms", utc=True).strftime("%Y-%m-%d")
+            print(f"[build] {result.symbol} {day} +{(result.end_ts - result.start_ts) // DAY_MS}d: {result.rows} rows in {result.seconds:.2f}s")
+
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            report(build_shard(task))
+    else:
+        with ProcessPoolExecutor(min(workers, len(tasks))) as pool:
+            for future in as_completed([pool.submit(build_shard, task) for task in tasks]):
+                report(future.result())
+
+    results.sort(key=lambda result: (result.symbol, result.start_ts))
+    by_symbol: Dict[str, List[ShardResult]] = {}
+    for result in results:
+        by_symbol.setdefault(result.symbol, []).append(result)
+    for symbol, shards in by_symbol.items():
+        built = [shard for shard in shards if shard.last_bar_ts is not None]
+        if not built:
+            continue
+        output_dir = next(task.output_dir for task in tasks if task.symbol == symbol)
+        _write_watermark(
+            output_dir,
+            {
+                "symbol": symbol,
+                "resample": resample,
+                "rolling_windows": list(rolling_windows),
+                "last_bar_ts": built[-1].last_bar_ts,
+                "last_valid_vwap": next((s.last_valid_vwap for s in reversed(shards) if s.last_valid_vwap is not None), None),
+            },
+        )
+    return results
@@ -0,0 +1,263 @@
+"""Incremental, O(1)-per-trade version of ``features.compute_window_features``."""
+from __future__ import annotations
+
+import math
+import re
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import pandas as pd
+
+DAY_MS = 86_400_000
+
+
+def resample_to_ms(resample: str) -> int:
+    """Length in ms of a fixed-frequency pandas resample rule such as "1min" or "5s"."""
+    offset = pd.tseries.frequencies.to_offset(resample)
+    try:
+        nanos = offset.nanos
+    except ValueError as exc:
+        raise ValueError(f"Resample rule {resample!r} is not a fixed frequency") from exc
+    if nanos % 1_000_000:
+        raise ValueError(f"Resample rule {resample!r} is finer than one millisecond")
+    return nanos // 1_000_000
+
+
+def windows_from_feature_cols(feature_cols: Iterable[str]) -> Tuple[int, ...]:
+    """Recover the rolling window lengths from column names like ``ma_15`` or ``vol_5``."""
+    windows = set()
+    for col in feature_cols:
+        match = re.fullmatch(r"(?:ma|vol|volumema)_(\d+)", col)
+        if match:
+            windows.add(int(match.group(1)))
+    return tuple(sorted(windows))
+
+
+def engine_columns(feature_cols: Iterable[str]) -> Set[str]:
+    """Feature names an engine configured for ``feature_cols`` (as ``FeatureWorker`` does) produces."""
+    engine = StreamingFeatureEngine(rolling_windows=windows_from_feature_cols(feature_cols))
+    engine.update(0, 1.0, 1.0)  # a fresh engine has no open bar and reports no features yet
+    return set(engine.features()) - {"bar_ts"}
+
+
+class RollingWindow:
+    """Ring buffer of the last ``size`` values with a running mean and sample variance.
+
+    Uses Welford's update for additions and its inverse for evictions, so both the mean
+    and the variance are O(1) per push. Like pandas, a window holding one repeated value
+    reports exactly that mean and zero variance, which also clears accumulated rounding
+    drift. ``peek`` returns the statistics the window would have after a push without
+    changing it.
+    """
+
+    def __init__(self, size: int):
+        if size < 1:
+            raise ValueError("Window size must be at least 1")
+        self.size = size
+        self._values: List[float] = [0.0] * size
+        self._start = 0
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._repeats = 0  # how many of the newest values equal the newest one
+
+    def _pushed(self, value: float) -> Tuple[int, float, float, int]:
+        count, mean, m2 = self.count, self.mean, self._m2
+        newest = self._values[(self._start + count - 1) % self.size] if count else None
+        repeats = self._repeats + 1 if value == newest else 1
+        if count == self.size:
+            evicted = self._values[self._start]
+            if count == 1:
+                count, mean, m2 = 0, 0.0, 0.0
+            else:
+                old_mean = mean
+                mean = (count * mean - evicted) / (count - 1)
+                m2 -= (evicted - old_mean) * (evicted - mean)
+                count -= 1
+        count += 1
+        repeats = min(repeats, count)
+        if repeats == count:
+            return count, value, 0.0, repeats
+        delta = value - mean
+        mean += delta / count
+        m2 += delta * (value - mean)
+        return count, mean, max(m2, 0.0), repeats
+
+    @staticmethod
+    def _std(count: int, m2: float) -> float:
+        # matches pandas rolling(...).std().fillna(0): sample std, 0 for a single value
+        return math.sqrt(m2 / (count - 1)) if count > 1 else 0.0
+
+    def push(self, value: float) -> Tuple[float, float]:
+        """Add ``value`` (evicting the oldest when full); return ``(mean, std)``."""
+        full = self.count == self.size
+        self.count, self.mean, self._m2, self._repeats = self._pushed(value)
+        if full:
+            self._values[self._start] = value
+            self._start = (self._start + 1) % self.size
+        else:
+            self._values[(self._start + self.count - 1) % self.size] = value
+        return self.mean, self._std(self.count, self._m2)
+
+    def peek(self, value: float) -> Tuple[float, float]:
+        count, mean, m2, _ = self._pushed(value)
+        return mean, self._std(count, m2)
+
+
+class StreamingFeatureEngine:
+    """Keeps bar-level state so features are available on every trade without recomputation.
+
+    Bars are bucketed exactly like ``compute_window_features`` (left-closed, aligned to the
+    first trade's day), empty bars are forward filled the same way, and every rolling
+    statistic is a :class:`RollingWindow`. ``update`` returns the features of the bars a
+    trade closes, ``flush`` closes the open bar, and ``snapshot`` gives the features the
+    open bar would have if it closed now. The engine also tracks a trade-count order flow
+    imbalance (``ofi``) over the last ``ofi_window`` trades.
+    """
+
+    def __init__(
+        self,
+        resample: str = "1min",
+        rolling_windows: Iterable[int] = (3, 5, 15),
+        ofi_window: int = 100,
+        symbol: Optional[str] = None,
+    ):
+        self.bar_ms = resample_to_ms(resample)
+        self.rolling_windows = tuple(rolling_windows)
+        self.symbol = symbol
+        self._windows = {
+            window: (RollingWindow(window), RollingWindow(window), RollingWindow(window))
+            for window in self.rolling_windows
+        }
+        self._ofi_sides: Deque[int] = deque(maxlen=ofi_window)
+        self._ofi_sum = 0
+
+        self._origin: Optional[int] = None
+        self._bar_start: Optional[int] = None
+        self._reset_bar()
+        self._prev: Optional[Dict[str, float]] = None  # last closed bar, used for forward fill
+        self._last_vwap: Optional[float] = None
+
+    @property
+    def feature_names(self) -> Tuple[str, ...]:
+        names = ["price_close", "price_open", "price_high", "price_low", "volume", "trade_count", "vwap", "return_1"]
+        for window in self.rolling_windows:
+            names += [f"ma_{window}", f"vol_{window}", f"volumema_{window}"]
+        return tuple(names)
+
+    @property
+    def ofi(self) -> float:
+        return self._ofi_sum / len(self._ofi_sides) if self._ofi_sides else 0.0
+
+    def _reset_bar(self) -> None:
+        self._open = self._high = self._low = self._close = math.nan
+        self._volume = 0.0
+        self._notional = 0.0
+        self._count = 0
+
+    def _bucket(self, ts: int) -> int:
+        if self._origin is None:
+            self._origin = ts - ts % DAY_MS
+        return self._origin + (ts - self._origin) // self.bar_ms * self.bar_ms
+
+    def update(self, ts: int, price: float, qty: float, side: str = "buy") -> List[Dict[str, float]]:
+        """Add one trade; return the features of every bar it closes (oldest first)."""
+        side_sign = 1 if side == "buy" else -1
+        if len(self._ofi_sides) == self._ofi_sides.maxlen:
+            self._ofi_sum -= self._ofi_sides[0]
+        self._ofi_sides.append(side_sign)
+        self._ofi_sum += side_sign
+
+        bucket = self._bucket(int(ts))
+        closed: List[Dict[str, float]] = []
+        if self._bar_start is None:
+            self._bar_start = bucket
+        elif bucket > self._bar_start:
+            closed.append(self._close_bar())
+            while self._bar_start < bucket:  # forward-filled bars for intervals without trades
+                closed.append(self._close_bar())
+        # trades older than the open bar are folded into it, as the stream is assumed ordered
+
+        if self._count == 0:
+            self._open = self._high = self._low = price
+        else:
+            self._high = max(self._high, price)
+            self._low = min(self._low, price)
+        self._close = price
+        self._volume += qty
+        self._notional += price * qty
+        self._count += 1
+        return closed
+
+    def flush(self) -> List[Dict[str, float]]:
+        """Close the open bar, e.g. at the end of a replay."""
+        if self._bar_start is None or self._count == 0:
+            return []
+        return [self._close_bar()]
+
+    def snapshot(self) -> Dict[str, float]:
+        """Features of the open bar as if it closed now (empty dict before the first trade)."""
+        if self._bar_start is None:
+            return {}
+        return self._bar_features(commit=False)
+
+    def features(self, feature_cols: Optional[Sequence[str]] = None) -> Dict[str, float]:
+        """Snapshot restricted to ``feature_cols`` (all features when omitted), plus ``ofi``."""
+        snapshot = self.snapshot()
+        if feature_cols is not None:
+            snapshot = {col: snapshot.get(col, 0.0) for col in feature_cols}
+        snapshot["ofi"] = self.ofi
+        return snapshot
+
+    def _close_bar(self) -> Dict[str, float]:
+        row = self._bar_features(commit=True)
+        self._bar_start += self.bar_ms
+        self._reset_bar()
+        return row
+
+    def _bar_features(self, commit: bool) -> Dict[str, float]:
+        prev = self._prev
+        if self._count:
+            price_open, price_high, price_low, price_close = self._open, self._high, self._low, self._close
+        else:
+            price_open, price_high, price_low, price_close = (
+                prev["price_open"], prev["price_high"], prev["price_low"], prev["price_close"]
+            )
+
+        last_vwap = self._last_vwap
+        if self._volume != 0:
+            vwap = last_vwap = self._notional / self._volume
+        elif last_vwap is not None:
+            vwap = last_vwap
+        else:
+            vwap = price_close
+        return_1 = price_close / prev["price_close"] - 1 if prev is not None else 0.0
+
+        row: Dict[str, float] = {
+            "bar_ts": self._bar_start,
+            "price_close": price_close,
+            "price_open": price_open,
+            "price_high": price_high,
+            "price_low": price_low,
+            "volume": self._volume,
+            "trade_count": self._count,
+            "vwap": vwap,
+            "return_1": return_1,
+        }
+        for window, (closes, returns, volumes) in self._windows.items():
+            if commit:
+                ma, _ = closes.push(price_close)
+                _, vol = returns.push(return_1)
+                volumema, _ = volumes.push(self._volume)
+            else:
+                ma, _ = closes.peek(price_close)
+                _, vol = returns.peek(return_1)
+                volumema, _ = volumes.peek(self._volume)
+            row[f"ma_{window}"] = ma
+            row[f"vol_{window}"] = vol
+            row[f"volumema_{window}"] = volumema
+
+        if commit:
+            self._prev = row
+            self._last_vwap = last_vwap
+        return row
@@ -0,0 +1,159 @@
+"""Walk-forward hyperparameter and horizon sweep for the baseline classifier.
+
+The feature matrix and every (horizon, threshold) label vector are built once and saved
+as ``.npy`` files that each worker memory-maps read-only, so a pool of processes shares
+one copy of the data instead of pickling it into every task. Each task fits one
+``LogisticRegression(C)`` on one walk-forward fold.
+"""
+from __future__ import annotations
+
+import itertools
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+
+from .train_model import evaluate_classifier
+
+WINDOWS = ("expanding", "rolling")
+
+Fold = Tuple[int, int, int, int]  # train_start, train_end, test_start, test_end (row offsets)
+Task = Tuple[int, float, int, Fold]  # target index, C, fold index, fold
+
+_X: Optional[np.ndarray] = None
+_LABELS: Optional[np.ndarray] = None
+
+
+def label_matrix(prices: np.ndarray, targets: Sequence[Tuple[int, float]]) -> np.ndarray:
+    """One int8 row of ``build_targets`` labels per (horizon, threshold); -1 where the
+    future price is unknown (the last ``horizon`` rows)."""
+    labels = np.full((len(targets), len(prices)), -1, dtype=np.int8)
+    for row, (horizon, threshold) in enumerate(targets):
+        if horizon >= len(prices):
+            continue
+        future_return = (prices[horizon:] - prices[:-horizon]) / prices[:-horizon]
+        labels[row, : len(prices) - horizon] = future_return >= threshold
+    return labels
+
+
+def walk_forward_folds(n_rows: int, folds: int, window: str = "expanding", gap: int = 0) -> List[Fold]:
+    """Split ``n_rows`` time-ordered rows into ``folds + 1`` blocks; fold k tests on block
+    k + 1 and trains on every earlier block (expanding) or only on block k (rolling).
+
+    The last ``gap`` training rows are dropped: their labels look ``gap`` rows ahead,
+    into the test block.
+    """
+    if window not in WINDOWS:
+        raise ValueError(f"window must be one of {WINDOWS}, got {window!r}")
+    edges = np.linspace(0, n_rows, folds + 2).astype(int)
+    splits = []
+    for k in range(folds):
+        train_start = 0 if window == "expanding" else int(edges[k])
+        train_end = int(edges[k + 1]) - gap
+        if train_end > train_start and edges[k + 2] > edges[k + 1]:
+            splits.append((train_start, train_end, int(edges[k + 1]), int(edges[k + 2])))
+    return splits
+
+
+def _attach(x_path: str, labels_path: str) -> None:
+    global _X, _LABELS
+    _X = np.load(x_path, mmap_mode="r")
+    _LABELS = np.load(labels_path, mmap_mode="r")
+
+
+def _fit_fold(task: Task) -> Dict[str, object]:
+    target, C, fold_index, (train_start, train_end, test_start, test_end) = task
+    labels = _LABELS[target]
+    train = np.arange(train_start, train_end)
+    test = np.arange(test_start, test_end)
+    train = train[labels[train] >= 0]
+    test = test[labels[test] >= 0]
+    result = {"target": target, "C": C, "fold": fold_index, "train_rows": len(train), "test_rows": len(test)}
+    y_train = labels[train]
+    if len(test) == 0 or len(np.unique(y_train)) < 2:
+        return result  # nothing to learn or score: the fold is left out of the averages
+    model = LogisticRegression(max_iter=500, C=C)
+    model.fit(_X[train], y_train)
+    result.update(evaluate_classifier(model, _X[test], labels[test]))
+    return result
+
+
+def _run_tasks(tasks: List[Task], x_path: Path, labels_path: Path, workers: int) -> List[Dict[str, object]]:
+    global _X, _LABELS
+    if workers <= 1:
+        _attach(str(x_path), str(labels_path))
+        try:
+            return [_fit_fold(task) for task in tasks]
+        finally:
+            _X = _LABELS = None
+    chunksize = max(1, len(tasks) // (workers * 4))
+    with ProcessPoolExecutor(workers, initializer=_attach, initargs=(str(x_path), str(labels_path))) as pool:
+        return list(pool.map(_fit_fold, tasks, chunksize=chunksize))
+
+
+def leaderboard(results: List[Dict[str, object]], targets: Sequence[Tuple[int, float]]) -> List[Dict[str, object]]:
+    """Per (C, horizon, threshold) fold averages, best mean ROC AUC first."""
+    grouped: Dict[Tuple[int, float], List[Dict[str, object]]] = {}
+    for result in results:
+        grouped.setdefault((result["target"], result["C"]), []).append(result)
+    board = []
+    for (target, C), folds in grouped.items():
+        scored = [fold for fold in folds if "accuracy" in fold]
+        aucs = [fold["roc_auc"] for fold in scored if fold["roc_auc"] is not None]
+        horizon, threshold = targets[target]
+        board.append(
+            {
+                "C": C,
+                "horizon": horizon,
+                "threshold": threshold,
+                "folds": len(scored),
+                "roc_auc": float(np.mean(aucs)) if aucs else None,
+                "roc_auc_std": float(np.std(aucs)) if aucs else None,
+                "accuracy": float(np.mean([fold["accuracy"] for fold in scored])) if scored else None,
+                "per_fold": [
+                    {key: value for key, value in fold.items() if key not in ("target", "C")}
+                    for fold in sorted(folds, key=lambda fold: fold["fold"])
+                ],
+            }
+        )
+    board.sort(key=lambda row: (row["roc_auc"] is None, -(row["roc_auc"] or 0.0), -(row["accuracy"] or 0.0)))
+    return board
+
+
+def sweep(
+    features: pd.DataFrame,
+    feature_cols: Tuple[str, ...],
+    Cs: Sequence[float],
+    horizons: Sequence[int],
+    thresholds: Sequence[float],
+    folds: int = 5,
+    window: str = "expanding",
+    workers: Optional[int] = None,
+    scratch_dir: Optional[Path] = None,
+) -> List[Dict[str, object]]:
+    """Evaluate every (C, horizon, threshold) on the same walk-forward folds; returns the leaderboard."""
+    features = features.sort_index()
+    targets = list(itertools.product(horizons, thresholds))
+    workers = workers if workers is not None else os.cpu_count() or 1
+    gap = max(horizons)  # one purge for all targets, so every config is scored on the same rows
+    splits = walk_forward_folds(len(features), folds, window, gap=gap)
+    if not splits:
+        raise ValueError(f"{len(features)} rows are too few for {folds} folds with a {gap}-row gap")
+    tasks = [
+        (target, float(C), fold_index, fold)
+        for target in range(len(targets))
+        for C in Cs
+        for fold_index, fold in enumerate(splits)
+    ]
+    with tempfile.TemporaryDirectory(dir=scratch_dir, prefix="sweep-") as tmp:
+        x_path = Path(tmp) / "X.npy"
+        labels_path = Path(tmp) / "labels.npy"
+        np.save(x_path, features.loc[:, list(feature_cols)].to_numpy(dtype=np.float64))
+        np.save(labels_path, label_matrix(features["price_close"].to_numpy(dtype=np.float64), targets))
+        results = _run_tasks(tasks, x_path, labels_path, workers)
+    return leaderboard(results, targets)
@@ -4,7 +4,7 @@ from __future__ import annotations
 import argparse
 import json
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
 
 import joblib
 import numpy as np
@@ -13,14 +13,32 @@ from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import classification_report, roc_auc_score
 from sklearn.model_selection import train_test_split
 
+from .feature_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, FeatureCache, FeatureRequest
+from .features import DEFAULT_DB_PATH, build_features, load_partitions
+
 
 FEATURE_DIR = Path("storage/features")
 MODEL_DIR = Path("storage/models")
 
 
-def load_features(path: Path) -> pd.DataFrame:
+def load_features(
+    path: Optional[Path] = None,
+    cache: Optional[FeatureCache] = None,
+    request: Optional[FeatureRequest] = None,
+    db_path: Path = DEFAULT_DB_PATH,
+    lake_dir: Optional[Path] = None,
+) -> pd.DataFrame:
+    """Features from a Parquet file or partition directory, or, given a ``cache`` and a
+    ``request``, from the feature cache (built from ``db_path``/``lake_dir`` on a miss)."""
+    if cache is not None and request is not None:
+        return build_features(*request, db_path=db_path, lake_dir=lake_dir, cache=cache)
     if not path.exists():
         raise FileNotFoundError(f"Feature file not found: {path}")
+    if path.is_dir():  # daily partitions written by build_features --incremental
+        features = load_partitions(path)
+        if features.empty:
+            raise FileNotFoundError(f"No feature partitions in {path}")
+        return features
     return pd.read_parquet(path)
 
 
@@ -49,20 +67,60 @@ def train_baseline_classifier(
 
     model = LogisticRegression(max_iter=500, C=C)
     model.fit(X_train, y_train)
+    return model, evaluate_classifier(model, X_test, y_test, require_auc=True)
+
 
+def evaluate_classifier(
+    model: LogisticRegression, X_test: np.ndarray, y_test: np.ndarray, require_auc: bool = False
+) -> Dict[str, float]:
+    """Hold-out metrics; ``roc_auc`` is ``None`` when the test labels are all one class
+    (unless ``require_auc``, where sklearn's error is raised)."""
     y_prob = model.predict_proba(X_test)[:, 1]
     y_pred = (y_prob >= 0.5).astype(int)
 
+    two_classes = len(np.unique(y_test)) > 1
     metrics = {
-        "roc_auc": float(roc_auc_score(y_test, y_prob)),
+        "roc_auc": float(roc_auc_score(y_test, y_prob)) if two_classes or require_auc else None,
         "accuracy": float((y_pred == y_test).mean()),
     }
-    report = classification_report(y_test, y_pred, output_dict=True)
+    report = classification_report(y_test, y_pred, output_dict=True, zero_division=0)
     if "1" in report:
         metrics["precision"] = float(report["1"].get("precision", 0.0))
         metrics["recall"] = float(report["1"].get("recall", 0.0))
         metrics["f1"] = float(report["1"].get("f1-score", 0.0))
-    return model, metrics
+    return metrics
+
+
+def feature_columns(dataset: pd.DataFrame) -> Tuple[str, ...]:
+    """Numeric columns other than the target ones."""
+    return tuple(
+        col
+        for col in dataset.columns
+        if col not in {"label", "future_return"}
+        and pd.api.types.is_numeric_dtype(dataset[col])
+    )
+
+
+def save_bundle(
+    model_dir: Path,
+    symbol: str,
+    freq: str,
+    horizon: int,
+    model: LogisticRegression,
+    feature_cols: Tuple[str, ...],
+    meta: Dict[str, object],
+) -> Path:
+    """Write ``<symbol>_<freq>_h<horizon>.joblib`` and its ``.json`` metadata."""
+    model_dir.mkdir(parents=True, exist_ok=True)
+    model_path = model_dir / f"{symbol.lower()}_{freq}_h{horizon}.joblib"
+
+    # write then rename, so a service watching the directory never loads a half-written bundle
+    tmp_path = model_path.with_name(model_path.name + ".tmp")
+    joblib.dump({"model": model, "feature_cols": feature_cols}, tmp_path)
+    tmp_path.replace(model_path)
+
+    model_path.with_suffix(".json").write_text(json.dumps(meta, indent=2))
+    return model_path
 
 
 def parse_args() -> argparse.Namespace:
@@ -70,9 +128,50 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("symbol", help="Trading pair symbol, e.g. BTCUSDT")
     parser.add_argument("--features", type=Path, help="Feature parquet path")
     parser.add_argument("--freq", default="1min", help="Feature frequency label")
-    parser.add_argument("--horizon", type=int, default=1, help="Prediction horizon (steps)")
+    parser.add_argument("--horizon", type=int, nargs="+", default=[1], help="Prediction horizon (steps)")
+    parser.add_argument(
+        "--threshold", type=float, nargs="+", default=[0.001], help="Return threshold to label a trade as buy"
+    )
+    parser.add_argument("--C", type=float, nargs="+", default=[1.0], help="Inverse regularization strength")
+    parser.add_argument(
+        "--sweep",
+        action="store_true",
+        help="Walk-forward evaluate every --C/--horizon/--threshold combination and keep the best",
+    )
+    parser.add_argument("--folds", type=int, default=5, help="Walk-forward folds for --sweep")
+    parser.add_argument(
+        "--window", choices=("expanding", "rolling"), default="expanding", help="Training window for --sweep folds"
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Processes for --sweep (default: all CPUs)")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Train out of core on record batches with an incremental SGD logistic model",
+    )
+    parser.add_argument("--batch-rows", type=int, default=250_000, help="Rows per record batch for --stream")
     parser.add_argument(
-        "--threshold", type=float, default=0.001, help="Return threshold to label a trade as buy"
+        "--cache",
+        action="store_true",
+        help="Load features through the feature cache (built from --db/--lake on a miss) instead of --features",
+    )
+    parser.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR, help="Feature cache directory")
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=DEFAULT_MAX_BYTES // 1024**2,
+        help="Evict least recently used cache entries beyond this size (as in build_features)",
+    )
+    parser.add_argument("--start-ts", type=int, default=None, help="Start timestamp (ms) of cached features")
+    parser.add_argument("--end-ts", type=int, default=None, help="End timestamp (ms) of cached features")
+    parser.add_argument("--rolling", nargs="*", type=int, default=[3, 5, 15], help="Rolling windows of cached features")
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB_PATH, help="DuckDB trades for cache misses")
+    parser.add_argument("--lake", type=Path, default=None, help="Parquet trade lake for cache misses")
+    parser.add_argument("--epochs", type=int, default=1, help="Passes over the training rows for --stream")
+    parser.add_argument(
+        "--engine",
+        choices=("arrow", "duckdb"),
+        default="arrow",
+        help="--stream reader: Parquet row groups (sorted files) or a DuckDB ORDER BY",
     )
     parser.add_argument(
         "--features-dir",
@@ -89,43 +188,118 @@ def parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
+def run_sweep(args: argparse.Namespace, features: pd.DataFrame, feature_path: Path) -> None:
+    from .sweep import sweep
+
+    feature_cols = feature_columns(features)
+    board = sweep(
+        features,
+        feature_cols,
+        Cs=args.C,
+        horizons=args.horizon,
+        thresholds=args.threshold,
+        folds=args.folds,
+        window=args.window,
+        workers=args.workers,
+    )
+    args.model_dir.mkdir(parents=True, exist_ok=True)
+    board_path = args.model_dir / f"{args.symbol.lower()}_{args.freq}_sweep.json"
+    board_path.write_text(json.dumps(board, indent=2))
+    print(f"📋 Leaderboard ({len(board)} configs, {args.window} folds) saved to {board_path}")
+    for row in board[:5]:
+        print(f"  C={row['C']:<8g} h={row['horizon']:<3} thr={row['threshold']:<8g} auc={row['roc_auc']} acc={row['accuracy']}")
+
+    best = board[0]
+    if best["roc_auc"] is None:
+        raise SystemExit("No configuration could be scored; widen the data or lower --folds")
+    # refit the winner on every labelled row, like the single-config path does with its train split
+    dataset = build_targets(features, horizon=best["horizon"], threshold=best["threshold"])
+    model = LogisticRegression(max_iter=500, C=best["C"])
+    model.fit(dataset.loc[:, feature_cols].to_numpy(), dataset["label"].to_numpy())
+    meta = {
+        "symbol": args.symbol,
+        "feature_path": feature_path.as_posix(),
+        "feature_cols": feature_cols,
+        "horizon": best["horizon"],
+        "threshold": best["threshold"],
+        "C": best["C"],
+        "metrics": {"roc_auc": best["roc_auc"], "roc_auc_std": best["roc_auc_std"], "accuracy": best["accuracy"]},
+        "validation": {"window": args.window, "folds": best["folds"], "leaderboard": board_path.as_posix()},
+    }
+    model_path = save_bundle(args.model_dir, args.symbol, args.freq, best["horizon"], model, feature_cols, meta)
+    print(f"✅ Best model saved to {model_path}")
+
+
+def run_stream(args: argparse.Namespace, feature_path: Path) -> None:
+    from .train_stream import train_streaming
+
+    if args.sweep or len(args.horizon) > 1 or len(args.threshold) > 1:
+        raise SystemExit("--stream trains a single --horizon/--threshold and cannot be combined with --sweep")
+    horizon, threshold = args.horizon[0], args.threshold[0]
+    model, feature_cols, metrics = train_streaming(
+        feature_path,
+        horizon,
+        threshold,
+        batch_rows=args.batch_rows,
+        epochs=args.epochs,
+        engine=args.engine,
+    )
+    meta = {
+        "symbol": args.symbol,
+        "feature_path": feature_path.as_posix(),
+        "feature_cols": feature_cols,
+        "horizon": horizon,
+        "threshold": threshold,
+        "metrics": metrics,
+        "training": {"mode": "stream", "engine": args.engine, "batch_rows": args.batch_rows, "epochs": args.epochs},
+    }
+    model_path = save_bundle(args.model_dir, args.symbol, args.freq, horizon, model, feature_cols, meta)
+    print(f"✅ Model saved to {model_path}")
+    print(json.dumps(metrics, indent=2))
+
+
 def main() -> None:
     args = parse_args()
     feature_path = args.features
     if feature_path is None:
         feature_path = args.features_dir / f"{args.symbol.lower()}_{args.freq}.parquet"
 
-    features = load_features(feature_path)
-
-    dataset = build_targets(features, horizon=args.horizon, threshold=args.threshold)
-    feature_cols = tuple(
-        col
-        for col in dataset.columns
-        if col not in {"label", "future_return"}
-        and pd.api.types.is_numeric_dtype(dataset[col])
-    )
-
-    model, metrics = train_baseline_classifier(dataset, feature_cols)
+    if args.cache:
+        if args.stream:
+            raise SystemExit("--stream reads feature files directly; build them with build_features --cache first")
+        cache = FeatureCache(args.cache_dir, args.cache_max_mb * 1024**2)
+        request = FeatureRequest(args.symbol, args.start_ts, args.end_ts, args.freq, tuple(args.rolling))
+        features = load_features(cache=cache, request=request, db_path=args.db, lake_dir=args.lake)
+        feature_path = args.cache_dir
+        print(f"🗄️  Feature cache: {json.dumps(cache.report()['session'])}")
+    elif args.stream:
+        run_stream(args, feature_path)
+        return
+    else:
+        features = load_features(feature_path)
+    if args.sweep:
+        run_sweep(args, features, feature_path)
+        return
+    if len(args.C) > 1 or len(args.horizon) > 1 or len(args.threshold) > 1:
+        raise SystemExit("Multiple --C/--horizon/--threshold values need --sweep")
+    horizon, threshold = args.horizon[0], args.threshold[0]
 
-    args.model_dir.mkdir(parents=True, exist_ok=True)
-    model_path = args.model_dir / f"{args.symbol.lower()}_{args.freq}_h{args.horizon}.joblib"
-    meta_path = model_path.with_suffix(".json")
+    dataset = build_targets(features, horizon=horizon, threshold=threshold)
+    feature_cols = feature_columns(dataset)
 
-    joblib.dump({"model": model, "feature_cols": feature_cols}, model_path)
+    model, metrics = train_baseline_classifier(dataset, feature_cols, C=args.C[0])
 
     meta = {
         "symbol": args.symbol,
         "feature_path": feature_path.as_posix(),
         "feature_cols": feature_cols,
-        "horizon": args.horizon,
-        "threshold": args.threshold,
+        "horizon": horizon,
+        "threshold": threshold,
         "metrics": metrics,
     }
-
-    meta_path.write_text(json.dumps(meta, indent=2))
+    model_path = save_bundle(args.model_dir, args.symbol, args.freq, horizon, model, feature_cols, meta)
     print(f"✅ Model saved to {model_path}")
     print(json.dumps(metrics, indent=2))
 
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,226 @@
+"""Out-of-core training over feature files too large to load at once.
+
+Features are read in time-ordered record batches, either straight from the Parquet row
+groups (``engine="arrow"``, files must already be sorted, as ``build_features`` writes
+them) or through a DuckDB ``ORDER BY`` (which spills to disk) (``engine="duckdb"``). Labels
+need the price ``horizon`` rows ahead, so the last ``horizon`` rows of each batch are
+held back and labelled with the next one; the result is row for row what
+``build_targets`` + the 80/20 time split of ``train_model`` produce in memory.
+
+The model is a log-loss ``SGDClassifier`` fitted with ``partial_fit`` after one pass that
+collects the feature means and variances; the scaling is folded into its weights when
+training ends, so the saved bundle scores raw features like any other. Hold-out metrics
+are accumulated per batch (ROC AUC from a fine histogram of the predicted probabilities).
+Peak memory is a few batches whatever the dataset size.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import duckdb
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sklearn.linear_model import SGDClassifier
+from sklearn.preprocessing import StandardScaler
+
+from .features import partition_paths
+
+ENGINES = ("arrow", "duckdb")
+AUC_BINS = 10_000
+
+Batch = Tuple[np.ndarray, np.ndarray]  # features (rows x cols), price_close
+
+
+def feature_files(path: Path) -> List[Path]:
+    """A single feature file or the daily partitions of a directory, in time order."""
+    if not path.exists():
+        raise FileNotFoundError(f"Feature file not found: {path}")
+    files = partition_paths(path) if path.is_dir() else [path]
+    if not files:
+        raise FileNotFoundError(f"No feature partitions in {path}")
+    return files
+
+
+def _time_column(schema: pa.Schema) -> Optional[str]:
+    return next((field.name for field in schema if pa.types.is_timestamp(field.type)), None)
+
+
+def schema_feature_cols(schema: pa.Schema) -> Tuple[str, ...]:
+    """Numeric columns, in file order, as ``train_model.feature_columns`` picks them."""
+    return tuple(
+        field.name
+        for field in schema
+        if (pa.types.is_integer(field.type) or pa.types.is_floating(field.type))
+        and field.name not in {"label", "future_return"}
+    )
+
+
+def count_rows(files: Sequence[Path]) -> int:
+    return sum(pq.ParquetFile(path).metadata.num_rows for path in files)
+
+
+def iter_batches(
+    files: Sequence[Path], feature_cols: Sequence[str], batch_rows: int = 250_000, engine: str = "arrow"
+) -> Iterator[Batch]:
+    """Yield ``(X, price_close)`` blocks in time order."""
+    if engine not in ENGINES:
+        raise ValueError(f"engine must be one of {ENGINES}, got {engine!r}")
+    time_col = _time_column(pq.read_schema(files[0]))
+    columns = list(dict.fromkeys([*feature_cols, "price_close", *([time_col] if time_col else [])]))
+    if engine == "duckdb":
+        yield from _duckdb_batches(files, columns, feature_cols, time_col, batch_rows)
+        return
+    last = None
+    for path in files:
+        for record_batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows, columns=columns):
+            if time_col:
+                times = record_batch.column(time_col).cast(pa.int64()).to_numpy()
+                if len(times) and ((last is not None and times[0] < last) or np.any(np.diff(times) < 0)):
+                    raise ValueError(f"{path} is not sorted by {time_col}; use engine='duckdb'")
+                if len(times):
+                    last = times[-1]
+            yield _arrays(record_batch, feature_cols)
+
+
+def _duckdb_batches(files, columns, feature_cols, time_col, batch_rows) -> Iterator[Batch]:
+    select = ", ".join(f'"{col}"' for col in columns)
+    order = f' ORDER BY "{time_col}"' if time_col else ""
+    with duckdb.connect() as con:
+        reader = con.execute(
+            f"SELECT {select} FROM read_parquet(?){order}", [[path.as_posix() for path in files]]
+        ).to_arrow_reader(batch_rows)
+        for record_batch in reader:
+            yield _arrays(record_batch, feature_cols)
+
+
+def _arrays(record_batch: pa.RecordBatch, feature_cols: Sequence[str]) -> Batch:
+    X = np.column_stack(
+        [record_batch.column(col).to_numpy(zero_copy_only=False).astype(np.float64) for col in feature_cols]
+    ).reshape(record_batch.num_rows, len(feature_cols))
+    return X, record_batch.column("price_close").to_numpy(zero_copy_only=False).astype(np.float64)
+
+
+def labelled_batches(batches: Iterator[Batch], horizon: int, threshold: float) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """``build_targets`` across batch boundaries: yields ``(X, label)`` for every row whose
+    price ``horizon`` rows ahead is known."""
+    carry_X: Optional[np.ndarray] = None
+    carry_price = np.empty(0)
+    for X, price in batches:
+        if carry_X is not None:
+            X = np.concatenate([carry_X, X])
+            price = np.concatenate([carry_price, price])
+        ready = len(price) - horizon
+        if ready > 0:
+            future_return = (price[horizon:] - price[:ready]) / price[:ready]
+            yield X[:ready], (future_return >= threshold).astype(np.int64)
+        keep = min(horizon, len(price))
+        carry_X, carry_price = X[len(price) - keep :], price[len(price) - keep :]
+
+
+def split_rows(batches: Iterator[Tuple[np.ndarray, np.ndarray]], n_train: int, train: bool):
+    """The first ``n_train`` labelled rows (``train=True``) or the rest."""
+    seen = 0
+    for X, y in batches:
+        start, stop = seen, seen + len(y)
+        seen = stop
+        lo, hi = (start, min(stop, n_train)) if train else (max(start, n_train), stop)
+        if hi > lo:
+            yield X[lo - start : hi - start], y[lo - start : hi - start]
+        if train and stop >= n_train:
+            return
+
+
+class StreamingMetrics:
+    """Accuracy, precision/recall/F1, log loss and binned ROC AUC, updated per batch."""
+
+    def __init__(self, bins: int = AUC_BINS):
+        self.bins = bins
+        self.positives = np.zeros(bins, dtype=np.int64)
+        self.negatives = np.zeros(bins, dtype=np.int64)
+        self.tp = self.fp = self.fn = self.correct = self.rows = 0
+        self.log_loss = 0.0
+
+    def update(self, y: np.ndarray, prob: np.ndarray) -> None:
+        which = np.minimum((prob * self.bins).astype(np.int64), self.bins - 1)
+        self.positives += np.bincount(which[y == 1], minlength=self.bins)
+        self.negatives += np.bincount(which[y == 0], minlength=self.bins)
+        pred = prob >= 0.5
+        self.tp += int(np.sum(pred & (y == 1)))
+        self.fp += int(np.sum(pred & (y == 0)))
+        self.fn += int(np.sum(~pred & (y == 1)))
+        self.correct += int(np.sum(pred == (y == 1)))
+        self.rows += len(y)
+        clipped = np.clip(prob, 1e-15, 1 - 1e-15)
+        self.log_loss -= float(np.sum(np.where(y == 1, np.log(clipped), np.log1p(-clipped))))
+
+    def roc_auc(self) -> Optional[float]:
+        pos, neg = self.positives.sum(), self.negatives.sum()
+        if not pos or not neg:
+            return None
+        # pairs where the positive scores higher, plus half the pairs sharing a bin
+        neg_below = np.cumsum(self.negatives) - self.negatives
+        return float((np.sum(self.positives * neg_below) + 0.5 * np.sum(self.positives * self.negatives)) / (pos * neg))
+
+    def result(self) -> Dict[str, Optional[float]]:
+        precision = self.tp / (self.tp + self.fp) if self.tp + self.fp else 0.0
+        recall = self.tp / (self.tp + self.fn) if self.tp + self.fn else 0.0
+        return {
+            "roc_auc": self.roc_auc(),
+            "accuracy": self.correct / self.rows if self.rows else None,
+            "precision": precision,
+            "recall": recall,
+            "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+            "log_loss": self.log_loss / self.rows if self.rows else None,
+            "rows": self.rows,
+        }
+
+
+def train_streaming(
+    path: Path,
+    horizon: int,
+    threshold: float,
+    feature_cols: Optional[Tuple[str, ...]] = None,
+    test_size: float = 0.2,
+    batch_rows: int = 250_000,
+    epochs: int = 1,
+    alpha: float = 1e-4,
+    engine: str = "arrow",
+) -> Tuple[SGDClassifier, Tuple[str, ...], Dict[str, Optional[float]]]:
+    """Fit the streaming classifier on the first ``1 - test_size`` of the labelled rows
+    and score the rest; returns ``(model, feature_cols, metrics)``."""
+    files = feature_files(path)
+    feature_cols = feature_cols or schema_feature_cols(pq.read_schema(files[0]))
+    labelled = count_rows(files) - horizon
+    n_train = labelled - int(np.ceil(labelled * test_size))  # as train_test_split(shuffle=False)
+    if n_train <= 0 or n_train >= labelled:
+        raise ValueError(f"{labelled} labelled rows are too few to split {1 - test_size:.0%}/{test_size:.0%}")
+
+    def train_rows():
+        batches = iter_batches(files, feature_cols, batch_rows, engine)
+        return split_rows(labelled_batches(batches, horizon, threshold), n_train, train=True)
+
+    scaler = StandardScaler()
+    for X, _ in train_rows():
+        scaler.partial_fit(X)
+    scale = np.where(scaler.scale_ > 0, scaler.scale_, 1.0)
+
+    model = SGDClassifier(loss="log_loss", alpha=alpha, random_state=0)
+    classes = np.array([0, 1])
+    for _ in range(epochs):
+        for X, y in train_rows():
+            model.partial_fit((X - scaler.mean_) / scale, y, classes=classes)
+
+    # fold the scaling into the weights: w . (x - mean) / scale + b == (w / scale) . x + b'
+    coef = model.coef_ / scale
+    model.intercept_ = model.intercept_ - coef @ scaler.mean_
+    model.coef_ = coef
+
+    metrics = StreamingMetrics()
+    batches = iter_batches(files, feature_cols, batch_rows, engine)
+    for X, y in split_rows(labelled_batches(batches, horizon, threshold), n_train, train=False):
+        metrics.update(y, model.predict_proba(X)[:, 1])
+    result = metrics.result()
+    result["train_rows"] = n_train
+    return model, feature_cols, result
@@ -1,6 +1,15 @@
-  CREATE TABLE trades (
-    ts BIGINT,
-    price DOUBLE,
-    qty DOUBLE,
-    side VARCHAR
-  );
\ No newline at end of file
+-- trade store, schema version 2 (see ingest/schema.py; migrate older files with
+-- python3 -m ingest.schema storage/trades.db). price/qty may be DECIMAL(38, 8) with --decimal.
+CREATE TYPE trade_side AS ENUM ('buy', 'sell');
+
+CREATE TABLE trades (
+  trade_id BIGINT,
+  ts BIGINT,
+  price DOUBLE,
+  qty DOUBLE,
+  side trade_side,
+  symbol VARCHAR
+);
+
+CREATE TABLE schema_version (version INTEGER);
+INSERT INTO schema_version VALUES (2);
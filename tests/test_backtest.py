@@ -0,0 +1,69 @@
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LogisticRegression
+
+from processor.backtest import GridBacktest, backtest, bars_per_year, next_returns
+from processor.predictor import PriceDirectionPredictor
+
+
+def loop_backtest(prob_up, returns, threshold, horizon, cost, long_only=False):
+    """Bar-by-bar reference for one strategy."""
+    signals, position, equity, peak, drawdown, pnls, turnover = [], 0.0, 0.0, 0.0, 0.0, [], 0.0
+    for p, r in zip(prob_up, returns):
+        signal = 1.0 if p >= threshold else (-1.0 if p <= 1 - threshold and not long_only else 0.0)
+        signals.append(signal)
+        new_position = sum(signals[-horizon:]) / horizon
+        turnover += abs(new_position - position)
+        pnl = new_position * r - abs(new_position - position) * cost
+        position = new_position
+        equity += pnl
+        peak = max(peak, equity)
+        drawdown = max(drawdown, peak - equity)
+        pnls.append(pnl)
+    return sum(pnls), np.mean(pnls) / np.std(pnls), drawdown, turnover
+
+
+@pytest.mark.parametrize("long_only", [False, True])
+def test_grid_matches_a_bar_by_bar_loop_across_blocks(long_only):
+    rng = np.random.default_rng(5)
+    prob_up = rng.uniform(size=500)
+    returns = rng.normal(0, 0.001, size=500)
+    grid = GridBacktest([0.55, 0.7], [1, 4, 9], cost_bps=5, long_only=long_only)
+    for start in range(0, 500, 64):  # block edges must not change anything
+        grid.update(prob_up[start : start + 64], returns[start : start + 64])
+
+    results = grid.results()
+
+    assert len(results) == 6
+    for row in results:
+        pnl, sharpe, drawdown, turnover = loop_backtest(
+            prob_up, returns, row["threshold"], row["horizon"], 5 / 10_000, long_only
+        )
+        assert row["pnl"] == pytest.approx(pnl)
+        assert row["sharpe"] == pytest.approx(sharpe)
+        assert row["max_drawdown"] == pytest.approx(drawdown)
+        assert row["turnover"] == pytest.approx(turnover)
+    assert [row["sharpe"] for row in results] == sorted((row["sharpe"] for row in results), reverse=True)
+
+
+def test_backtest_scores_a_bundle_and_annualizes_by_bar_spacing(tmp_path):
+    rng = np.random.default_rng(2)
+    n = 2000
+    signal = rng.normal(size=n)
+    close = 100 * np.exp(np.cumsum(np.r_[0.0, 0.001 * signal[:-1]] + rng.normal(0, 0.0002, n)))
+    features = pd.DataFrame(
+        {"price_close": close, "signal": signal},
+        index=pd.date_range("2024-01-01", periods=n, freq="1s", name="bar_ts"),
+    )
+    model = LogisticRegression().fit(features[["signal"]].to_numpy(), (next_returns(close) > 0).astype(int))
+    joblib.dump({"model": model, "feature_cols": ("signal",)}, tmp_path / "model.joblib")
+
+    results = backtest(features, PriceDirectionPredictor(tmp_path / "model.joblib"), [0.6], [1, 5], fee_bps=1)
+
+    assert bars_per_year(features.index) == 365 * 86_400
+    assert results[0]["horizon"] == 1 and results[0]["pnl"] > 0  # the feature predicts the next bar
+    assert results[0]["costs"] == pytest.approx(results[0]["turnover"] / 10_000)
+    with pytest.raises(ValueError):
+        backtest(features, PriceDirectionPredictor(tmp_path / "missing.joblib"), [0.6], [1])
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from benchmarks.bench_pipeline import STAGES, check_budgets, main
+from benchmarks.broker import MemoryBroker
+
+
+def test_memory_broker_serves_reads_groups_and_pipelines():
+    broker = MemoryBroker()
+    pipe = broker.pipeline(transaction=False)
+    for i in range(5):
+        pipe.xadd("trades:x", {"ts": i})
+    ids = pipe.execute()
+
+    assert broker.xread({"trades:x": ids[1]}, count=2) == [[b"trades:x", broker.xrange("trades:x", ids[2], ids[3])]]
+    assert broker.xread({"trades:x": "$"}, block=10) == []
+    assert broker.xrange("trades:x", "-", "+", count=1)[0][1] == {b"ts": b"0"}
+    assert [m for m, _ in broker.xrevrange("trades:x", count=2)] == ids[:2:-1][:2]
+
+    broker.xgroup_create("trades:x", "g", id="0")
+    [[name, batch]] = broker.xreadgroup("g", "c1", {"trades:x": ">"}, count=3)
+    assert name == b"trades:x" and [m for m, _ in batch] == ids[:3]
+    assert broker.xack("trades:x", "g", *ids[:2]) == 2
+    assert [m for m, _ in broker.xreadgroup("g", "c1", {"trades:x": "0"})[0][1]] == [ids[2]]
+
+
+def test_check_budgets_flags_minimums_and_maximums():
+    results = {"ingest": {"throughput": 900.0, "p95_ms": 3.0}, "websocket": {"p95_ms": 80.0, "dropped": 0}}
+    budgets = {
+        "ingest": {"min_throughput": 1000, "max_p95_ms": 5},
+        "websocket": {"max_p95_ms": 50, "max_dropped": 0},
+        "processor": {"min_throughput": 1},
+    }
+
+    failures = check_budgets(results, budgets)
+
+    assert len(failures) == 2
+    assert failures[0].startswith("ingest.throughput") and failures[1].startswith("websocket.p95_ms")
+
+
+def test_pipeline_benchmark_runs_every_stage_in_process(tmp_path):
+    out, budgets = tmp_path / "bench.json", tmp_path / "budgets.json"
+    budgets.write_text(json.dumps({"websocket": {"max_dropped": 0}, "ingest": {"max_p99_ms": 0.0}}))
+
+    status = main(
+        ["--trades", "300", "--ws-trades", "40", "--ws-rate", "2000", "--model", str(tmp_path / "none.joblib"),
+         "--out", str(out), "--budgets", str(budgets)]
+    )
+
+    results = json.loads(out.read_text())["results"]
+    assert list(results) == list(STAGES)
+    assert results["processor"]["trades"] == results["predictor"]["trades"] == 300
+    assert results["websocket"]["trades"] == 40 and results["websocket"]["dropped"] == 0
+    assert all(results[stage]["p99_ms"] >= results[stage]["p50_ms"] > 0 for stage in STAGES)
+    assert status == 1  # the zero ingest latency budget cannot hold
+
+
+@pytest.mark.parametrize("wire", ["text", "binary"])
+def test_pipeline_benchmark_stage_selection_pulls_in_producers(tmp_path, wire):
+    out = tmp_path / "bench.json"
+
+    main(["--trades", "200", "--stages", "predictor", "--wire", wire, "--model", str(tmp_path / "none.joblib"),
+          "--out", str(out), "--budgets", str(tmp_path / "missing.json")])
+
+    assert list(json.loads(out.read_text())["results"]) == ["ingest", "processor", "predictor"]
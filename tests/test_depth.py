@@ -0,0 +1,206 @@
+import asyncio
+import json
+import random
+
+import numpy as np
+import pytest
+import websockets
+
+from ingest.depth import APPLIED, GAP, STALE, DepthIngester, OrderBook, consume_depth, depth_stream_url
+from ingest.wire import decode_entry
+from processor.processor import FeatureWorker
+from tests.test_worker import FakeGroupRedis, add_trades
+
+
+def snapshot(last_update_id, bids, asks):
+    return {
+        "lastUpdateId": last_update_id,
+        "bids": [[str(p), str(q)] for p, q in bids],
+        "asks": [[str(p), str(q)] for p, q in asks],
+    }
+
+
+def diff(first, last, bids=(), asks=(), symbol="BTCUSDT", ts=1700000000000):
+    return {
+        "e": "depthUpdate",
+        "E": ts + last,
+        "s": symbol,
+        "U": first,
+        "u": last,
+        "b": [[str(p), str(q)] for p, q in bids],
+        "a": [[str(p), str(q)] for p, q in asks],
+    }
+
+
+def test_book_matches_a_dict_reference_under_random_diffs():
+    rng = random.Random(7)
+    book = OrderBook()
+    bids = {100.0 - i * 0.5: 1.0 + i for i in range(20)}
+    asks = {100.5 + i * 0.5: 2.0 + i for i in range(20)}
+    book.load_snapshot(snapshot(10, bids.items(), asks.items()))
+    last = 10
+    for _ in range(300):
+        levels = {
+            side: [(round(rng.uniform(85, 115) * 2) / 2, rng.choice([0.0, 0.0, rng.uniform(0.1, 5)])) for _ in range(6)]
+            for side in "ba"
+        }
+        b = [(p, q) for p, q in levels["b"] if p < 100.25]
+        a = [(p, q) for p, q in levels["a"] if p > 100.25]
+        assert book.apply(diff(last + 1, last + 3, b, a)) == APPLIED
+        last += 3
+        for reference, updates in ((bids, b), (asks, a)):
+            for price, qty in updates:
+                if qty:
+                    reference[price] = qty
+                else:
+                    reference.pop(price, None)
+
+    bid_prices, bid_qty = book.bids.top(len(bids) + 10)
+    ask_prices, ask_qty = book.asks.top(len(asks) + 10)
+    assert bid_prices.tolist() == sorted(bids, reverse=True)
+    assert bid_qty.tolist() == [bids[p] for p in sorted(bids, reverse=True)]
+    assert ask_prices.tolist() == sorted(asks)
+    assert ask_qty.tolist() == [asks[p] for p in sorted(asks)]
+
+
+def test_sequence_checks_and_book_features():
+    book = OrderBook()
+    assert book.apply(diff(1, 2)) == GAP  # no snapshot yet
+    book.load_snapshot(snapshot(100, [(99.0, 1.0), (98.0, 3.0)], [(101.0, 3.0), (102.0, 1.0)]))
+
+    assert book.apply(diff(95, 100)) == STALE
+    assert book.apply(diff(99, 102, bids=[(98.0, 0)])) == APPLIED  # straddles lastUpdateId + 1
+    assert book.apply(diff(102, 104)) == GAP  # overlaps the previous diff instead of following it
+    assert not book.synced
+
+    book.load_snapshot(snapshot(200, [(99.0, 1.0), (98.0, 3.0)], [(101.0, 3.0), (102.0, 1.0)]))
+    features = book.features(top_n=2)
+    assert features["spread"] == 2.0
+    assert features["spread_bps"] == pytest.approx(2.0 / 100.0 * 10_000)
+    assert features["microprice"] == pytest.approx((99.0 * 3.0 + 101.0 * 1.0) / 4.0)
+    assert features["depth_imbalance_2"] == 0.0
+    assert book.apply(diff(201, 201, asks=[(101.0, 0)])) == APPLIED
+    assert book.features(top_n=1)["best_ask"] == 102.0
+
+
+def test_book_sides_are_capped_at_max_levels():
+    book = OrderBook(max_levels=3)
+    book.load_snapshot(snapshot(10, [(99.0 - i, 1.0) for i in range(5)], [(101.0 + i, 1.0) for i in range(5)]))
+    assert len(book.bids) == len(book.asks) == 3
+
+    # new levels near the touch push the far ones out; the best levels are kept exactly
+    assert book.apply(diff(11, 11, bids=[(99.5, 2.0), (99.25, 1.0)], asks=[(100.5, 2.0)])) == APPLIED
+    assert book.bids.top(5)[0].tolist() == [99.5, 99.25, 99.0]
+    assert book.asks.top(5)[0].tolist() == [100.5, 101.0, 102.0]
+
+
+def test_rows_are_flushed_while_the_socket_is_quiet():
+    client = FakeGroupRedis()
+    ingester = DepthIngester(
+        client, ["btcusdt"], fetch_snapshot=lambda symbol, limit: snapshot(10, [(99.0, 1.0)], [(101.0, 1.0)]), flush_interval=0.01
+    )
+    published = asyncio.Event()
+
+    async def messages():
+        yield json.dumps(diff(9, 11, bids=[(99.0, 2.0)]))
+        # no more messages until the replayed row has been published by the timer
+        await asyncio.wait_for(published.wait(), timeout=2)
+
+    async def scenario():
+        task = asyncio.create_task(ingester.run(messages()))
+        while "book:btcusdt" not in client.streams:
+            await asyncio.sleep(0.005)
+        published.set()
+        await task
+
+    asyncio.run(scenario())
+
+    rows = [row for _, entry in client.streams["book:btcusdt"] for row in decode_entry(entry)]
+    assert [float(row["bid_depth_10"]) for row in rows] == [2.0]
+
+
+def test_gap_triggers_resync_from_a_fresh_snapshot():
+    snapshots = [
+        snapshot(10, [(99.0, 1.0)], [(101.0, 1.0)]),
+        snapshot(30, [(99.0, 2.0)], [(101.0, 1.0)]),
+    ]
+    fetched = []
+
+    def fetch(symbol, limit):
+        fetched.append(symbol)
+        return snapshots[len(fetched) - 1]
+
+    client = FakeGroupRedis()
+    ingester = DepthIngester(client, ["btcusdt"], fetch_snapshot=fetch, top_n=1, flush_interval=0)
+    events = [
+        diff(9, 11, bids=[(99.0, 1.5)]),  # first diff: starts the initial sync and is replayed on the snapshot
+        diff(12, 12, asks=[(101.0, 2.0)]),
+        diff(20, 25),  # 13..19 missing: gap, resync
+        diff(26, 31, bids=[(99.0, 4.0)]),
+    ]
+
+    async def scenario():
+        await ingester.run(iterate([json.dumps({"stream": "btcusdt@depth@100ms", "data": e}) for e in events]))
+
+    async def iterate(messages):
+        for message in messages:
+            yield message
+            await asyncio.sleep(0.01)  # let a resync finish between frames
+
+    asyncio.run(scenario())
+
+    assert fetched == ["BTCUSDT", "BTCUSDT"]
+    assert ingester.gaps["BTCUSDT"] == 1 and ingester.snapshots["BTCUSDT"] == 2
+    assert ingester.books["BTCUSDT"].last_update_id == 31
+    rows = [row for _, entry in client.streams["book:btcusdt"] for row in decode_entry(entry)]
+    assert [float(row["best_bid"]) for row in rows] == [99.0, 99.0, 99.0] and float(rows[-1]["bid_depth_1"]) == 4.0
+
+
+def test_consume_depth_from_a_local_websocket_and_merge_into_features(tmp_path):
+    rng = np.random.default_rng(3)
+    events = []
+    bid, ask, last = 64000.0, 64000.5, 1000
+    for n in range(40):
+        old_bid, old_ask = bid, ask
+        bid += float(rng.choice([-0.5, 0.0, 0.5]))
+        ask = max(ask + float(rng.choice([-0.5, 0.0, 0.5])), bid + 0.5)
+        # the touch moves: the old levels are removed unless they are set again
+        bids = [(old_bid, 0)] * (old_bid != bid) + [(bid, 1.0 + n % 3)]
+        asks = [(old_ask, 0)] * (old_ask != ask) + [(ask, 2.0)]
+        events.append(diff(last + 1, last + 2, bids=bids, asks=asks, ts=1700000000000))
+        last += 2
+    frames = [json.dumps({"stream": "btcusdt@depth@100ms", "data": e}) for e in events]
+    requested = []
+
+    async def serve(websocket):
+        requested.append(websocket.request.path)
+        for frame in frames:
+            await websocket.send(frame)
+
+    client = FakeGroupRedis()
+
+    async def scenario():
+        async with websockets.serve(serve, "127.0.0.1", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            url = depth_stream_url(["btcusdt"], f"ws://127.0.0.1:{port}/stream")
+            return await consume_depth(
+                ["btcusdt"], url=url, client=client, fetch=lambda symbol, limit: snapshot(1000, [], []), wire="binary"
+            )
+
+    ingester = asyncio.run(scenario())
+
+    assert requested == ["/stream?streams=btcusdt@depth@100ms"]
+    assert ingester.applied["BTCUSDT"] == len(events) and ingester.gaps["BTCUSDT"] == 0
+    rows = [row for _, entry in client.streams["book:btcusdt"] for row in decode_entry(entry)]
+    assert len(rows) == len(events)
+    assert all(row["spread"] > 0 for row in rows)
+
+    client.xrevrange = lambda name, count=None: list(reversed(client.streams.get(name, [])))[:count]
+    add_trades(client, "trades:btcusdt", 3)
+    worker = FeatureWorker(client, ["btcusdt"], consumer="c1", start_id="0", model_path=tmp_path / "missing.joblib", book=True)
+    worker.ensure_groups()
+    worker.run_once()
+    features = [row for _, entry in client.streams["features:btcusdt"] for row in decode_entry(entry)]
+    assert len(features) == 3
+    assert float(features[-1]["microprice"]) == pytest.approx(rows[-1]["microprice"])
+    assert float(features[-1]["depth_imbalance_10"]) == pytest.approx(rows[-1]["depth_imbalance_10"])
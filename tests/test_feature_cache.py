@@ -0,0 +1,132 @@
+import json
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from processor.feature_cache import FeatureCache, FeatureRequest
+from processor.features import build_and_save_features, build_features
+from processor.train_model import load_features
+from tests.test_processor import make_trades_db
+
+START = 1700000000000 - 1700000000000 % 60_000  # bar-aligned
+
+
+def test_repeated_builds_hit_and_new_trades_miss(tmp_path):
+    db_path = tmp_path / "trades.db"
+    make_trades_db(db_path)
+    cache = FeatureCache(tmp_path / "cache")
+
+    first = build_and_save_features("BTCUSDT", tmp_path / "a.parquet", db_path=db_path, cache=cache)
+    second = build_and_save_features("BTCUSDT", tmp_path / "b.parquet", db_path=db_path, cache=cache)
+    other = build_features("BTCUSDT", rolling_windows=(3, 5), db_path=db_path, cache=cache)
+
+    assert pd.read_parquet(first).equals(pd.read_parquet(second))
+    assert "ma_15" not in other
+    assert cache.stats == {"hits": 1, "overlap_hits": 0, "misses": 2, "evictions": 0}
+
+    with duckdb.connect(db_path.as_posix()) as con:
+        con.execute("INSERT INTO trades VALUES (?, 101.0, 1.0, 'buy', 'BTCUSDT')", [START + 9 * 86_400_000])
+    rebuilt = build_features("BTCUSDT", db_path=db_path, cache=cache)
+
+    assert cache.stats["misses"] == 3
+    assert rebuilt.index[-1] > pd.read_parquet(first).index[-1]
+    assert cache.report()["total"]["misses"] == 3
+
+
+def test_migrating_prices_to_decimal_invalidates_cached_features(tmp_path):
+    from ingest.schema import migrate
+
+    db_path = tmp_path / "trades.db"
+    make_trades_db(db_path)  # random prices/qtys with more than 8 decimals
+    cache = FeatureCache(tmp_path / "cache")
+    before = build_features("BTCUSDT", db_path=db_path, cache=cache)
+
+    with duckdb.connect(db_path.as_posix()) as con:
+        migrate(con, decimal=True)  # rewrites every price and qty in place, same count and ts bounds
+    after = build_features("BTCUSDT", db_path=db_path, cache=cache)
+
+    assert cache.stats["misses"] == 2 and cache.stats["hits"] == 0
+    assert not after.equals(before)
+    pd.testing.assert_frame_equal(after, build_features("BTCUSDT", db_path=db_path), check_freq=False)
+
+
+def test_overlap_hits_only_serve_what_a_fresh_build_gives(tmp_path):
+    db_path = tmp_path / "trades.db"
+    ts = make_trades_db(db_path)["ts"].to_numpy()
+    cache = FeatureCache(tmp_path / "cache")
+    full = build_features("BTCUSDT", db_path=db_path, cache=cache)
+    bucket = ts - ts % 60_000
+    shared = int(np.flatnonzero(bucket[1:] == bucket[:-1])[len(ts) // 4])  # two trades in one bar
+    requests = [
+        (None, int(bucket[2000]) + 59_999),  # the data's own start, ends on a bar edge: sliced
+        (None, int(ts[shared])),  # cuts a bar in two: its last bar differs from the cached one
+        (int(ts[1000]), None),  # starts after the first trade: a fresh build's windows start colder
+    ]
+
+    for start, end in requests:
+        served = build_features("BTCUSDT", start, end, db_path=db_path, cache=cache)
+        pd.testing.assert_frame_equal(served, build_features("BTCUSDT", start, end, db_path=db_path), check_freq=False)
+
+    assert cache.stats == {"hits": 0, "overlap_hits": 1, "misses": 3, "evictions": 0}
+    assert len(full) > len(build_features("BTCUSDT", *requests[0], db_path=db_path, cache=cache))
+    assert cache.stats["overlap_hits"] == 2
+
+
+def test_stamps_are_memoized_and_counts_appended_once_per_build(tmp_path, monkeypatch):
+    from processor import features
+
+    db_path = tmp_path / "trades.db"
+    calls = []
+    stamp = features.source_fingerprint
+    monkeypatch.setattr(features, "source_fingerprint", lambda *args: calls.append(args[1:3]) or stamp(*args))
+    ts = make_trades_db(db_path)["ts"].to_numpy()
+    bucket = ts - ts % 60_000
+    shared = np.flatnonzero(bucket[1:] == bucket[:-1])  # trades with another one later in their bar
+    first_cut, second_cut = int(ts[shared[len(shared) // 2]]), int(ts[shared[len(shared) // 4]])
+    cache = FeatureCache(tmp_path / "cache")
+    build_features("BTCUSDT", db_path=db_path, cache=cache)
+    build_features("BTCUSDT", None, first_cut, db_path=db_path, cache=cache)
+    calls.clear()
+
+    build_features("BTCUSDT", None, second_cut, db_path=db_path, cache=cache)
+
+    # the request, both covering entries and the tail of the request's last bar, shared by both
+    assert sorted(calls, key=str) == sorted(
+        [(None, second_cut), (None, None), (None, first_cut), (second_cut + 1, second_cut - second_cut % 60_000 + 59_999)],
+        key=str,
+    )
+    lines = (cache.root / "_stats.jsonl").read_text().splitlines()
+    assert [json.loads(line) for line in lines] == [{"misses": 1}] * 3
+    assert cache.report()["total"] == {"hits": 0, "overlap_hits": 0, "misses": 3, "evictions": 0}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    db_path = tmp_path / "trades.db"
+    make_trades_db(db_path)
+    cache = FeatureCache(tmp_path / "cache")
+    for windows in [(3,), (5,), (7,)]:
+        build_features("BTCUSDT", rolling_windows=windows, db_path=db_path, cache=cache)
+    build_features("BTCUSDT", rolling_windows=(3,), db_path=db_path, cache=cache)  # (3,) is now the most recent
+    sizes = sorted(path.stat().st_size for path in cache.root.glob("*.parquet"))
+    cache.max_bytes = sizes[-1] + sizes[-2]
+
+    cache.evict()
+    build_features("BTCUSDT", rolling_windows=(3,), db_path=db_path, cache=cache)
+    build_features("BTCUSDT", rolling_windows=(5,), db_path=db_path, cache=cache)
+
+    assert cache.stats["evictions"] >= 1
+    assert cache.stats["hits"] == 2 and cache.stats["misses"] == 4  # (5,) was the oldest
+
+
+def test_train_model_loads_features_through_the_cache(tmp_path):
+    db_path = tmp_path / "trades.db"
+    make_trades_db(db_path)
+    cache = FeatureCache(tmp_path / "cache")
+    request = FeatureRequest("BTCUSDT", None, None, "1min", (3, 5, 15))
+    built = build_and_save_features("BTCUSDT", tmp_path / "f.parquet", db_path=db_path, cache=cache)
+
+    features = load_features(cache=cache, request=request, db_path=db_path)
+
+    assert features.equals(pd.read_parquet(built))
+    assert cache.stats["hits"] == 1
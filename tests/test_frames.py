@@ -0,0 +1,67 @@
+import asyncio
+
+from forecast.frames import Batch, pack_payloads, unpack_payloads
+from forecast.hub import StreamHub
+from tests.test_service import FakeRedis
+
+
+def payloads(ids):
+    return [
+        {
+            "id": i,
+            "ts": 1700000000000 + n,
+            "price": 64000.0 + n,
+            "qty": 0.01,
+            "side": "buy" if n % 2 else "sell",
+            "ofi": -0.01,
+            "prob_up": 0.6,
+            "prob_down": 0.4,
+            "predictor": "heuristic",
+        }
+        for n, i in enumerate(ids)
+    ]
+
+
+def test_binary_frame_round_trips_and_is_aligned():
+    batch = payloads(["1-0", "2-0.0", "2-0.1"])
+    data = pack_payloads(batch)
+
+    assert unpack_payloads(data) == batch
+    assert unpack_payloads(pack_payloads([])) == []
+    # header and the six 8-byte columns come first
+    assert data[8 + 48 * 3 : 8 + 48 * 3 + 3] == bytes([1, 0, 1])
+
+
+def test_batch_encodes_once_and_conflates_to_latest():
+    batch = Batch(payloads(["1-0", "2-0"]))
+
+    assert batch.frame("json") is batch.frame("json")
+    assert batch.frame("binary") is batch.frame("binary")
+    assert batch.frame("json") == "[" + ",".join(batch.texts()) + "]"
+    assert [p["id"] for p in unpack_payloads(batch.latest("binary"))] == ["2-0"]
+    assert batch.after((1, 0, -1)).payloads == batch.payloads[1:]
+    assert batch.after((0, 0, -1)) is batch
+
+
+def test_hub_shares_one_batch_across_delivery_modes():
+    async def scenario():
+        hub = StreamHub(FakeRedis([]), "trades:btcusdt", lambda messages: [], queue_size=8)
+        event = hub.subscribe()
+        hub._task.cancel()
+        batched = hub.subscribe(mode="batch")
+        conflated = hub.subscribe(mode="conflate")
+        first, second = Batch(payloads(["1-0", "2-0"])), Batch(payloads(["3-0"]))
+        hub.publish_batch(first)
+        hub.publish_batch(second)
+        return (
+            [await event.get() for _ in range(3)],
+            [await batched.get(), await batched.get()],
+            await conflated.get(),
+            (first, second),
+        )
+
+    texts, batches, latest, (first, second) = asyncio.run(scenario())
+
+    assert texts == first.texts() + second.texts()
+    assert batches[0] is first and batches[1] is second
+    assert latest is second  # the older batch was replaced while queued
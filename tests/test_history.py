@@ -0,0 +1,34 @@
+from forecast.history import TradeHistory, id_key
+
+
+def payloads(ids, ts0=1000):
+    return [
+        {"id": i, "ts": ts0 + n, "price": 100.0 + n, "qty": 0.5, "side": "buy" if n % 2 else "sell", "prob_up": 0.6}
+        for n, i in enumerate(ids)
+    ]
+
+
+def test_ring_wraps_and_snapshots_oldest_first():
+    history = TradeHistory(capacity=4)
+
+    assert history.extend(payloads([f"{n}-0" for n in range(1, 7)])) == 6
+
+    snap = history.snapshot()
+    assert len(history) == 4
+    assert snap["id"] == ["3-0", "4-0", "5-0", "6-0"]
+    assert snap["price"] == [102.0, 103.0, 104.0, 105.0]
+    assert snap["side"] == ["sell", "buy", "sell", "buy"]
+    assert history.snapshot(last=2)["id"] == ["5-0", "6-0"]
+    assert history.snapshot(since_ts=1004)["ts"] == [1004, 1005]
+    assert history.snapshot(last=1, since_ts=1004)["ts"] == [1005]
+    assert history.snapshot(since_ts=2000)["count"] == 0
+
+
+def test_replayed_and_batched_ids_are_ordered():
+    history = TradeHistory(capacity=8)
+    history.extend(payloads(["5-0.0", "5-0.1", "6-0"]))
+
+    assert history.extend(payloads(["5-0.1", "6-0"])) == 0  # a hub re-reading its backlog
+    assert history.extend(payloads(["6-1", "7-0.0"])) == 2
+    assert history.snapshot()["id"] == ["5-0.0", "5-0.1", "6-0", "6-1", "7-0.0"]
+    assert id_key(b"6-0") < id_key("6-0.0") < id_key("6-1")
@@ -1,7 +1,15 @@
+import asyncio
 import importlib
+import json
 import sys
 
+import duckdb
 import pytest
+import websockets
+
+from ingest.schema import migrate
+
+REAL_DUCKDB_CONNECT = duckdb.connect
 
 
 class FakeDuckConnection:
@@ -12,6 +20,9 @@ class FakeDuckConnection:
         self.executed.append(query.strip())
         return self
 
+    def fetchone(self):
+        return (0,)
+
 
 class FakeRedis:
     def __init__(self):
@@ -36,10 +47,11 @@ def ingest_module(monkeypatch):
 def test_normalize_trade_buy_side(ingest_module):
     ingest, _, _ = ingest_module
 
-    raw = {"T": 1700000000000, "p": "64000.42", "q": "0.012", "m": False}
+    raw = {"t": 3200000001, "T": 1700000000000, "p": "64000.42", "q": "0.012", "m": False}
     normalized = ingest.normalize_trade(raw)
 
     assert normalized == {
+        "trade_id": 3200000001,
         "ts": 1700000000000,
         "price": 64000.42,
         "qty": 0.012,
@@ -50,14 +62,213 @@ def test_normalize_trade_buy_side(ingest_module):
 def test_normalize_trade_sell_side(ingest_module):
     ingest, _, _ = ingest_module
 
-    raw = {"T": 1700000000100, "p": "64001.0", "q": "0.5", "m": True}
+    raw = {"t": 3200000002, "T": 1700000000100, "p": "64001.0", "q": "0.5", "m": True}
     normalized = ingest.normalize_trade(raw)
 
     assert normalized["side"] == "sell"
 
 
 def test_ingest_initializes_duckdb_schema(ingest_module):
-    _, fake_duck, _ = ingest_module
+    ingest, fake_duck, _ = ingest_module
+    assert not fake_duck.executed, "importing ingest must not open trades.db"
 
+    assert ingest.connect_duckdb() is fake_duck
     create_statements = [q for q in fake_duck.executed if q.startswith("CREATE TABLE")]
     assert create_statements, "ingest should create the trades table if missing"
+
+
+class FakePipeline:
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.commands = []
+
+    def xadd(self, name, fields):
+        self.commands.append((name, fields))
+
+    def execute(self):
+        self.redis_client.executed.append(list(self.commands))
+        self.commands = []
+
+
+class PipelinedFakeRedis:
+    def __init__(self):
+        self.executed = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+def raw_message(i, symbol="BTCUSDT"):
+    trade = {"e": "trade", "s": symbol, "t": 5000 + i, "T": 1700000000000 + i, "p": str(100 + i), "q": "0.5", "m": i % 2 == 1}
+    return json.dumps({"stream": f"{symbol.lower()}@trade", "data": trade})
+
+
+async def iterate(messages):
+    for message in messages:
+        yield message
+
+
+def test_parse_message_handles_combined_and_single_stream_frames(ingest_module):
+    ingest, _, _ = ingest_module
+
+    symbol, event = ingest.parse_message(raw_message(0, symbol="ethusdt"))
+    assert symbol == "ETHUSDT"
+    assert event == {"trade_id": 5000, "ts": 1700000000000, "price": 100.0, "qty": 0.5, "side": "buy"}
+
+    single = json.dumps(json.loads(raw_message(1))["data"])
+    assert ingest.parse_message(single)[0] == "BTCUSDT"
+
+
+def test_combined_stream_url_lists_every_symbol(ingest_module):
+    ingest, _, _ = ingest_module
+
+    url = ingest.combined_stream_url(["BTCUSDT", "ethusdt"])
+
+    assert url == "wss://stream.binance.com:9443/stream?streams=btcusdt@trade/ethusdt@trade"
+
+
+def test_write_redis_batch_routes_symbols_in_single_pipeline(ingest_module):
+    ingest, _, _ = ingest_module
+    fake = PipelinedFakeRedis()
+    batch = [ingest.parse_message(raw_message(i, "BTCUSDT" if i < 2 else "ETHUSDT")) for i in range(3)]
+
+    ingest.write_redis_batch(fake, batch)
+
+    assert len(fake.executed) == 1
+    assert [(name, fields["ts"]) for name, fields in fake.executed[0]] == [
+        ("trades:btcusdt", 1700000000000),
+        ("trades:btcusdt", 1700000000001),
+        ("trades:ethusdt", 1700000000002),
+    ]
+
+
+def test_write_redis_batch_packs_one_binary_entry_per_symbol(ingest_module):
+    from ingest.wire import decode_entry
+
+    ingest, _, _ = ingest_module
+    fake = PipelinedFakeRedis()
+    batch = [ingest.parse_message(raw_message(i, "BTCUSDT" if i % 3 else "ETHUSDT")) for i in range(6)]
+
+    ingest.write_redis_batch(fake, batch, wire="binary")
+
+    assert len(fake.executed) == 1
+    entries = {name: decode_entry(fields) for name, fields in fake.executed[0]}
+    assert [e["trade_id"] for e in entries["trades:btcusdt"]] == [5001, 5002, 5004, 5005]
+    assert [e["ts"] for e in entries["trades:ethusdt"]] == [1700000000000, 1700000000003]
+
+
+def test_write_duckdb_batch_appends_rows(ingest_module):
+    ingest, _, _ = ingest_module
+    con = REAL_DUCKDB_CONNECT(":memory:")
+    migrate(con)
+    batch = [ingest.parse_message(raw_message(i, "ETHUSDT" if i == 3 else "BTCUSDT")) for i in range(4)]
+
+    ingest.write_duckdb_batch(con, batch)
+
+    rows = con.execute("SELECT trade_id, ts, price, qty, side, symbol FROM trades ORDER BY ts").fetchall()
+    assert rows[0] == (5000, 1700000000000, 100.0, 0.5, "buy", "BTCUSDT")
+    assert rows[1][4] == "sell"
+    assert rows[3][5] == "ETHUSDT"
+    assert len(rows) == 4
+
+
+def test_write_duckdb_batch_skips_redelivered_trades(ingest_module):
+    ingest, _, _ = ingest_module
+    con = REAL_DUCKDB_CONNECT(":memory:")
+    migrate(con)
+    first = [ingest.parse_message(raw_message(i)) for i in range(5)]
+    # a reconnect replays trades 3-4 and repeats one inside the same batch
+    second = [ingest.parse_message(raw_message(i)) for i in (3, 4, 5, 5, 6)]
+
+    ingest.write_duckdb_batch(con, first)
+    ingest.write_duckdb_batch(con, second)
+    ingest.write_duckdb_batch(con, second)
+
+    ids = [row[0] for row in con.execute("SELECT trade_id FROM trades ORDER BY rowid").fetchall()]
+    assert ids == [5000 + i for i in range(7)]
+
+
+def test_durable_sink_records_the_retention_watermark(ingest_module):
+    ingest, _, _ = ingest_module
+    written, watermarks = [], {}
+    sink = ingest.record_watermarks(written.append, watermarks)
+
+    sink([ingest.parse_message(raw_message(i, "ETHUSDT" if i == 1 else "BTCUSDT")) for i in (2, 0, 1)])
+
+    assert len(written) == 1
+    assert watermarks == {"BTCUSDT": 1700000000002, "ETHUSDT": 1700000000001}
+
+
+def test_pipeline_delivers_every_trade_in_micro_batches(ingest_module):
+    ingest, _, _ = ingest_module
+    received = {"redis": [], "duckdb": []}
+    pipeline = ingest.IngestPipeline(
+        sinks={name: batches.append for name, batches in received.items()},
+        queue_size=4,
+        batch_size=3,
+        flush_interval=0.01,
+        report_interval=0,
+    )
+
+    stats = asyncio.run(pipeline.run(iterate([raw_message(i) for i in range(10)])))
+
+    for batches in received.values():
+        assert all(1 <= len(batch) <= 3 for batch in batches)
+        assert [event["ts"] for batch in batches for _, event in batch] == [1700000000000 + i for i in range(10)]
+    assert stats.received == 10
+    assert stats.written == {"redis": 10, "duckdb": 10}
+
+
+def test_pipeline_fails_instead_of_hanging_when_a_sink_raises(ingest_module):
+    ingest, _, _ = ingest_module
+    written = []
+
+    def failing(batch):
+        raise ConnectionError("redis is down")
+
+    pipeline = ingest.IngestPipeline(
+        sinks={"redis": failing, "duckdb": written.append},
+        queue_size=4,
+        batch_size=3,
+        flush_interval=0.01,
+        sink_queue_size=1,
+        report_interval=0,
+    )
+
+    # far more trades than the queues hold: without the failure surfacing, the reader blocks forever
+    with pytest.raises(ConnectionError, match="redis is down"):
+        asyncio.run(asyncio.wait_for(pipeline.run(iterate([raw_message(i) for i in range(90)])), timeout=5))
+    assert pipeline.stats.written["redis"] == 0
+
+
+def test_consume_trades_from_local_combined_stream(ingest_module):
+    ingest, _, _ = ingest_module
+    symbols = ["BTCUSDT", "ETHUSDT", "SOLUSDT"]
+    frames = [raw_message(i, symbols[i % 3]) for i in range(30)]
+    requested_paths = []
+
+    async def serve(websocket):
+        requested_paths.append(websocket.request.path)
+        for frame in frames:
+            await websocket.send(frame)
+
+    async def scenario():
+        async with websockets.serve(serve, "127.0.0.1", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            base_url = f"ws://127.0.0.1:{port}/stream"
+            return await ingest.consume_trades(
+                symbols=symbols, url=ingest.combined_stream_url(symbols, base_url), report_interval=0
+            )
+
+    ingest.r = PipelinedFakeRedis()
+    ingest.con = REAL_DUCKDB_CONNECT(":memory:")
+    migrate(ingest.con)
+
+    stats = asyncio.run(scenario())
+
+    assert requested_paths == ["/stream?streams=btcusdt@trade/ethusdt@trade/solusdt@trade"]
+    assert stats.per_symbol == {"BTCUSDT": 10, "ETHUSDT": 10, "SOLUSDT": 10}
+    streams = {name for batch in ingest.r.executed for name, _ in batch}
+    assert streams == {"trades:btcusdt", "trades:ethusdt", "trades:solusdt"}
+    counts = dict(ingest.con.execute("SELECT symbol, count(*) FROM trades GROUP BY symbol").fetchall())
+    assert counts == {"BTCUSDT": 10, "ETHUSDT": 10, "SOLUSDT": 10}
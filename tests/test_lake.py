@@ -0,0 +1,102 @@
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+from ingest.lake import HOUR_MS, compact, scan_sql, segment_paths, write_segments
+from processor.features import load_bars, load_trades
+
+
+def make_batches(n=3000, batch_size=250, seed=5):
+    rng = np.random.default_rng(seed)
+    ts = np.sort(1700000000000 + rng.integers(0, 3 * HOUR_MS, n))
+    ts[100:110] = ts[100]  # trades sharing a timestamp
+    symbols = np.where(rng.random(n) < 0.7, "BTCUSDT", "ETHUSDT")
+    events = [
+        (str(symbol), {"ts": int(t), "price": float(p), "qty": float(q), "side": "buy" if b else "sell"})
+        for symbol, t, p, q, b in zip(
+            symbols, ts, np.round(100 + np.cumsum(rng.normal(0, 0.05, n)), 2), rng.exponential(0.5, n), rng.random(n) < 0.5
+        )
+    ]
+    return [events[i : i + batch_size] for i in range(0, n, batch_size)]
+
+
+def write_db(path, batches):
+    rows = [(e["ts"], e["price"], e["qty"], e["side"], symbol) for batch in batches for symbol, e in batch]
+    frame = pd.DataFrame.from_records(rows, columns=["ts", "price", "qty", "side", "symbol"])
+    with duckdb.connect(path.as_posix()) as con:
+        con.execute("CREATE TABLE trades AS SELECT * FROM frame")
+
+
+def test_write_segments_partitions_by_symbol_and_hour(tmp_path):
+    batch = make_batches()[0] + [("ethusdt", {"ts": 1700000000000 + 2 * HOUR_MS, "price": 1.0, "qty": 1.0, "side": "buy"})]
+
+    written = write_segments(tmp_path, batch)
+
+    partitions = {(path.parent.parent.name, path.parent.name) for path in written}
+    assert ("symbol=ETHUSDT", f"hour={(1700000000000 + 2 * HOUR_MS) // HOUR_MS}") in partitions
+    assert sum(len(pd.read_parquet(path)) for path in written) == len(batch)
+    assert not list(tmp_path.rglob("*.tmp"))
+
+
+@pytest.mark.parametrize("compacted", [False, True])
+def test_lake_reads_match_duckdb_table(tmp_path, compacted):
+    batches = make_batches()
+    lake_dir = tmp_path / "lake"
+    for batch in batches:
+        write_segments(lake_dir, batch)
+    write_db(tmp_path / "trades.db", batches)
+    if compacted:
+        assert compact(lake_dir)
+        assert all(len(segment_paths(path)) == 1 for path in lake_dir.glob("symbol=*/hour=*"))
+
+    for symbol in ("BTCUSDT", "ETHUSDT"):
+        start_ts = 1700000000000 + HOUR_MS // 2
+        expected = load_trades(symbol, start_ts=start_ts, db_path=tmp_path / "trades.db")
+        trades = load_trades(symbol, start_ts=start_ts, lake_dir=lake_dir)
+        pd.testing.assert_frame_equal(trades, expected)
+
+        expected_bars = load_bars(symbol, resample="1min", db_path=tmp_path / "trades.db")
+        bars = load_bars(symbol, resample="1min", lake_dir=lake_dir)
+        pd.testing.assert_frame_equal(bars, expected_bars, check_exact=True)
+
+
+def test_scan_prunes_hour_partitions(tmp_path):
+    for batch in make_batches():
+        write_segments(tmp_path, batch)
+    hour = 1700000000000 // HOUR_MS + 1
+    query, params = scan_sql(tmp_path, "BTCUSDT", start_ts=hour * HOUR_MS, end_ts=hour * HOUR_MS + 1000)
+
+    with duckdb.connect() as con:
+        plan = "\n".join(row[1] for row in con.execute(f"EXPLAIN ANALYZE {query}", params).fetchall())
+
+    in_hour = len(list(tmp_path.glob(f"symbol=BTCUSDT/hour={hour}/*.parquet")))
+    total = len(list(tmp_path.glob("symbol=BTCUSDT/hour=*/*.parquet")))
+    assert 0 < in_hour < total
+    assert f"Scanning Files: {in_hour}/{total}" in plan
+    assert scan_sql(tmp_path, "SOLUSDT") is None
+
+
+def test_redelivered_trade_ids_are_read_and_compacted_once(tmp_path):
+    def trade(i):
+        return ("btcusdt", {"trade_id": 5000 + i, "ts": 1700000000000 + i, "price": 100.0 + i, "qty": 0.5, "side": "buy"})
+
+    legacy = tmp_path / "symbol=BTCUSDT" / f"hour={1700000000000 // HOUR_MS}"
+    legacy.mkdir(parents=True)
+    # a segment written before trade ids were stored: its rows are always kept
+    pd.DataFrame({"ts": [1700000000000], "price": [99.0], "qty": [0.5], "side": ["sell"]}).to_parquet(
+        legacy / "seg-0000000000000000000.parquet", index=False
+    )
+    write_segments(tmp_path, [trade(i) for i in range(5)])
+    write_segments(tmp_path, [trade(i) for i in (3, 4, 4, 5, 6)])  # a reconnect replays trades 3-4
+
+    def read():
+        query, params = scan_sql(tmp_path, "BTCUSDT")
+        with duckdb.connect() as con:
+            return con.execute(f"SELECT trade_id, price FROM ({query}) ORDER BY ts, seq", params).fetchall()
+
+    expected = [(None, 99.0)] + [(5000 + i, 100.0 + i) for i in range(7)]
+    assert read() == expected
+    assert compact(tmp_path)
+    assert len(pd.read_parquet(segment_paths(legacy)[0])) == 8
+    assert read() == expected
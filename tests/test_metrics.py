@@ -0,0 +1,132 @@
+import asyncio
+import importlib
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+from observability import metrics
+from tests.test_worker import FakeGroupRedis, add_trades, make_worker
+
+
+class FakeInfoRedis:
+    def __init__(self, tail="5000-3", length=42, groups=()):
+        self.tail, self.length, self.groups = tail, length, list(groups)
+
+    def xinfo_stream(self, name):
+        if name == "trades:missing":
+            import redis
+
+            raise redis.ResponseError("no such key")
+        return {"length": self.length, "last-generated-id": self.tail.encode()}
+
+    def xinfo_groups(self, name):
+        return self.groups
+
+
+def sample(name, labels=None):
+    return metrics.REGISTRY.get_sample_value(name, labels or {})
+
+
+def test_group_lag_reports_length_and_lag_per_group():
+    client = FakeInfoRedis(
+        groups=[
+            {"name": b"processor", "last-delivered-id": b"2500-0", "lag": 7},
+            {"name": b"archiver", "last-delivered-id": b"5000-3", "lag": None},
+        ]
+    )
+
+    families = {family.name: family for family in metrics.group_lag(client, ["trades:btcusdt", "trades:missing"])}
+
+    assert [s.value for s in families["redis_stream_length"].samples] == [42]
+    lag = {s.labels["group"]: s.value for s in families["redis_stream_group_lag_seconds"].samples}
+    assert lag == {"processor": 2.5, "archiver": 0.0}
+    assert [(s.labels["group"], s.value) for s in families["redis_stream_group_lag_entries"].samples] == [("processor", 7)]
+
+
+def test_probes_are_replaced_by_name_and_rendered():
+    metrics.register_probe("test", lambda: [metrics.gauge("test_probe_value", "doc", {("a",): 1.0}, labels=["k"])])
+    metrics.register_probe("test", lambda: [metrics.gauge("test_probe_value", "doc", {("a",): 2.0}, labels=["k"])])
+    try:
+        body, content_type = metrics.render()
+        assert b'test_probe_value{k="a"} 2.0' in body
+        assert body.count(b"test_probe_value{") == 1
+        assert content_type.startswith("text/plain")
+    finally:
+        metrics.unregister_probe("test")
+    assert sample("test_probe_value", {"k": "a"}) is None
+
+
+@pytest.mark.parametrize("enabled", [False, True])
+def test_worker_histograms_only_move_when_enabled(tmp_path, monkeypatch, enabled):
+    monkeypatch.setattr(metrics, "ENABLED", enabled)
+    before_batches = sample("processor_read_batch_entries_count") or 0
+    before_events = sample("processor_event_compute_seconds_count") or 0
+    client = FakeGroupRedis()
+    add_trades(client, "trades:btcusdt", 5)
+    worker = make_worker(client, "w1", tmp_path, batch_size=10)
+    worker.ensure_groups()
+    worker._last_claim = float("inf")
+
+    worker.run_once()
+
+    assert (sample("processor_read_batch_entries_count") or 0) - before_batches == (1 if enabled else 0)
+    assert (sample("processor_event_compute_seconds_count") or 0) - before_events == (1 if enabled else 0)
+    assert worker.per_stream == {"trades:btcusdt": 5}
+
+
+def test_worker_probe_exports_trades_and_group_lag(tmp_path):
+    client = FakeGroupRedis()
+    add_trades(client, "trades:btcusdt", 3)
+    worker = make_worker(client, "w1", tmp_path)
+    worker.ensure_groups()
+    worker._last_claim = float("inf")
+    worker.run_once()
+    client.xinfo_stream = lambda name: {"length": 3, "last-generated-id": b"9000-0"}
+    client.xinfo_groups = lambda name: [{"name": b"processor", "last-delivered-id": b"3000-0", "lag": 0}]
+
+    families = {family.name: family for family in worker.collect_metrics()}
+
+    assert families["processor_trades"].samples[0].value == 3
+    assert families["redis_stream_group_lag_seconds"].samples[0].value == 6.0
+
+
+def test_ingest_pipeline_probe_reads_its_counters(monkeypatch):
+    from tests.test_ingest import iterate, raw_message
+
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    ingest = importlib.import_module("ingest.ingest")
+    before = sample("ingest_sink_write_seconds_count", {"sink": "memory"}) or 0
+    pipeline = ingest.IngestPipeline(sinks={"memory": lambda batch: None}, batch_size=4, flush_interval=0.01, report_interval=0)
+
+    asyncio.run(pipeline.run(iterate([raw_message(i, "ETHUSDT" if i % 2 else "BTCUSDT") for i in range(8)])))
+
+    families = {family.name: family for family in pipeline.collect_metrics()}
+    received = {s.labels["symbol"]: s.value for s in families["ingest_trades_received"].samples if s.name.endswith("_total")}
+    assert received == {"BTCUSDT": 4, "ETHUSDT": 4}
+    assert {s.labels["queue"]: s.value for s in families["ingest_queue_depth"].samples} == {"reader": 0, "memory": 0}
+    assert (sample("ingest_sink_write_seconds_count", {"sink": "memory"}) or 0) - before == pipeline.stats.batches
+
+
+def test_service_serves_metrics(monkeypatch):
+    from tests.test_service import FakeRedis
+
+    fake_redis = FakeRedis([[("trades:btcusdt", [("7000-0", {"ts": "1", "price": "1.0", "qty": "1.0", "side": "buy"})])]])
+    fake_redis.xinfo_stream = lambda name: {"length": 1, "last-generated-id": b"9500-0"}
+    if "forecast.service" in sys.modules:
+        del sys.modules["forecast.service"]
+    monkeypatch.setattr("redis.Redis", lambda **kwargs: fake_redis)
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    service = importlib.import_module("forecast.service")
+    service.r = fake_redis
+    before = sample("forecast_predict_seconds_count") or 0
+
+    client = TestClient(service.app)
+    with client.websocket_connect("/ws/trades") as websocket:
+        assert websocket.receive_json()["id"] == "7000-0"
+        body = client.get("/metrics").text
+
+    assert 'forecast_clients{stream="trades:btcusdt"} 1.0' in body
+    assert 'forecast_stream_lag_seconds{stream="trades:btcusdt"} 2.5' in body
+    assert "forecast_send_queue_depth" in body
+    assert (sample("forecast_predict_seconds_count") or 0) - before == 1
@@ -0,0 +1,96 @@
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+
+from processor.predictor import PriceDirectionPredictor
+
+FEATURE_COLS = ("price_close", "volume", "return_1")
+
+
+def make_dataset(n=200, seed=7):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, len(FEATURE_COLS))) * np.array([50.0, 2.0, 0.01])
+    y = (X[:, 2] + rng.normal(scale=0.005, size=n) > 0).astype(int)
+    return X, y
+
+
+def save_bundle(tmp_path, model):
+    path = tmp_path / "model.joblib"
+    joblib.dump({"model": model, "feature_cols": FEATURE_COLS}, path)
+    return path
+
+
+def test_logistic_fast_path_matches_sklearn(tmp_path):
+    X, y = make_dataset()
+    model = LogisticRegression(max_iter=500).fit(X, y)
+    predictor = PriceDirectionPredictor(save_bundle(tmp_path, model))
+
+    prob_up, prob_down, source = predictor.predict_batch(X)
+
+    expected = model.predict_proba(X)
+    assert source == "model"
+    np.testing.assert_allclose(prob_up, expected[:, 1], rtol=1e-12, atol=1e-15)
+    np.testing.assert_allclose(prob_down, expected[:, 0], rtol=1e-12, atol=1e-15)
+
+
+def test_predict_batch_accepts_event_dicts_and_matches_predict(tmp_path):
+    X, y = make_dataset()
+    model = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+    predictor = PriceDirectionPredictor(save_bundle(tmp_path, model))
+    events = [dict(zip(FEATURE_COLS, row)) for row in X[:10]]
+
+    prob_up, _, _ = predictor.predict_batch(events)
+
+    assert [predictor.predict(event)[0] for event in events] == pytest.approx(prob_up.tolist())
+    np.testing.assert_allclose(prob_up, model.predict_proba(X[:10])[:, 1])
+
+
+def test_heuristic_batch_matches_single_event_rule(tmp_path):
+    predictor = PriceDirectionPredictor(tmp_path / "missing.joblib")
+    events = [
+        {"qty": 2.0, "side": "buy"},
+        {"qty": 3.0, "side": "sell"},
+        {"qty": 1.0, "side": "sell", "ofi": 0.4},
+        {"qty": 40.0, "side": "buy"},
+    ]
+
+    prob_up, prob_down, source = predictor.predict_batch(events)
+
+    assert source == "heuristic"
+    assert prob_up.tolist() == pytest.approx([0.6, 0.35, 0.52, 1.0])
+    assert (prob_up + prob_down).tolist() == pytest.approx([1.0] * 4)
+    with pytest.raises(ValueError):
+        predictor.predict_batch(np.zeros((1, 3)))
+
+
+def test_reload_swaps_bundle_and_keeps_old_model_on_failure(tmp_path):
+    X, y = make_dataset()
+    path = save_bundle(tmp_path, LogisticRegression(max_iter=500).fit(X, y))
+    predictor = PriceDirectionPredictor(path)
+    first = predictor.info()
+
+    joblib.dump({"model": LogisticRegression(max_iter=500).fit(X, 1 - y), "feature_cols": FEATURE_COLS}, path)
+    predictor.reload()
+    assert predictor.info()["version"] != first["version"]
+    assert predictor.info()["loaded_at"] >= first["loaded_at"]
+
+    active = predictor.bundle
+    path.write_bytes(b"truncated")
+    with pytest.raises(Exception):
+        predictor.reload()
+    assert predictor.bundle is active
+    assert predictor.predict_batch(X[:3])[2] == "model"
+
+
+def test_malformed_bundle_at_startup_falls_back_to_the_heuristic(tmp_path):
+    path = tmp_path / "model.joblib"
+    joblib.dump({"feature_cols": FEATURE_COLS}, path)  # no model
+
+    predictor = PriceDirectionPredictor(path)
+
+    assert predictor.info()["source"] == "heuristic"
+    assert predictor.predict({"qty": 2.0, "side": "buy"})[2] == "heuristic"
+    with pytest.raises(ValueError):
+        predictor.reload()  # explicit reloads stay strict
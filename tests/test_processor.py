@@ -1,7 +1,18 @@
+import duckdb
+import numpy as np
 import pandas as pd
 import pytest
 
-from processor.features import compute_window_features
+from processor.features import (
+    build_and_save_features,
+    build_features_incremental,
+    compute_window_features,
+    load_bars,
+    load_trades,
+    partition_paths,
+    read_watermark,
+    resample_trades,
+)
 from processor.train_model import build_targets, train_baseline_classifier
 
 
@@ -39,3 +50,77 @@ def test_train_baseline_classifier_produces_metrics():
     assert hasattr(model, "predict_proba")
     assert "accuracy" in metrics
     assert 0.0 <= metrics["accuracy"] <= 1.0
+
+
+def make_trades_db(path, n=4000, seed=11):
+    rng = np.random.default_rng(seed)
+    ts = np.sort(1700000000000 + rng.integers(0, 2 * 86_400_000, n))  # spans a day boundary
+    ts[n // 3:] += 45 * 60_000  # a gap of empty bars
+    trades = pd.DataFrame(
+        {
+            "ts": ts,
+            "price": 100 + np.cumsum(rng.normal(0, 0.05, n)),
+            "qty": rng.exponential(0.5, n),
+            "side": np.where(rng.random(n) < 0.5, "buy", "sell"),
+            "symbol": "BTCUSDT",
+        }
+    )
+    with duckdb.connect(path.as_posix()) as con:
+        con.execute("CREATE TABLE trades AS SELECT * FROM trades")
+    return trades
+
+
+@pytest.mark.parametrize("cuts", [(0.5,), (0.3, 0.31, 0.8)])
+def test_incremental_build_is_byte_identical_to_full_rebuild(tmp_path, cuts):
+    db_path = tmp_path / "trades.db"
+    trades = make_trades_db(db_path)
+    incremental_dir = tmp_path / "incremental"
+    full_dir = tmp_path / "full"
+
+    for cut in cuts:  # each run ends mid-bar, so the next one must redo the partial bar
+        end_ts = int(trades["ts"].iloc[int(len(trades) * cut)])
+        build_features_incremental("BTCUSDT", incremental_dir, end_ts=end_ts, resample="5min", db_path=db_path)
+    build_features_incremental("BTCUSDT", incremental_dir, resample="5min", db_path=db_path)
+    build_features_incremental("BTCUSDT", full_dir, resample="5min", db_path=db_path)
+
+    incremental_files = partition_paths(incremental_dir)
+    assert [p.name for p in incremental_files] == [p.name for p in partition_paths(full_dir)]
+    assert len(incremental_files) >= 2
+    for path in incremental_files:
+        assert path.read_bytes() == (full_dir / path.name).read_bytes()
+    assert read_watermark(incremental_dir) == read_watermark(full_dir)
+
+
+def test_incremental_build_rejects_changed_settings(tmp_path):
+    db_path = tmp_path / "trades.db"
+    make_trades_db(db_path, n=200)
+    build_features_incremental("BTCUSDT", tmp_path / "out", resample="5min", db_path=db_path)
+
+    with pytest.raises(ValueError):
+        build_features_incremental("BTCUSDT", tmp_path / "out", resample="5min", rolling_windows=(2,), db_path=db_path)
+
+
+@pytest.mark.parametrize("resample", ["1min", "5min", "7min", "10s"])
+def test_duckdb_bars_match_pandas_resample(tmp_path, resample):
+    db_path = tmp_path / "trades.db"
+    make_trades_db(db_path)
+
+    expected = resample_trades(load_trades("BTCUSDT", db_path=db_path), resample)
+    bars = load_bars("BTCUSDT", resample=resample, db_path=db_path)
+
+    pd.testing.assert_frame_equal(bars, expected, check_exact=True, check_freq=False)
+
+
+def test_build_features_engines_write_identical_files(tmp_path):
+    db_path = tmp_path / "trades.db"
+    trades = make_trades_db(db_path)
+    end_ts = int(trades["ts"].iloc[3000])
+
+    paths = [
+        build_and_save_features(
+            "BTCUSDT", tmp_path / f"{engine}.parquet", end_ts=end_ts, resample="5min", db_path=db_path, engine=engine
+        )
+        for engine in ("duckdb", "pandas")
+    ]
+
+    assert paths[0].read_bytes() == paths[1].read_bytes()
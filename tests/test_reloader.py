@@ -0,0 +1,74 @@
+import asyncio
+
+import joblib
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+
+from forecast.reloader import ModelReloader
+from processor.predictor import PriceDirectionPredictor
+
+
+def save_bundle(path, feature_cols, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(50, len(feature_cols)))
+    model = LogisticRegression().fit(X, (X[:, 0] > 0).astype(int))
+    joblib.dump({"model": model, "feature_cols": tuple(feature_cols)}, path)
+
+
+def test_reload_validates_feature_cols_against_what_is_built(tmp_path):
+    path = tmp_path / "model.joblib"
+    save_bundle(path, ("ma_3", "vwap"))
+    predictor = PriceDirectionPredictor(path)
+    reloader = ModelReloader(predictor, ("price", "qty", "ofi"))
+    original = predictor.info()["version"]
+
+    save_bundle(path, ("ma_3", "sentiment"), seed=1)
+    status = asyncio.run(reloader.reload())
+
+    assert status["version"] == original
+    assert status["failures"] == 1
+    assert "sentiment" in status["last_error"]
+
+    save_bundle(path, ("vwap", "qty"), seed=2)
+    status = asyncio.run(reloader.reload())
+
+    assert status["version"] != original
+    assert status["feature_cols"] == ["vwap", "qty"]
+    assert status["last_error"] is None
+    assert predictor.predict({"vwap": 1.0})[2] == "model"
+
+
+def test_retrain_that_adds_a_column_is_accepted(tmp_path):
+    path = tmp_path / "model.joblib"
+    save_bundle(path, ("ma_3", "vol_3"))
+    predictor = PriceDirectionPredictor(path)
+    reloader = ModelReloader(predictor)
+
+    # a new window: the running worker doesn't publish ma_30 yet, but its engine builds it
+    save_bundle(path, ("ma_3", "vol_3", "ma_30", "volumema_30"), seed=1)
+    status = asyncio.run(reloader.reload())
+
+    assert status["last_error"] is None and status["reloads"] == 1
+    assert status["feature_cols"] == ["ma_3", "vol_3", "ma_30", "volumema_30"]
+
+
+def test_watch_loads_changed_bundles_and_survives_bad_ones(tmp_path):
+    path = tmp_path / "model.joblib"
+    predictor = PriceDirectionPredictor(path)  # no bundle yet: heuristic
+    reloader = ModelReloader(predictor, interval=0.01)
+
+    async def scenario():
+        watcher = asyncio.create_task(reloader.watch())
+        path.write_bytes(b"half a bundle")
+        await asyncio.sleep(0.1)
+        failed = reloader.status()
+        save_bundle(path, ("ma_3",))
+        await asyncio.sleep(0.1)
+        watcher.cancel()
+        return failed, reloader.status()
+
+    failed, loaded = asyncio.run(scenario())
+
+    assert failed["source"] == "heuristic" and failed["failures"] == 1
+    assert loaded["source"] == "model" and loaded["reloads"] == 1
+    assert loaded["version"] is not None
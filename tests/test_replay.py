@@ -1,16 +1,27 @@
 import importlib
 import sys
 
+import duckdb
 import pytest
 
+from ingest.lake import write_segments
+
+REAL_DUCKDB_CONNECT = duckdb.connect
+
 
 class FakeDuckCursor:
     def __init__(self, rows):
-        self.rows = rows
+        self.rows = list(rows)
+        self.fetch_sizes = []
 
     def fetchall(self):
         return self.rows
 
+    def fetchmany(self, size):
+        self.fetch_sizes.append(size)
+        chunk, self.rows = self.rows[:size], self.rows[size:]
+        return chunk
+
 
 class FakeDuckConnection:
     def __init__(self, rows):
@@ -19,17 +30,36 @@ class FakeDuckConnection:
 
     def execute(self, query, params):
         self.last_query = (query.strip(), params)
-        return FakeDuckCursor(self.rows)
+        self.cursor = FakeDuckCursor(self.rows)
+        return self.cursor
+
+
+class FakePipeline:
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.commands = []
+
+    def xadd(self, name, fields):
+        self.commands.append((name, fields))
+
+    def execute(self):
+        self.redis_client.events.extend(self.commands)
+        self.redis_client.pipelines.append(len(self.commands))
+        self.commands = []
 
 
 class FakeRedis:
     def __init__(self):
         self.events = []
+        self.pipelines = []
 
     def xadd(self, name, fields):
         self.events.append((name, fields))
         return "0-1"
 
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
 
 @pytest.fixture()
 def replay_module(monkeypatch):
@@ -62,7 +92,10 @@ def test_replay_pushes_events_as_strings(replay_module):
     # ensure query executed with passed params
     query, params = fake_con.last_query
     assert "BETWEEN ? AND ?" in query
-    assert params == [1700000000000, 1700000005000]
+    assert "ORDER BY ts, rowid" in query
+    # many symbols share the table: the default pair is always filtered on
+    assert params == [1700000000000, 1700000005000, "BTCUSDT"]
+    assert {name for name, _ in fake_redis.events} == {"trades:btcusdt"}
 
     # redis should receive stringified fields
     assert fake_redis.events
@@ -73,3 +106,99 @@ def test_replay_pushes_events_as_strings(replay_module):
         "qty": "0.01",
         "side": "buy",
     }
+
+
+def test_replay_streams_chunks_and_pipelines_batches(replay_module):
+    replay, fake_con, fake_redis = replay_module
+    fake_con.rows = [(1700000000000 + i, 64000.0 + i, 0.01, "buy") for i in range(7)]
+
+    report = replay.replay(1700000000000, 1700000005000, chunk_size=3, batch_size=2)
+
+    assert fake_con.cursor.fetch_sizes == [3, 3, 3, 3]
+    assert fake_redis.pipelines == [2, 2, 2, 1]
+    assert [fields["ts"] for _, fields in fake_redis.events] == [str(1700000000000 + i) for i in range(7)]
+    assert report.rows == 7 and report.batches == 4
+
+
+def test_replay_binary_wire_packs_each_pipeline(replay_module):
+    from ingest.wire import decode_entry
+
+    replay, fake_con, fake_redis = replay_module
+    fake_con.rows = [(1700000000000 + i, 64000.0 + i, 0.01, "buy" if i % 2 else "sell") for i in range(5)]
+
+    report = replay.replay(1700000000000, 1700000005000, batch_size=2, wire="binary")
+
+    assert fake_redis.pipelines == [1, 1, 1]
+    trades = [trade for _, fields in fake_redis.events for trade in decode_entry(fields)]
+    assert [t["ts"] for t in trades] == [1700000000000 + i for i in range(5)]
+    assert trades[1] == {"ts": 1700000000001, "price": 64001.0, "qty": 0.01, "side": "buy"}
+    assert report.rows == 5
+
+
+def test_replay_speed_paces_on_trade_timestamps(replay_module, monkeypatch):
+    replay, fake_con, fake_redis = replay_module
+    fake_con.rows = [
+        (1700000000000, 64000.0, 0.01, "buy"),
+        (1700000002000, 64001.0, 0.01, "sell"),
+        (1700000006000, 64002.0, 0.01, "buy"),
+    ]
+    clock = {"now": 100.0}
+    sleeps = []
+
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        clock["now"] += seconds
+
+    monkeypatch.setattr(replay.time, "perf_counter", lambda: clock["now"])
+    monkeypatch.setattr(replay.time, "sleep", fake_sleep)
+
+    report = replay.replay(1700000000000, 1700000010000, speed=2.0, symbol="ethusdt")
+
+    assert sleeps == pytest.approx([1.0, 2.0])  # 2s and 4s gaps at 2x
+    assert {name for name, _ in fake_redis.events} == {"trades:ethusdt"}
+    # the events due before each sleep were already sent
+    assert fake_redis.pipelines == [1, 1, 1]
+    assert fake_con.last_query[1] == [1700000000000, 1700000010000, "ETHUSDT"]
+    assert report.data_span == 6.0
+
+
+def test_replay_reads_parquet_lake(replay_module, monkeypatch, tmp_path):
+    replay, _, fake_redis = replay_module
+    monkeypatch.setattr("duckdb.connect", REAL_DUCKDB_CONNECT)
+    base_ts = 1700000000000
+    for i in range(3):  # one segment per batch, across two hour partitions
+        batch = [
+            (symbol, {"ts": base_ts + i * 1_800_000 + j, "price": 100.0 + j, "qty": 0.1, "side": "buy"})
+            for j in range(2)
+            for symbol in ("BTCUSDT", "ETHUSDT")
+        ]
+        write_segments(tmp_path, batch)
+
+    report = replay.replay(base_ts + 1, base_ts + 3_600_000, symbol="btcusdt", lake_dir=tmp_path)
+
+    assert [fields["ts"] for _, fields in fake_redis.events] == [
+        str(base_ts + 1),
+        str(base_ts + 1_800_000),
+        str(base_ts + 1_800_001),
+        str(base_ts + 3_600_000),
+    ]
+    assert {name for name, _ in fake_redis.events} == {"trades:btcusdt"}
+    assert report.rows == 4
+
+
+def test_replay_sends_one_symbol_with_ties_in_insertion_order(replay_module):
+    replay, _, fake_redis = replay_module
+    replay.con = REAL_DUCKDB_CONNECT(":memory:")
+    replay.con.execute("CREATE TABLE trades (ts BIGINT, price DOUBLE, qty DOUBLE, side VARCHAR, symbol VARCHAR)")
+    replay.con.execute(
+        "INSERT INTO trades VALUES (2, 10.0, 1, 'buy', 'ETHUSDT'), (1, 100.0, 1, 'buy', 'BTCUSDT'),"
+        " (1, 101.0, 1, 'sell', 'BTCUSDT'), (1, 99.0, 1, 'buy', 'BTCUSDT'), (1, 11.0, 1, 'buy', 'ETHUSDT')"
+    )
+
+    replay.replay(0, 10)
+
+    assert [(name, fields["price"]) for name, fields in fake_redis.events] == [
+        ("trades:btcusdt", "100.0"),
+        ("trades:btcusdt", "101.0"),
+        ("trades:btcusdt", "99.0"),
+    ]
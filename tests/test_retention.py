@@ -0,0 +1,170 @@
+import duckdb
+import pytest
+
+from ingest.lake import write_segments
+from ingest.retention import (
+    Retention,
+    RetentionPolicy,
+    id_key,
+    parse_policy,
+    store_watermark,
+    trim_stream,
+    trimmed_past,
+)
+from ingest.schema import migrate
+from ingest.wire import BINARY_FIELD, pack_trades
+
+T0 = 1700000000000
+
+
+class FakeStreamRedis:
+    """Stream commands used by retention; entry ids are ``<ms>-0`` with ms = the caller's clock."""
+
+    def __init__(self):
+        self.streams = {}
+        self.trims = []
+
+    def add(self, name, entry_ms, fields):
+        self.streams.setdefault(name, []).append((f"{entry_ms}-0".encode(), fields))
+
+    def xlen(self, name):
+        return len(self.streams.get(name, []))
+
+    def xrange(self, name, min="-", max="+", count=None):
+        def bound(value, default):
+            if value in ("-", "+"):
+                return default, False
+            return id_key(value.lstrip("(")), value.startswith("(")
+
+        (low, _), (high, exclusive) = bound(min, (0, 0)), bound(max, (2**63, 0))
+        entries = [
+            e for e in self.streams.get(name, []) if low <= id_key(e[0]) and (id_key(e[0]) < high if exclusive else id_key(e[0]) <= high)
+        ]
+        return entries[:count]
+
+    def xtrim(self, name, minid=None, approximate=True):
+        self.trims.append((name, minid, approximate))
+        entries = self.streams[name]
+        kept = [e for e in entries if id_key(e[0]) >= id_key(minid)]
+        self.streams[name] = kept
+        return len(entries) - len(kept)
+
+    def memory_usage(self, name):
+        return sum(len(k) + len(v) for _, fields in self.streams.get(name, []) for k, v in fields.items())
+
+    def scan_iter(self, _type=None):
+        return iter(name.encode() for name in self.streams)
+
+
+def text_trade(i):
+    return {b"ts": str(T0 + i * 1000).encode(), b"price": b"100.5", b"qty": b"0.1", b"side": b"buy"}
+
+
+def fill(client, name="trades:btcusdt", n=10):
+    for i in range(n):
+        client.add(name, T0 + i * 1000, text_trade(i))
+
+
+def test_parse_policy_reads_counts_and_ages():
+    assert parse_policy("trades:*=1000") == RetentionPolicy("trades:*", maxlen=1000)
+    assert parse_policy("features:*=90s,500") == RetentionPolicy("features:*", maxlen=500, max_age_ms=90_000)
+    assert parse_policy("trades:btcusdt=6h").max_age_ms == 6 * 3_600_000
+    with pytest.raises(ValueError):
+        parse_policy("trades:*")
+    with pytest.raises(ValueError):
+        parse_policy("trades:*=6 weeks")
+
+
+def test_maxlen_trim_stops_at_the_durable_watermark():
+    client = FakeStreamRedis()
+    fill(client)
+    policy = RetentionPolicy("trades:*", maxlen=3)
+
+    report = trim_stream(client, "trades:btcusdt", policy, persisted_ts=T0 + 4000)
+
+    assert report.trimmed == 5  # entries 0-4 are persisted, 5 and 6 are over the limit but not yet
+    assert report.held_back == 2
+    assert client.trims == [("trades:btcusdt", f"{T0 + 4000}-1", True)]
+    assert report.reclaimed == report.bytes_before - report.bytes_after > 0
+
+    report = trim_stream(client, "trades:btcusdt", policy, persisted_ts=T0 + 9000)
+    assert (report.trimmed, report.held_back) == (2, 0)
+    assert client.xlen("trades:btcusdt") == 3
+
+
+def test_nothing_is_trimmed_without_a_watermark():
+    client = FakeStreamRedis()
+    fill(client)
+
+    report = trim_stream(client, "trades:btcusdt", RetentionPolicy("trades:*", maxlen=2), persisted_ts=None)
+
+    assert (report.trimmed, report.held_back) == (0, 8)
+    assert client.trims == [] and client.xlen("trades:btcusdt") == 10
+
+
+def test_age_trim_uses_entry_ids_and_packed_entries():
+    client = FakeStreamRedis()
+    trades = [{"ts": T0 + i * 1000, "price": 1.0, "qty": 1.0, "side": "sell"} for i in range(10)]
+    for i in range(0, 10, 2):
+        client.add("trades:btcusdt", T0 + i * 1000 + 1, {BINARY_FIELD.encode(): pack_trades(trades[i : i + 2])})
+
+    policy = RetentionPolicy("trades:*", max_age_ms=5000, approximate=False)
+    report = trim_stream(client, "trades:btcusdt", policy, persisted_ts=T0 + 9000, now_ms=T0 + 9500)
+
+    # entries older than now - 5s (ids below T0 + 4500) go; the packed entry at T0 + 4001 is one of them
+    assert report.trimmed == 3
+    assert [id_key(message_id)[0] for message_id, _ in client.streams["trades:btcusdt"]] == [T0 + 6001, T0 + 8001]
+    assert client.trims[0][2] is False
+
+
+def test_retention_applies_the_first_matching_policy_per_stream():
+    client = FakeStreamRedis()
+    fill(client, "trades:btcusdt")
+    fill(client, "features:btcusdt")
+    fill(client, "orders:btcusdt")
+    watermarks = {"trades:btcusdt": T0 + 9000, "features:btcusdt": T0 + 9000}
+    retention = Retention(
+        client,
+        [parse_policy("trades:*=4"), parse_policy("*:btcusdt=6")],
+        lambda stream: watermarks.get(stream),
+    )
+
+    assert retention.streams() == ["features:btcusdt", "orders:btcusdt", "trades:btcusdt"]
+    reports = {report.stream: report for report in retention.run_once()}
+
+    assert reports["trades:btcusdt"].trimmed == 6
+    assert reports["features:btcusdt"].trimmed == 4
+    assert reports["orders:btcusdt"].held_back == 4  # matched, but nothing durable to check against
+    assert client.xlen("orders:btcusdt") == 10
+
+
+def test_trimmed_past_flags_readers_behind_the_first_entry():
+    client = FakeStreamRedis()
+    fill(client)
+
+    assert trimmed_past(client, "trades:btcusdt", f"{T0 + 3000}-0") is None
+    client.xtrim("trades:btcusdt", minid=f"{T0 + 5000}-0")
+
+    first_id, fields = trimmed_past(client, "trades:btcusdt", f"{T0 + 3000}-0")
+    assert first_id == f"{T0 + 5000}-0"
+    assert fields[b"ts"] == str(T0 + 5000).encode()
+    assert trimmed_past(client, "trades:btcusdt", f"{T0 + 5000}-0") is None
+    assert trimmed_past(client, "trades:empty", "0-0") is None
+
+
+def test_store_watermark_reads_the_lake_and_duckdb(tmp_path):
+    batch = [("BTCUSDT", {"trade_id": i, "ts": T0 + i, "price": 1.0, "qty": 1.0, "side": "buy"}) for i in range(5)]
+    write_segments(tmp_path / "lake", batch)
+    db_path = tmp_path / "trades.db"
+    with duckdb.connect(db_path.as_posix()) as con:
+        migrate(con)
+        con.execute("INSERT INTO trades VALUES (1, ?, 1.0, 1.0, 'sell', 'BTCUSDT')", [T0 + 42])
+
+    from_lake = store_watermark(lake_dir=tmp_path / "lake")
+    from_db = store_watermark(db_path=db_path)
+
+    assert from_lake("trades:btcusdt") == T0 + 4
+    assert from_lake("trades:ethusdt") is None
+    assert from_db("features:btcusdt") == T0 + 42
+    assert from_db("trades:ethusdt") is None
+    assert store_watermark(db_path=tmp_path / "missing.db")("trades:btcusdt") is None
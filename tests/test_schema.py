@@ -0,0 +1,83 @@
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+from ingest.schema import SCHEMA_VERSION, migrate, schema_version
+from processor.features import load_bars, load_trades
+
+
+def make_v1_db(path, with_symbol=True, n=2000, seed=2):
+    rng = np.random.default_rng(seed)
+    trades = pd.DataFrame(
+        {
+            "ts": np.sort(1700000000000 + rng.integers(0, 6 * 3_600_000, n)),
+            "price": np.round(30000 + np.cumsum(rng.normal(0, 5, n)), 2),
+            "qty": np.round(rng.exponential(0.05, n), 8),
+            "side": np.where(rng.random(n) < 0.5, "buy", "sell"),
+        }
+    )
+    trades.loc[50:60, "ts"] = trades.loc[50, "ts"]  # same-millisecond trades keep their order
+    if with_symbol:
+        trades["symbol"] = "BTCUSDT"
+    with duckdb.connect(path.as_posix()) as con:
+        con.execute("CREATE TABLE trades AS SELECT * FROM trades")
+
+
+@pytest.mark.parametrize("decimal", [False, True])
+@pytest.mark.parametrize("with_symbol", [False, True])
+def test_migration_keeps_logical_rows(tmp_path, decimal, with_symbol):
+    db_path = tmp_path / "trades.db"
+    make_v1_db(db_path, with_symbol=with_symbol)
+    before = load_trades("BTCUSDT", db_path=db_path)
+    bars_before = load_bars("BTCUSDT", resample="5min", db_path=db_path)
+
+    with duckdb.connect(db_path.as_posix()) as con:
+        assert migrate(con, decimal=decimal) == 1
+        assert schema_version(con) == SCHEMA_VERSION
+        assert migrate(con, decimal=decimal) == SCHEMA_VERSION  # idempotent
+        types = dict(
+            con.execute(
+                "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = 'trades'"
+            ).fetchall()
+        )
+
+    assert types["price"] == ("DECIMAL(38,8)" if decimal else "DOUBLE")
+    assert types["side"].startswith("ENUM")
+    after = load_trades("BTCUSDT", db_path=db_path)
+    if not with_symbol:
+        before["symbol"] = "BTCUSDT"
+    pd.testing.assert_frame_equal(after, before)
+    pd.testing.assert_frame_equal(load_bars("BTCUSDT", resample="5min", db_path=db_path), bars_before, check_exact=True)
+
+
+def test_migrate_creates_schema_in_empty_database():
+    con = duckdb.connect(":memory:")
+
+    assert migrate(con) is None
+    assert schema_version(con) == SCHEMA_VERSION
+    assert [row[1] for row in con.execute("PRAGMA table_info('trades')").fetchall()] == [
+        "trade_id", "ts", "price", "qty", "side", "symbol",
+    ]
+
+
+def test_decimal_store_holds_large_meme_coin_quantities(tmp_path):
+    db_path = tmp_path / "trades.db"
+    trades = pd.DataFrame(
+        {
+            "ts": [1700000000000, 1700000001000],
+            "price": [0.00000123, 0.00000124],
+            "qty": [25_000_000_000.0, 1_234_567_890_123.5],  # above the 10 integer digits of DECIMAL(18, 8)
+            "side": ["buy", "sell"],
+            "symbol": ["PEPEUSDT", "PEPEUSDT"],
+        }
+    )
+    with duckdb.connect(db_path.as_posix()) as con:
+        con.execute("CREATE TABLE trades AS SELECT * FROM trades")
+        migrate(con, decimal=True)
+        con.execute("INSERT INTO trades (ts, price, qty, side, symbol) VALUES (1700000002000, 0.00000125, 9e15, 'buy', 'PEPEUSDT')")
+
+    loaded = load_trades("PEPEUSDT", db_path=db_path)
+
+    assert loaded["qty"].tolist() == [25_000_000_000.0, 1_234_567_890_123.5, 9e15]
+    assert loaded["price"].tolist() == [0.00000123, 0.00000124, 0.00000125]
@@ -1,14 +1,29 @@
+import asyncio
 import importlib
 import sys
 
 import pytest
 from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
 
 
 class FakeRedis:
-    def __init__(self, batches):
+    def __init__(self, batches, history=None):
         self.batches = batches
+        self.history = history or []
         self.xread_calls = []
+        self.xrevrange_calls = []
+
+    def xrevrange(self, name, max="+", min="-", count=None):
+        self.xrevrange_calls.append(min)
+        from forecast.history import id_key
+
+        newest_first = list(reversed(self.history))
+        if min.startswith("("):
+            newest_first = [entry for entry in newest_first if id_key(entry[0]) > id_key(min[1:])]
+        if max.startswith("("):
+            newest_first = [entry for entry in newest_first if id_key(entry[0]) < id_key(max[1:])]
+        return newest_first[:count]
 
     def xread(self, *args, **kwargs):
         self.xread_calls.append((args, kwargs))
@@ -69,3 +84,256 @@ def test_websocket_emits_normalized_payload(service_client):
     if "ofi" in message:
         assert isinstance(message["ofi"], (int, float))
     assert message.get("predictor") in {"model", "heuristic"}
+
+
+def test_websocket_backfill_replays_recent_history(monkeypatch):
+    history = [
+        ("1-0", {"ts": "1700000000000", "price": "64000.0", "qty": "0.01", "side": "buy"}),
+        ("2-0", {"ts": "1700000001000", "price": "64001.0", "qty": "0.02", "side": "sell"}),
+    ]
+    fake_redis = FakeRedis([], history=history)
+
+    if "forecast.service" in sys.modules:
+        del sys.modules["forecast.service"]
+    monkeypatch.setattr("redis.Redis", lambda **kwargs: fake_redis)
+    service = importlib.import_module("forecast.service")
+    service.r = fake_redis
+
+    client = TestClient(service.app)
+    with client.websocket_connect("/ws/trades?backfill=1") as websocket:
+        message = websocket.receive_json()
+
+    # only the most recent entry is replayed and live reading starts after it
+    assert message["id"] == "2-0"
+    assert message["side"] == "sell"
+    args, _ = fake_redis.xread_calls[0]
+    assert args[0] == {"trades:btcusdt": "2-0"}
+
+
+def test_slow_subscriber_is_conflated_to_latest_payloads():
+    from forecast.hub import StreamHub
+
+    async def scenario():
+        hub = StreamHub(FakeRedis([]), "trades:btcusdt", lambda messages: [], queue_size=2)
+        subscriber = hub.subscribe()
+        hub._task.cancel()
+        for i in range(5):
+            hub.publish(str(i))
+        return subscriber, [await subscriber.get(), await subscriber.get()]
+
+    subscriber, received = asyncio.run(scenario())
+
+    assert received == ["3", "4"]
+    assert subscriber.dropped == 3
+
+
+class FlakyRedis(FakeRedis):
+    """XREAD raises ``ConnectionError`` for the first ``failures`` calls."""
+
+    def __init__(self, batches, failures, history=None):
+        super().__init__(batches, history)
+        self.failures = failures
+
+    def xread(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            self.xread_calls.append((args, kwargs))
+            raise ConnectionError("connection reset")
+        return super().xread(*args, **kwargs)
+
+
+def test_hub_retries_a_failed_read_from_the_last_id():
+    from forecast.hub import StreamHub
+
+    history = [("1-0", {"ts": "1700000000000"})]
+    client = FlakyRedis([[("trades:btcusdt", [("2-0", {"ts": "1700000001000"})])]], failures=1, history=history)
+
+    async def scenario():
+        hub = StreamHub(client, "trades:btcusdt", lambda messages: [{"id": i} for i, _ in messages], retry_delay=0.01)
+        subscriber = hub.subscribe()
+        received = await asyncio.wait_for(subscriber.get(), timeout=2)
+        hub.unsubscribe(subscriber)
+        return received
+
+    assert asyncio.run(scenario()) == '{"id": "2-0"}'
+    # the failed read and its retry both resume after the seeded tail
+    assert [args[0] for args, _ in client.xread_calls[:2]] == [{"trades:btcusdt": "1-0"}] * 2
+
+
+def test_restarted_hub_builds_the_gap_after_history_off_the_loop():
+    import threading
+
+    from forecast.history import TradeHistory
+    from forecast.hub import StreamHub
+
+    stream = [(f"{n}-0", {"ts": str(1700000000000 + n * 1000), "price": "1.0", "qty": "1.0"}) for n in range(1, 11)]
+    client = FakeRedis([[("trades:btcusdt", [("11-0", stream[0][1])])]], history=stream)
+    history = TradeHistory(100)
+    history.extend([{"id": "2-0", "ts": 0, "price": 1.0, "qty": 1.0}])  # kept before the hub restarted
+    built, threads = [], set()
+
+    def build_payloads(messages):
+        threads.add(threading.get_ident())
+        payloads = [{"id": i, "ts": 0, "price": 1.0, "qty": 1.0} for i, _ in messages]
+        built.append([i for i, _ in messages])
+        history.extend(payloads)
+        return payloads
+
+    async def scenario():
+        hub = StreamHub(client, "trades:btcusdt", build_payloads, backlog=3, seed_after=history.read_after)
+        subscriber = hub.subscribe()
+        received = await asyncio.wait_for(subscriber.get(), timeout=2)
+        hub.unsubscribe(subscriber)
+        return received
+
+    assert asyncio.run(scenario()) == '{"id": "11-0", "ts": 0, "price": 1.0, "qty": 1.0}'
+    # 3-0..7-0 fall between the kept history and the backfill tail; none is skipped or read twice
+    assert built == [[f"{n}-0" for n in range(3, 11)], ["11-0"]]
+    assert client.xrevrange_calls == ["-", "(2-0"]
+    assert history.snapshot()["id"] == [f"{n}-0" for n in range(2, 12)]
+    assert threading.get_ident() not in threads
+
+
+def test_websocket_closes_when_the_hub_reader_gives_up(monkeypatch):
+    fake_redis = FlakyRedis([], failures=100)
+
+    if "forecast.service" in sys.modules:
+        del sys.modules["forecast.service"]
+    monkeypatch.setattr("redis.Redis", lambda **kwargs: fake_redis)
+    service = importlib.import_module("forecast.service")
+    service.r = fake_redis
+    hub = service.get_hub("trades:btcusdt")
+    hub.retry_delay, hub.max_retries = 0.001, 2
+
+    client = TestClient(service.app)
+    with client.websocket_connect("/ws/trades") as websocket:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_text()
+
+    assert closed.value.code == 1013
+    assert len(fake_redis.xread_calls) == 3
+
+
+def test_packed_binary_entries_fan_out_one_payload_per_trade(monkeypatch):
+    from ingest.wire import BINARY_FIELD, pack_trades
+
+    packed = pack_trades(
+        [
+            {"trade_id": 1, "ts": 1700000000000, "price": 64000.0, "qty": 0.01, "side": "buy"},
+            {"trade_id": 2, "ts": 1700000000001, "price": 64000.5, "qty": 0.02, "side": "sell"},
+        ]
+    )
+    fake_redis = FakeRedis([[(b"trades:btcusdt", [(b"3-0", {BINARY_FIELD.encode(): packed})])]])
+
+    if "forecast.service" in sys.modules:
+        del sys.modules["forecast.service"]
+    monkeypatch.setattr("redis.Redis", lambda **kwargs: fake_redis)
+    service = importlib.import_module("forecast.service")
+    service.r = fake_redis
+
+    client = TestClient(service.app)
+    with client.websocket_connect("/ws/trades") as websocket:
+        messages = [websocket.receive_json(), websocket.receive_json()]
+
+    assert [m["id"] for m in messages] == ["3-0.0", "3-0.1"]
+    assert [m["side"] for m in messages] == ["buy", "sell"]
+    assert messages[1]["price"] == 64000.5
+
+
+def test_model_endpoints_report_and_reload_the_active_model(service_client):
+    client, _ = service_client
+
+    before = client.get("/model").json()
+    after = client.post("/model/reload").json()
+
+    assert set(before) >= {"version", "loaded_at", "source", "feature_cols"}
+    if before["source"] == "heuristic":  # no bundle on disk in a fresh checkout: reload fails, heuristic stays
+        assert after["source"] == "heuristic" and after["failures"] == before["failures"] + 1
+    else:
+        assert after["version"] == before["version"] and after["reloads"] == before["reloads"] + 1
+
+
+def test_snapshot_endpoint_and_websocket_snapshot_frame(monkeypatch):
+    history = [
+        (f"{n}-0".encode(), {b"ts": str(1700000000000 + n * 1000).encode(), b"price": b"64000.0", b"qty": b"0.01", b"side": b"buy"})
+        for n in range(1, 6)
+    ]
+    live = [[(b"trades:btcusdt", [history[-1], (b"6-0", history[0][1])])]]
+    fake_redis = FakeRedis(live, history=history)
+
+    if "forecast.service" in sys.modules:
+        del sys.modules["forecast.service"]
+    monkeypatch.setattr("redis.Redis", lambda **kwargs: fake_redis)
+    service = importlib.import_module("forecast.service")
+    service.r = fake_redis
+    client = TestClient(service.app)
+
+    snapshot = client.get("/snapshot?last=3").json()
+    assert snapshot["id"] == ["3-0", "4-0", "5-0"]
+    assert snapshot["side"] == ["buy"] * 3 and len(snapshot["prob_up"]) == 3
+
+    with client.websocket_connect("/ws/trades?snapshot=2") as websocket:
+        frame = websocket.receive_json()
+        message = websocket.receive_json()
+
+    assert frame["type"] == "snapshot" and frame["id"] == ["4-0", "5-0"]
+    assert message["id"] == "6-0"  # 5-0 came in the snapshot and is not sent again
+    assert client.get("/snapshot").json()["id"][-1] == "6-0"
+
+
+def test_snapshots_without_clients_only_read_new_entries(monkeypatch):
+    history = [
+        (f"{n}-0".encode(), {b"ts": str(1700000000000 + n * 1000).encode(), b"price": b"64000.0", b"qty": b"0.01", b"side": b"buy"})
+        for n in range(1, 4)
+    ]
+    fake_redis = FakeRedis([], history=history)
+
+    if "forecast.service" in sys.modules:
+        del sys.modules["forecast.service"]
+    monkeypatch.setattr("redis.Redis", lambda **kwargs: fake_redis)
+    service = importlib.import_module("forecast.service")
+    service.r = fake_redis
+    scored = []
+    build_payloads = service.build_payloads
+    monkeypatch.setattr(service, "build_payloads", lambda messages: scored.append(len(messages)) or build_payloads(messages))
+    client = TestClient(service.app)
+
+    assert client.get("/snapshot").json()["count"] == 3
+    assert client.get("/snapshot").json()["count"] == 3
+    history.append((b"4-0", history[0][1]))
+    assert client.get("/snapshot").json()["id"][-1] == "4-0"
+
+    assert fake_redis.xrevrange_calls == ["-", "(3-0", "(3-0"]
+    assert scored == [3, 1]  # nothing is rescored when nothing is new
+
+
+def test_websocket_batch_binary_and_conflated_delivery(monkeypatch):
+    from forecast.frames import unpack_payloads
+
+    entries = [(f"{n}-0".encode(), {b"ts": b"1700000000000", b"price": b"64000.0", b"qty": b"0.01", b"side": b"sell"}) for n in (1, 2)]
+
+    def connect(query):
+        fake_redis = FakeRedis([[(b"trades:btcusdt", entries)]])
+        if "forecast.service" in sys.modules:
+            del sys.modules["forecast.service"]
+        monkeypatch.setattr("redis.Redis", lambda **kwargs: fake_redis)
+        service = importlib.import_module("forecast.service")
+        service.r = fake_redis
+        return TestClient(service.app).websocket_connect(f"/ws/trades?{query}")
+
+    with connect("delivery=batch") as websocket:
+        frame = websocket.receive_json()
+    assert [m["id"] for m in frame] == ["1-0", "2-0"]
+
+    with connect("delivery=batch&encoding=binary") as websocket:
+        decoded = unpack_payloads(websocket.receive_bytes())
+    assert [m["id"] for m in decoded] == ["1-0", "2-0"] and decoded[0]["side"] == "sell"
+
+    with connect("delivery=conflate&interval_ms=10") as websocket:
+        latest = websocket.receive_json()
+    assert [m["id"] for m in latest] == ["2-0"]
+
+    with pytest.raises(WebSocketDisconnect) as rejected:
+        with connect("encoding=binary") as websocket:
+            websocket.receive_bytes()
+    assert rejected.value.code == 1008
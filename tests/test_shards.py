@@ -0,0 +1,80 @@
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+from processor.features import DAY_MS, build_features, build_features_incremental, load_partitions, partition_paths
+from processor.shards import build_sharded, shard_ranges
+
+MIDNIGHT = 1699920000000  # 2023-11-14 00:00 UTC
+
+
+def make_multi_symbol_db(path, seed=5):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for symbol, n in (("BTCUSDT", 3000), ("ETHUSDT", 1500)):
+        ts = np.sort(MIDNIGHT + rng.integers(0, 3 * DAY_MS, n))
+        # two quiet hours across the first midnight: shards there start with only filled bars
+        ts = ts[(ts < MIDNIGHT + DAY_MS - 3_600_000) | (ts >= MIDNIGHT + DAY_MS + 3_600_000)]
+        qty = rng.exponential(0.5, len(ts))
+        qty[::97] = 0.0  # zero-volume trades: bars without a VWAP of their own
+        frames.append(
+            pd.DataFrame(
+                {
+                    "ts": ts,
+                    "price": 100 + np.cumsum(rng.normal(0, 0.05, len(ts))),
+                    "qty": qty,
+                    "side": np.where(rng.random(len(ts)) < 0.5, "buy", "sell"),
+                    "symbol": symbol,
+                }
+            )
+        )
+    trades = pd.concat(frames, ignore_index=True)
+    with duckdb.connect(path.as_posix()) as con:
+        con.execute("CREATE TABLE trades AS SELECT * FROM trades")
+    return trades
+
+
+def test_shard_ranges_cover_whole_days():
+    assert shard_ranges(MIDNIGHT + 5, MIDNIGHT + DAY_MS) == [(MIDNIGHT, MIDNIGHT + DAY_MS), (MIDNIGHT + DAY_MS, MIDNIGHT + 2 * DAY_MS)]
+    assert shard_ranges(MIDNIGHT, MIDNIGHT + 2 * DAY_MS, shard_days=2)[-1] == (MIDNIGHT + 2 * DAY_MS, MIDNIGHT + 4 * DAY_MS)
+
+
+@pytest.mark.parametrize("engine, start_ts", [("duckdb", None), ("pandas", MIDNIGHT + 5 * 3_600_000 + 17)])
+def test_sharded_build_matches_a_single_pass(tmp_path, engine, start_ts):
+    db_path = tmp_path / "trades.db"
+    make_multi_symbol_db(db_path)
+    rolling = (3, 30)  # the long window reaches back over the quiet stretch
+
+    results = build_sharded(
+        ["BTCUSDT", "ETHUSDT"],
+        lambda symbol: tmp_path / symbol.lower(),
+        start_ts=start_ts,
+        resample="1min",
+        rolling_windows=rolling,
+        db_path=db_path,
+        engine=engine,
+        workers=2,
+        verbose=False,
+    )
+
+    assert {result.symbol for result in results} == {"BTCUSDT", "ETHUSDT"}
+    for symbol in ("BTCUSDT", "ETHUSDT"):
+        single = build_features(symbol, start_ts=start_ts, resample="1min", rolling_windows=rolling, db_path=db_path, engine=engine)
+        stitched = load_partitions(tmp_path / symbol.lower())
+        pd.testing.assert_frame_equal(stitched, single, check_freq=False)
+        assert len(partition_paths(tmp_path / symbol.lower())) == 3
+
+
+def test_incremental_run_continues_a_sharded_build(tmp_path):
+    db_path = tmp_path / "trades.db"
+    trades = make_multi_symbol_db(db_path)
+    cut = int(trades.loc[trades["symbol"] == "BTCUSDT", "ts"].iloc[2000])
+
+    build_sharded(["BTCUSDT"], lambda symbol: tmp_path / "sharded", end_ts=cut, resample="5min", shard_days=2, db_path=db_path, verbose=False)
+    build_features_incremental("BTCUSDT", tmp_path / "sharded", resample="5min", db_path=db_path)
+    build_features_incremental("BTCUSDT", tmp_path / "full", resample="5min", db_path=db_path)
+
+    sharded, full = partition_paths(tmp_path / "sharded"), partition_paths(tmp_path / "full")
+    assert [p.name for p in sharded] == [p.name for p in full]
+    pd.testing.assert_frame_equal(load_partitions(tmp_path / "sharded"), load_partitions(tmp_path / "full"))
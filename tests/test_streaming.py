@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from processor.features import compute_window_features
+from processor.streaming import RollingWindow, StreamingFeatureEngine, windows_from_feature_cols
+
+
+def make_random_trades(n=2000, seed=3):
+    rng = np.random.default_rng(seed)
+    ts = np.sort(1700000000000 + rng.integers(0, 2 * 3_600_000, n))
+    ts[n // 2:] += 17 * 60_000  # a gap of empty bars that must be forward filled
+    return pd.DataFrame(
+        {
+            "ts": ts,
+            "price": 100 + np.cumsum(rng.normal(0, 0.05, n)),
+            "qty": rng.exponential(0.5, n),
+            "side": np.where(rng.random(n) < 0.5, "buy", "sell"),
+            "symbol": "BTCUSDT",
+        }
+    )
+
+
+def run_engine(trades, resample, windows):
+    engine = StreamingFeatureEngine(resample=resample, rolling_windows=windows)
+    rows = []
+    for ts, price, qty, side in trades[["ts", "price", "qty", "side"]].itertuples(index=False):
+        rows += engine.update(int(ts), float(price), float(qty), side)
+    rows += engine.flush()
+    frame = pd.DataFrame(rows)
+    frame.index = pd.to_datetime(frame.pop("bar_ts"), unit="ms", utc=True)
+    return engine, frame
+
+
+@pytest.mark.parametrize("resample,windows", [("1min", (3, 5, 15)), ("30s", (2, 10))])
+def test_streaming_engine_matches_batch_features(resample, windows):
+    trades = make_random_trades()
+    batch = compute_window_features(trades, resample=resample, rolling_windows=windows)
+
+    engine, streamed = run_engine(trades, resample, windows)
+
+    cols = list(engine.feature_names)
+    assert list(streamed.index) == list(batch.index)
+    np.testing.assert_allclose(streamed[cols].to_numpy(float), batch[cols].to_numpy(float), rtol=1e-9, atol=1e-12)
+
+
+def test_snapshot_matches_closing_the_bar_now():
+    trades = make_random_trades(n=300)
+    engine = StreamingFeatureEngine(rolling_windows=(3,))
+    for ts, price, qty, side in trades[["ts", "price", "qty", "side"]].itertuples(index=False):
+        engine.update(int(ts), float(price), float(qty), side)
+
+    snapshot = engine.snapshot()
+    closed = engine.flush()[0]
+
+    assert snapshot == pytest.approx(closed)
+
+
+def test_rolling_window_tracks_mean_and_sample_std():
+    window = RollingWindow(3)
+    values = [1.0, 4.0, 2.0, 8.0, -3.0]
+    for i, value in enumerate(values):
+        mean, std = window.push(value)
+        recent = values[max(0, i - 2): i + 1]
+        assert mean == pytest.approx(np.mean(recent))
+        assert std == pytest.approx(np.std(recent, ddof=1) if len(recent) > 1 else 0.0)
+
+
+def test_features_publish_exactly_requested_columns():
+    engine = StreamingFeatureEngine(rolling_windows=windows_from_feature_cols(("ma_5", "vol_5", "vwap")))
+    engine.update(1700000000000, 100.0, 1.0, "buy")
+    engine.update(1700000000500, 101.0, 1.0, "sell")
+
+    features = engine.features(("ma_5", "vol_5", "vwap"))
+
+    assert set(features) == {"ma_5", "vol_5", "vwap", "ofi"}
+    assert features["vwap"] == pytest.approx(100.5)
+    assert features["ofi"] == 0.0
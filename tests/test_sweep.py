@@ -0,0 +1,70 @@
+import json
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+from processor import train_model
+from processor.sweep import label_matrix, sweep, walk_forward_folds
+from processor.train_model import build_targets
+
+
+def make_features(n=400, seed=3):
+    rng = np.random.default_rng(seed)
+    signal = rng.normal(size=n)
+    close = 100 * np.exp(np.cumsum(0.001 * np.roll(signal, 1) + rng.normal(0, 0.0005, n)))
+    index = pd.date_range("2024-01-01", periods=n, freq="1min", name="bar_ts")
+    return pd.DataFrame(
+        {"price_close": close, "signal": signal, "noise": rng.normal(size=n), "symbol": "BTCUSDT"}, index=index
+    )
+
+
+def test_walk_forward_folds_expand_or_roll_and_purge_the_gap():
+    assert walk_forward_folds(60, 2) == [(0, 20, 20, 40), (0, 40, 40, 60)]
+    assert walk_forward_folds(60, 2, "rolling", gap=3) == [(0, 17, 20, 40), (20, 37, 40, 60)]
+    with pytest.raises(ValueError):
+        walk_forward_folds(60, 2, "sliding")
+
+
+def test_label_matrix_matches_build_targets():
+    features = make_features(50)
+    targets = [(1, 0.0), (3, 0.001)]
+
+    labels = label_matrix(features["price_close"].to_numpy(), targets)
+
+    for row, (horizon, threshold) in enumerate(targets):
+        expected = build_targets(features, horizon, threshold)["label"].to_numpy()
+        assert labels[row, : len(expected)].tolist() == expected.tolist()
+        assert (labels[row, len(expected):] == -1).all()
+
+
+def test_sweep_is_the_same_in_a_process_pool():
+    features = make_features()
+    args = dict(Cs=[0.01, 1.0], horizons=[1, 2], thresholds=[0.0], folds=3)
+
+    serial = sweep(features, ("signal", "noise"), workers=1, **args)
+    pooled = sweep(features, ("signal", "noise"), workers=2, **args)
+
+    assert serial == pooled
+    assert len(serial) == 4 and all(row["folds"] == 3 for row in serial)
+    assert serial[0]["horizon"] == 1  # the signal predicts the next bar only
+    assert serial[0]["roc_auc"] >= max(row["roc_auc"] for row in serial)
+
+
+def test_sweep_cli_writes_leaderboard_and_best_bundle(tmp_path, monkeypatch):
+    feature_path = tmp_path / "btcusdt_1min.parquet"
+    make_features().to_parquet(feature_path)
+    argv = ["train_model", "BTCUSDT", "--features", str(feature_path), "--model-dir", str(tmp_path), "--sweep"]
+    argv += ["--C", "0.1", "1", "--horizon", "1", "3", "--threshold", "0", "--folds", "3", "--workers", "1"]
+    monkeypatch.setattr(sys, "argv", argv)
+
+    train_model.main()
+
+    board = json.loads((tmp_path / "btcusdt_1min_sweep.json").read_text())
+    meta = json.loads((tmp_path / "btcusdt_1min_h1.json").read_text())
+    bundle = joblib.load(tmp_path / "btcusdt_1min_h1.joblib")
+    assert len(board) == 4
+    assert (meta["C"], meta["horizon"]) == (board[0]["C"], board[0]["horizon"])
+    assert tuple(bundle["feature_cols"]) == ("price_close", "signal", "noise")
@@ -0,0 +1,144 @@
+import asyncio
+import importlib
+import json
+import sys
+
+from fastapi.testclient import TestClient
+
+from forecast.tracing import Tracer
+from ingest.trace import STAGES, encode, hops, parse, sampled, stamp
+from ingest.wire import BINARY_FIELD, decode_entry, pack_features, pack_traces, pack_trades
+from tests.test_worker import FakeGroupRedis, make_worker
+
+TS = 1700000000000
+
+
+def test_trace_offsets_round_trip_and_skip_missing_stages():
+    stages = {"exchange": TS * 1000 + 900, "redis": TS * 1000 + 4000}
+
+    text = encode(stages, TS)
+
+    assert text == "900,,4000"
+    assert parse(text, TS) == stages
+    assert parse(stamp(text, TS, ingest=TS * 1000 + 2500, processor=None), TS)["ingest"] == TS * 1000 + 2500
+    assert hops(parse("900,2500,4000,,6000", TS)) == [
+        ("exchange->ingest", 1600),
+        ("ingest->redis", 1500),
+        ("redis->send", 2000),
+    ]
+    assert len(STAGES) == 5
+
+
+def test_sampling_is_by_trade_id():
+    assert [i for i in range(10) if sampled(i, 4)] == [0, 4, 8]
+    assert not any(sampled(i, 0) for i in range(10))
+
+
+def test_ingest_stamps_exchange_and_receive_time_on_sampled_trades():
+    ingest = importlib.import_module("ingest.ingest")
+    frames = [
+        json.dumps({"data": {"e": "trade", "E": TS + 3, "s": "BTCUSDT", "t": t, "T": TS, "p": "1", "q": "1", "m": False}})
+        for t in (10, 11)
+    ]
+
+    (_, traced), (_, plain) = [ingest.parse_message(frame, trace_every=2) for frame in frames]
+
+    stages = parse(traced["trace"], TS)
+    assert stages["exchange"] == (TS + 3) * 1000
+    assert stages["ingest"] >= stages["exchange"] - 60_000_000  # receive time from the local clock
+    assert "trace" not in plain
+    assert "trace" not in ingest.parse_message(frames[0])[1]
+
+
+def test_binary_entries_carry_traces_beside_the_packed_records():
+    trades = [{"trade_id": i, "ts": TS + i, "price": 1.0, "qty": 1.0, "side": "buy"} for i in range(3)]
+    trades[1]["trace"] = "900,2500"
+    entry = {BINARY_FIELD.encode(): pack_trades(trades), b"trace": pack_traces(trades).encode()}
+
+    records = decode_entry(entry)
+
+    assert [r.get("trace") for r in records] == [None, "900,2500", None]
+    assert pack_traces(trades[:1]) is None
+    rows = [{"ts": TS, "ma_3": 1.0, "trace": "1,2"}, {"ts": TS + 1, "ma_3": 2.0}]
+    assert decode_entry({BINARY_FIELD.encode(): pack_features(rows)})[0] == {"ts": TS, "ma_3": 1.0}
+
+
+def test_processor_adds_redis_and_processor_stages(tmp_path):
+    for wire in ("text", "binary"):
+        client = FakeGroupRedis()
+        client.xadd("trades:btcusdt", {"ts": TS, "price": 1.0, "qty": 1.0, "side": "buy", "trace": "900,2500"})
+        client.xadd("trades:btcusdt", {"ts": TS + 1, "price": 1.0, "qty": 1.0, "side": "sell"})
+        worker = make_worker(client, "w1", tmp_path, wire=wire)
+        worker.ensure_groups()
+        worker._last_claim = float("inf")
+        worker.run_once()
+
+        rows = [row for _, entry in client.streams["features:btcusdt"] for row in decode_entry(entry)]
+        stages = parse(rows[0]["trace"], TS)
+        assert stages["redis"] == 1000  # the fake's entry id "1-0"
+        assert stages["processor"] > stages["ingest"] == TS * 1000 + 2500
+        assert "trace" not in rows[1]
+
+
+def test_tracer_reports_hop_percentiles_and_slowest_traces():
+    tracer = Tracer(window=10)
+    for i in range(5):
+        tracer.observe({"id": f"{i}-0", "ts": TS, "trace": f"1000,{2000 + i * 1000},{3000 + i * 1000}"}, sent_us=TS * 1000 + 10_000)
+
+    report = tracer.report(top=2)
+
+    assert set(report["hops"]) == {"exchange->ingest", "ingest->redis", "redis->send"}
+    assert report["hops"]["exchange->ingest"]["count"] == 5
+    assert report["hops"]["exchange->ingest"]["max_ms"] == 5.0
+    assert [trace["id"] for trace in report["slowest"]] == ["0-0", "1-0"]
+    assert report["slowest"][0]["slowest_hop"] == "redis->send"
+    assert report["slowest"][0]["total_ms"] == 9.0
+
+
+def test_service_traces_payloads_to_the_websocket_send(monkeypatch):
+    from tests.test_service import FakeRedis
+
+    fields = {"ts": str(TS), "price": "1.0", "qty": "1.0", "side": "buy", "trace": "900,2500"}
+    fake_redis = FakeRedis([[("trades:btcusdt", [(f"{TS + 4}-0", fields)])]])
+    if "forecast.service" in sys.modules:
+        del sys.modules["forecast.service"]
+    monkeypatch.setattr("redis.Redis", lambda **kwargs: fake_redis)
+    service = importlib.import_module("forecast.service")
+    service.r = fake_redis
+
+    client = TestClient(service.app)
+    with client.websocket_connect("/ws/trades") as websocket:
+        payload = websocket.receive_json()
+    report = client.get("/trace").json()
+
+    assert parse(payload["trace"], TS)["redis"] == (TS + 4) * 1000
+    assert set(report["hops"]) == {"exchange->ingest", "ingest->redis", "redis->send"}
+    assert report["hops"]["ingest->redis"]["p50_ms"] == 1.5
+    assert report["slowest"][0]["id"] == f"{TS + 4}-0"
+
+
+def test_each_trace_is_observed_once_whatever_the_number_of_clients(monkeypatch):
+    from forecast.frames import Batch
+    from tests.test_service import FakeRedis
+
+    fake_redis = FakeRedis([])
+    if "forecast.service" in sys.modules:
+        del sys.modules["forecast.service"]
+    monkeypatch.setattr("redis.Redis", lambda **kwargs: fake_redis)
+    service = importlib.import_module("forecast.service")
+
+    async def scenario():
+        hub = service.get_hub("trades:btcusdt")
+        first, second = hub.subscribe(), hub.subscribe(mode="batch")
+        hub._task.cancel()
+        hub.publish_batch(Batch([{"id": "1-0", "ts": TS, "trace": "1000,2000"}, {"id": "2-0", "ts": TS}]))
+        return await first.get(), await second.get()
+
+    event, batch = asyncio.run(scenario())
+
+    assert json.loads(event)["id"] == "1-0" and len(batch) == 2
+    assert {hop: len(samples) for hop, samples in service.tracer.hops.items()} == {
+        "exchange->ingest": 1,
+        "ingest->send": 1,
+    }
+    assert len(service.tracer.recent) == 1
@@ -0,0 +1,98 @@
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.metrics import roc_auc_score
+
+from processor import train_model
+from processor.features import write_partitions
+from processor.predictor import PriceDirectionPredictor
+from processor.train_model import build_targets, split_dataset
+from processor.train_stream import (
+    StreamingMetrics,
+    feature_files,
+    iter_batches,
+    labelled_batches,
+    split_rows,
+    train_streaming,
+)
+
+FEATURE_COLS = ("price_close", "signal", "trade_count")
+
+
+def make_features(n=3000, seed=4):
+    rng = np.random.default_rng(seed)
+    signal = rng.normal(size=n)
+    close = 100 * np.exp(np.cumsum(np.r_[0.0, 0.001 * signal[:-1]] + rng.normal(0, 0.0003, n)))
+    index = pd.date_range("2024-01-01 20:00", periods=n, freq="1min", tz="UTC", name="timestamp")
+    return pd.DataFrame(
+        {"price_close": close, "signal": signal, "trade_count": rng.integers(1, 50, n), "symbol": "BTCUSDT"},
+        index=index,
+    )
+
+
+@pytest.mark.parametrize("engine", ["arrow", "duckdb"])
+def test_batched_targets_and_split_match_the_in_memory_path(tmp_path, engine):
+    features = make_features(300)
+    write_partitions(features, tmp_path)  # spans a day boundary: two files
+    dataset = build_targets(features, horizon=3, threshold=0.0)
+    X_train, X_test, y_train, y_test = split_dataset(dataset, FEATURE_COLS)
+
+    def rows(train):
+        batches = iter_batches(feature_files(tmp_path), FEATURE_COLS, batch_rows=7, engine=engine)
+        parts = list(split_rows(labelled_batches(batches, 3, 0.0), len(y_train), train))
+        return np.concatenate([X for X, _ in parts]), np.concatenate([y for _, y in parts])
+
+    assert len(feature_files(tmp_path)) == 2
+    np.testing.assert_array_equal(rows(True)[0], X_train)
+    np.testing.assert_array_equal(rows(True)[1], y_train)
+    np.testing.assert_array_equal(rows(False)[0], X_test)
+    np.testing.assert_array_equal(rows(False)[1], y_test)
+
+
+def test_unsorted_files_need_the_duckdb_engine(tmp_path):
+    features = make_features(50)
+    path = tmp_path / "features.parquet"
+    features.iloc[::-1].to_parquet(path)
+
+    with pytest.raises(ValueError, match="not sorted"):
+        list(iter_batches([path], FEATURE_COLS, batch_rows=10))
+    prices = np.concatenate([price for _, price in iter_batches([path], FEATURE_COLS, batch_rows=10, engine="duckdb")])
+    np.testing.assert_array_equal(prices, features["price_close"].to_numpy())
+
+
+def test_streaming_metrics_match_sklearn():
+    rng = np.random.default_rng(1)
+    y = rng.integers(0, 2, 5000)
+    prob = np.clip(0.5 + 0.2 * (y - 0.5) + rng.normal(0, 0.2, 5000), 0, 1)
+    metrics = StreamingMetrics()
+    for start in range(0, 5000, 700):
+        metrics.update(y[start : start + 700], prob[start : start + 700])
+
+    result = metrics.result()
+
+    assert result["roc_auc"] == pytest.approx(roc_auc_score(y, prob), abs=1e-4)
+    assert result["accuracy"] == np.mean((prob >= 0.5) == y)
+    assert result["rows"] == 5000
+
+
+def test_streaming_bundle_loads_in_the_predictor(tmp_path, monkeypatch):
+    features = make_features()
+    write_partitions(features, tmp_path / "features")
+
+    model, feature_cols, metrics = train_streaming(tmp_path / "features", 1, 0.0, batch_rows=256, epochs=2)
+
+    assert feature_cols == FEATURE_COLS
+    assert metrics["train_rows"] + metrics["rows"] == len(features) - 1
+    assert metrics["roc_auc"] > 0.6  # the signal predicts the next bar
+
+    argv = ["train_model", "BTCUSDT", "--features", str(tmp_path / "features"), "--model-dir", str(tmp_path)]
+    monkeypatch.setattr(sys, "argv", argv + ["--stream", "--batch-rows", "256", "--engine", "duckdb"])
+    train_model.main()
+    predictor = PriceDirectionPredictor(tmp_path / "btcusdt_1min_h1.joblib")
+    X = features.loc[:, list(FEATURE_COLS)].to_numpy(dtype=float)[:50]
+    prob_up, _, source = predictor.predict_batch(X)
+
+    assert predictor.bundle.linear is not None and source == "model"
+    np.testing.assert_allclose(prob_up, predictor.bundle.model.predict_proba(X)[:, 1])
@@ -0,0 +1,42 @@
+import pytest
+
+from ingest.wire import BINARY_FIELD, decode_entry, pack_features, pack_trades, record_id
+
+TRADES = [
+    {"trade_id": 7, "ts": 1700000000000, "price": 64000.42, "qty": 0.012, "side": "buy"},
+    {"trade_id": 8, "ts": 1700000000001, "price": 64001.0, "qty": 1e-08, "side": "sell"},
+    {"ts": 1700000000002, "price": 0.1, "qty": 3.0, "side": "buy"},  # replayed trades have no id
+]
+
+
+def test_packed_trades_round_trip_exactly():
+    assert decode_entry({BINARY_FIELD.encode(): pack_trades(TRADES)}) == TRADES
+    assert decode_entry({BINARY_FIELD: pack_trades([])}) == []
+
+
+def test_text_entries_decode_from_str_or_bytes():
+    text = {"ts": "1700000000000", "price": "64000.42", "qty": "0.012", "side": "buy", "ofi": "0.5"}
+    raw = {k.encode(): v.encode() for k, v in text.items()}
+
+    expected = [{"ts": 1700000000000, "price": 64000.42, "qty": 0.012, "side": "buy", "ofi": "0.5"}]
+    assert decode_entry(text) == expected
+    assert decode_entry(raw) == expected
+    assert decode_entry({}) == []
+
+
+def test_packed_features_round_trip():
+    rows = [{"ts": 1700000000000 + i, "ma_3": 100.5 + i, "ofi": -0.25} for i in range(3)]
+
+    assert decode_entry({BINARY_FIELD.encode(): pack_features(rows)}) == rows
+
+
+def test_binary_entries_reject_decoded_clients_and_unknown_versions():
+    with pytest.raises(TypeError):
+        decode_entry({BINARY_FIELD: "not bytes"})
+    with pytest.raises(ValueError):
+        decode_entry({BINARY_FIELD: b"\x09\x00\x00\x00\x00"})
+
+
+def test_record_ids_are_unique_within_packed_entries():
+    assert record_id(b"5-0", 0, 1) == "5-0"
+    assert [record_id("5-0", i, 3) for i in range(3)] == ["5-0.0", "5-0.1", "5-0.2"]
@@ -0,0 +1,251 @@
+import pytest
+import redis
+
+from ingest.wire import BINARY_FIELD, decode_entry, pack_trades
+from processor.processor import FeatureWorker, assigned_symbols
+
+
+def id_key(message_id):
+    ms, seq = message_id.split("-")
+    return int(ms), int(seq)
+
+
+class FakePipeline:
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.calls = []
+
+    def xadd(self, *args):
+        self.calls.append(("xadd", args))
+
+    def xack(self, *args):
+        self.calls.append(("xack", args))
+
+    def execute(self):
+        self.redis_client.pipelines += 1
+        return [getattr(self.redis_client, name)(*args) for name, args in self.calls]
+
+
+class FakeGroupRedis:
+    """Just enough of the Redis consumer-group commands for the worker."""
+
+    def __init__(self):
+        self.streams = {}
+        self.groups = {}
+        self.pipelines = 0
+        self.now = 0
+
+    def xadd(self, name, fields):
+        entries = self.streams.setdefault(name, [])
+        message_id = f"{len(entries) + 1}-0"
+        entries.append((message_id, {k: v if isinstance(v, bytes) else str(v) for k, v in fields.items()}))
+        return message_id
+
+    def xgroup_create(self, name, group, id="$", mkstream=False):
+        if (name, group) in self.groups:
+            raise redis.ResponseError("BUSYGROUP Consumer Group name already exists")
+        entries = self.streams.setdefault(name, [])
+        last = entries[-1][0] if id == "$" and entries else "0-0"
+        self.groups[(name, group)] = {"last": last, "pending": {}}
+
+    def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        result = []
+        for name, start in streams.items():
+            state = self.groups[(name, group)]
+            if start == ">":
+                batch = [e for e in self.streams[name] if id_key(e[0]) > id_key(state["last"])][:count]
+                if batch:
+                    state["last"] = batch[-1][0]
+            else:
+                batch = [
+                    e for e in self.streams[name]
+                    if e[0] in state["pending"] and state["pending"][e[0]][0] == consumer
+                    and id_key(e[0]) > id_key(start if "-" in start else f"{start}-0")
+                ][:count]
+            for message_id, _ in batch:
+                state["pending"][message_id] = (consumer, self.now)
+            if batch:
+                result.append((name, batch))
+        return result
+
+    def xack(self, name, group, *ids):
+        pending = self.groups[(name, group)]["pending"]
+        return sum(pending.pop(message_id, None) is not None for message_id in ids)
+
+    def xautoclaim(self, name, group, consumer, min_idle_time, start_id="0-0", count=None):
+        pending = self.groups[(name, group)]["pending"]
+        claimed = []
+        for message_id, fields in self.streams[name]:
+            owner = pending.get(message_id)
+            if owner and owner[0] != consumer and self.now - owner[1] >= min_idle_time:
+                pending[message_id] = (consumer, self.now)
+                claimed.append((message_id, fields))
+        return ["0-0", claimed, []]
+
+    def xrange(self, name, min="-", max="+", count=None):
+        return self.streams.get(name, [])[:count]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+def add_trades(client, stream, n, start_ts=1700000000000):
+    for i in range(n):
+        client.xadd(stream, {"ts": start_ts + i * 1000, "price": 100 + i, "qty": 1.0, "side": "buy" if i % 2 else "sell"})
+
+
+def make_worker(client, consumer, tmp_path, **kwargs):
+    return FeatureWorker(
+        client, ["btcusdt"], consumer=consumer, model_path=tmp_path / "missing.joblib", start_id="0", **kwargs
+    )
+
+
+def test_assigned_symbols_partitions_every_symbol_once():
+    symbols = [f"sym{i}usdt" for i in range(50)]
+    owned = [assigned_symbols(symbols, i, 4) for i in range(4)]
+
+    assert sorted(s for part in owned for s in part) == sorted(symbols)
+    assert all(part for part in owned)
+    with pytest.raises(ValueError):
+        assigned_symbols(symbols, 4, 4)
+
+
+def test_worker_publishes_and_acks_each_batch_in_one_pipeline(tmp_path):
+    client = FakeGroupRedis()
+    add_trades(client, "trades:btcusdt", 5)
+    worker = make_worker(client, "w1", tmp_path, batch_size=10, claim_interval=3600)
+    worker.ensure_groups()
+    worker._last_claim = float("inf")
+
+    assert worker.run_once() == 5
+
+    features = client.streams["features:btcusdt"]
+    assert [fields["ts"] for _, fields in features] == [str(1700000000000 + i * 1000) for i in range(5)]
+    assert "ma_15" in features[-1][1] and "ofi" in features[-1][1]
+    assert client.pipelines == 1
+    assert client.groups[("trades:btcusdt", "processor")]["pending"] == {}
+
+
+def test_restarted_worker_does_not_reprocess_acknowledged_entries(tmp_path):
+    client = FakeGroupRedis()
+    add_trades(client, "trades:btcusdt", 3)
+    first = make_worker(client, "w1", tmp_path)
+    first.ensure_groups()
+    first._last_claim = float("inf")
+    first.run_once()
+
+    add_trades(client, "trades:btcusdt", 2, start_ts=1700000010000)
+    second = make_worker(client, "w1", tmp_path)
+    second.ensure_groups()
+    second._last_claim = float("inf")
+
+    assert second.recover_pending() == 0
+    assert second.run_once() == 2
+
+
+def test_pending_entries_of_a_dead_worker_are_reclaimed(tmp_path):
+    client = FakeGroupRedis()
+    add_trades(client, "trades:btcusdt", 4)
+    client.xgroup_create("trades:btcusdt", "processor", id="0")
+    client.xreadgroup("processor", "dead", {"trades:btcusdt": ">"}, count=10)  # delivered, never acked
+    client.now = 60_000
+
+    survivor = make_worker(client, "alive", tmp_path, claim_idle_ms=30_000)
+
+    assert survivor.reclaim() == 4
+    assert len(client.streams["features:btcusdt"]) == 4
+    assert client.groups[("trades:btcusdt", "processor")]["pending"] == {}
+
+
+def test_restarted_worker_replays_its_own_pending_entries_under_the_default_name(tmp_path):
+    client = FakeGroupRedis()
+    add_trades(client, "trades:btcusdt", 4)
+    crashed = FeatureWorker(client, ["btcusdt"], worker_index=1, model_path=tmp_path / "missing.joblib", start_id="0")
+    crashed.ensure_groups()
+    client.xreadgroup("processor", crashed.consumer, {"trades:btcusdt": ">"}, count=10)  # died before acking
+
+    restarted = FeatureWorker(client, ["btcusdt"], worker_index=1, model_path=tmp_path / "missing.joblib", start_id="0")
+
+    assert restarted.consumer == crashed.consumer == "worker-1"
+    assert restarted.recover_pending() == 4
+    assert client.groups[("trades:btcusdt", "processor")]["pending"] == {}
+
+
+def test_reclaimed_trades_older_than_the_engine_are_acked_but_not_applied(tmp_path):
+    client = FakeGroupRedis()
+    add_trades(client, "trades:btcusdt", 3)
+    client.xgroup_create("trades:btcusdt", "processor", id="0")
+    client.xreadgroup("processor", "dead", {"trades:btcusdt": ">"}, count=10)
+    add_trades(client, "trades:btcusdt", 2, start_ts=1700000010000)
+    survivor = make_worker(client, "alive", tmp_path, claim_idle_ms=30_000)
+    survivor._last_claim = float("inf")
+    assert survivor.run_once() == 2  # newer trades went through the engine first
+    client.now = 60_000
+
+    assert survivor.reclaim() == 0
+    assert survivor.stale == 3
+    assert len(client.streams["features:btcusdt"]) == 2
+    assert client.groups[("trades:btcusdt", "processor")]["pending"] == {}
+
+
+def test_worker_reads_packed_trades_and_publishes_packed_features(tmp_path):
+    text_client, binary_client = FakeGroupRedis(), FakeGroupRedis()
+    add_trades(text_client, "trades:btcusdt", 6)
+    trades = [fields for _, entry in text_client.streams["trades:btcusdt"] for fields in decode_entry(entry)]
+    binary_client.xadd("trades:btcusdt", {BINARY_FIELD: pack_trades(trades[:4])})
+    binary_client.xadd("trades:btcusdt", {BINARY_FIELD: pack_trades(trades[4:])})
+
+    results = []
+    for client, wire in ((text_client, "text"), (binary_client, "binary")):
+        worker = make_worker(client, "w1", tmp_path, batch_size=10, wire=wire)
+        worker.ensure_groups()
+        worker._last_claim = float("inf")
+        assert worker.run_once() == 6
+        results.append([row for _, entry in client.streams["features:btcusdt"] for row in decode_entry(entry)])
+
+    assert len(binary_client.streams["features:btcusdt"]) == 1
+    text_rows, binary_rows = results
+    assert [row["ts"] for row in binary_rows] == [row["ts"] for row in text_rows]
+    assert binary_rows[-1]["ma_15"] == float(text_rows[-1]["ma_15"])
+
+
+def test_worker_reloads_trades_trimmed_before_it_read_them(tmp_path):
+    client = FakeGroupRedis()
+    add_trades(client, "trades:btcusdt", 10)
+    stored = [fields for _, entry in client.streams["trades:btcusdt"] for fields in decode_entry(entry)]
+    requests = []
+
+    def backfill(symbol, start_ts, end_ts):
+        requests.append((symbol, start_ts, end_ts))
+        return [trade for trade in stored if start_ts <= trade["ts"] <= end_ts]
+
+    worker = make_worker(client, "w1", tmp_path, batch_size=3, backfill=backfill)
+    worker.ensure_groups()
+    worker._last_claim = float("inf")
+    assert worker.run_once() == 3
+
+    del client.streams["trades:btcusdt"][:6]  # retention trimmed entries 1-6; the worker only read 1-3
+
+    assert worker.run_once() == 6
+    assert worker.gaps == 1
+    assert requests == [("btcusdt", 1700000002001, 1700000005999)]
+    published = [int(fields["ts"]) for _, fields in client.streams["features:btcusdt"]]
+    assert published == [1700000000000 + i * 1000 for i in range(9)]
+
+    assert worker.run_once() == 1
+    assert worker.gaps == 1
+
+
+def test_worker_without_backfill_reports_the_gap_and_resumes(tmp_path):
+    client = FakeGroupRedis()
+    add_trades(client, "trades:btcusdt", 6)
+    worker = make_worker(client, "w1", tmp_path, batch_size=2)
+    worker.ensure_groups()
+    worker._last_claim = float("inf")
+    worker.run_once()
+
+    del client.streams["trades:btcusdt"][:4]
+
+    assert worker.run_once() == 2
+    assert worker.gaps == 1
+    assert len(client.streams["features:btcusdt"]) == 4